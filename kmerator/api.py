@@ -0,0 +1,164 @@
+# api.py
+
+"""
+Python interface of kmerator, to extract specific kmers without the command line.
+
+Results are returned in memory: nothing is written in the output directory and the process
+never exits, so a loaded dataset and a pool of processes can be reused for many requests.
+
+Example:
+    from kmerator import api
+
+    dataset = api.load_dataset('/path/to/datadir', specie='human', release=110)
+    with api.Kmerator(dataset, '/path/to/GRCh38.jf', thread=4) as km:
+        for record in km.selection(['NPM1', 'BRAF']):
+            print(record['mesg'], len(record['kmers']))
+        records = list(km.sequences({'seq1': 'ATCG...'}))
+    results = api.lookup(dataset, ['ACGT...'], '/path/to/GRCh38.jf')     # see lookup.py
+
+Each record is a dict:
+    {'status': 'done' or 'failed',
+     'mesg': message, like in the kmerator report,
+     'item': the gene/transcript/sequence processed,
+     'kmers': [(header, kmer), ...],
+     'contigs': [(header, contig), ...],
+     'masked': [(header, kmer), ...],
+    }
+"""
+
+from argparse import Namespace
+
+import counter
+from dataset import Dataset
+from kmerize import SpecificKmers, choose_executor
+from items import find_items
+import lookup as reverse_lookup
+
+
+def load_dataset(datadir, specie='human', release=None, kmer_length=31, transcriptome=True):
+    """
+    Load a local dataset, the release must be given (no request to Ensembl).
+    Raise FileNotFoundError if the dataset is missing (use 'kmerator --mk-dataset' to build it)
+    """
+    if release is None:
+        raise ValueError("release must be specified")
+    args = Namespace(datadir=datadir, specie=specie, release=str(release), kmer_length=[kmer_length],
+                     list_dataset=False, yes=True, keep=True, debug=False, tmpdir=None)
+    dataset = Dataset(args)
+    if not dataset.dataset_ok:
+        raise FileNotFoundError(f"dataset not found in {datadir!r} for {args.specie!r}, "
+                                f"release {args.release}, k{kmer_length}.")
+    dataset.geneinfo_dict = dataset.load_geneinfo()
+    dataset.transcriptome_dict = dataset.load_transcriptome() if transcriptome else None
+    return dataset
+
+
+def lookup(dataset, kmers, genome=None):
+    """
+    Genes and transcripts containing the kmers, a dict per kmer (see lookup.ReverseLookup), with
+    the lookup index of the dataset. Without genome, specific kmers are found in one gene.
+    Raise FileNotFoundError if the lookup index is missing (use 'kmerator --mk-lookup-index')
+    """
+    kmer_length = dataset.args.kmer_length[0]
+    lookup_idx = dataset.lookup_idx[kmer_length]
+    if not reverse_lookup.is_usable(lookup_idx, kmer_length):
+        raise FileNotFoundError(f"lookup index not found: {lookup_idx!r}.")
+    geneinfo_dict = getattr(dataset, 'geneinfo_dict', None) or dataset.load_geneinfo()
+    reverse = reverse_lookup.ReverseLookup(lookup_idx, geneinfo_dict, genome, dataset.genome_idx[kmer_length])
+    kmers = list(kmers)
+    results = []
+    for i in range(0, len(kmers), reverse_lookup.BATCH_SIZE):
+        results += reverse.lookup(kmers[i:i+reverse_lookup.BATCH_SIZE])
+    return results
+
+
+class Kmerator:
+    """
+    Find specific kmers of genes/transcripts (selection()) or unannotated sequences (sequences())
+
+    methods return generators, records are yielded as soon as they are available.
+    """
+
+    def __init__(self, dataset, genome, thread=1, tmpdir=None, debug=False, executor='auto'):
+        """
+        Class initialiser, raise ValueError if the genome index doesn't match the dataset
+        executor: 'process', 'thread' or 'auto' (threads with jellyfish indexes), threads are
+        rejected with KMC indexes (RuntimeError)
+        """
+        error = counter.check_genome(genome, dataset.args.kmer_length[0], dataset.args.datadir)
+        if error:
+            raise ValueError(error)
+        self.dataset = dataset
+        self.args = dict(vars(dataset.args))
+        self.args.update({'genome': genome, 'thread': thread, 'debug': debug,
+                          'kmer_length': dataset.args.kmer_length[0]})
+        ### sequences and results stay in memory, tmpdir is not used
+        self.args['tmpdir'] = tmpdir
+        self.specific_kmers = SpecificKmers(dataset.transcriptome_dict, dataset.geneinfo_dict, thread,
+                                            choose_executor(executor, [genome, *dataset.transcriptome_jf.values()]))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """ stop workers """
+        self.specific_kmers.close()
+
+
+    def selection(self, selection, stringent=False, isoforms=False):
+        """
+        Yield records of genes/transcripts (symbol, alias, ENSG or ENST)
+        isoforms: for genes, yield records of each transcript, instead of the gene
+        """
+        if self.dataset.transcriptome_dict is None:
+            raise ValueError("transcriptome not loaded, use load_dataset(..., transcriptome=True)")
+        args = dict(self.args, selection=list(selection), fasta_file=None, stringent=stringent,
+                    isoforms=isoforms, chimera=False, max_on_transcriptome=None, max_on_genome=None)
+        report = {'failed': [], 'multiple': []}
+        items = find_items(Namespace(**args), report, self.dataset.geneinfo_dict)
+        yield from self._failed(report['failed'])
+        yield from self._run(args, items)
+
+
+    def sequences(self, sequences, max_on_transcriptome=0, max_on_genome=None, chimera=False, breakpoints=None):
+        """
+        Yield records of unannotated sequences, given as dict {id: sequence}
+        chimera: only the kmers spanning the junctions are queried, at the breakpoints given as
+        dict {id: [position, ...]} (the junction is after the base at position), otherwise the
+        junctions are detected with the transcriptome
+        max_on_genome: 1 by default, 0 with chimera (as '-G/--max-on-genome')
+        """
+        if max_on_genome is None:
+            max_on_genome = 0 if chimera else 1
+        args = dict(self.args, selection=None, fasta_file=True, stringent=False, chimera=chimera,
+                    max_on_transcriptome=max_on_transcriptome, max_on_genome=max_on_genome)
+        items = []
+        failed = []
+        for f_id, seq in sequences.items():
+            seq = seq.upper()
+            if len(seq) >= args['kmer_length']:
+                items.append({'f_id': f_id, 'seq': seq, 'type': 'transcript'})
+                if chimera and breakpoints and breakpoints.get(f_id):
+                    items[-1]['breakpoints'] = list(breakpoints[f_id])
+            else:
+                failed.append(f"{f_id}: sequence to short ({len(seq)} < {args['kmer_length']})")
+        yield from self._failed(failed)
+        yield from self._run(args, items)
+
+
+    def _run(self, args, items):
+        for item, (type, mesg, results) in self.specific_kmers.run(args, items, to_files=False):
+            ### headers of the records are formatted here, in the process of the caller
+            results = results.as_dict() if results else {'kmers': [], 'contigs': [], 'masked': []}
+            yield {'status': type, 'mesg': mesg, 'item': item, **results}
+
+
+    def _failed(self, messages):
+        for mesg in messages:
+            yield {'status': 'failed', 'mesg': mesg, 'item': None, 'kmers': [], 'contigs': [], 'masked': []}
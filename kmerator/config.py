@@ -23,7 +23,7 @@ DEFAULT_CONFIG = """
 # release = last
 
 ## --genome option
-## Path of genome jellyfish index
+## Path of genome jellyfish index (one per kmer length, separated by spaces)
 # genome = /index/jellyfish/GRCh38_with_MT.jf
 
 ## --specie option
@@ -34,8 +34,24 @@ DEFAULT_CONFIG = """
 ## number of thread (default: 1)
 # thread = 1
 
+## --executor option
+## workers of --thread as 'process', 'thread' or 'auto' (threads with jellyfish genome indexes)
+# executor = auto
+
+## --memory option
+## memory budget to build kmer indexes, in GB (default: 4)
+# memory = 4
+
+## --ensembl-url option
+## url of Ensembl, or of a local mirror with the same layout (file:// urls are allowed)
+# ensembl_url = http://ftp.ensembl.org/pub
+
+## --download-cache option
+## directory of downloaded Ensembl files, can be shared by users (default: none)
+# download_cache = /shared/kmerator/downloads
+
 ## --kmer-length option
-## set kmer length (default: 31)
+## set kmer length (default: 31), several lengths are separated by spaces
 # kmer_length = 31
 
 ## --max-on-transcriptome
@@ -46,6 +62,14 @@ DEFAULT_CONFIG = """
 ## Only with --fasta-file option
 # --max-on-genome = 1
 
+## --dedup-kmers
+## Only with --fasta-file option
+# dedup_kmers = False
+
+## --table option
+## also write the kmers as a table: tsv (kmers.tsv.gz) or parquet (kmers.parquet, needs pyarrow)
+# table = tsv
+
 ## --stringent option
 ## Only with --selection option
 # stringent = False
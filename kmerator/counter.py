@@ -0,0 +1,347 @@
+# counter.py
+
+"""
+Kmer count indexes (genome and transcriptome): build them within a memory budget, and query them.
+
+Two backends, the backend of an index is given by the extension of its file:
+  - KMC (.kmc_pre/.kmc_suf): faster, counts by parts on disk within the memory budget.
+    Queries use the KMC python API (py_kmc_api module, built with KMC).
+  - jellyfish (.jf): the hash size is computed from the memory budget (--memory) and the size
+    of the sequences. When the hash is full, jellyfish writes it on disk as a sorted file
+    (option --disk, instead of doubling the hash), and merges the files at the end, so memory
+    usage doesn't depend on the size of the genome.
+Sequences are queried in memory (KMC) or through a pipe (jellyfish), without temporary files.
+Metadata of indexes (kmer length, canonical form) are read from their header, and cached in
+datadir for genome indexes (see index_info()).
+"""
+
+import os
+import sys
+import gzip
+import json
+import math
+import struct
+import hashlib
+import shutil
+import tempfile
+import threading
+import subprocess
+
+from color import *
+
+
+DEFAULT_MEMORY = 4          # memory budget, in GB
+MIN_HASH_BITS = 16
+MAX_COUNT = 4294967295      # KMC counters are 4 bytes
+ACGT = set('ACGT')
+INDEX_CACHE = '.kmerator_indexes.json'      # metadata of genome indexes, cached in datadir
+CHECKSUM_SIZE = 1 << 20                     # checksum of indexes: first and last MB
+
+
+class Jellyfish:
+    name = 'jellyfish'
+    ext = '.jf'
+
+    @staticmethod
+    def available():
+        return bool(shutil.which('jellyfish'))
+
+
+    @staticmethod
+    def header(index):
+        """
+        {'k', 'canonical'} from the json header of the index, preceded by its length in digits
+        (None if not a jellyfish index)
+        """
+        with open(index, 'rb') as fh:
+            head = fh.read(CHECKSUM_SIZE)
+        start = head.find(b'{')
+        if start < 0 or not head[:start].isdigit():
+            return None
+        try:
+            header, _ = json.JSONDecoder().raw_decode(head[start:].decode('ascii', 'replace'))
+            kmer_length = header['key_len'] // 2
+        except (ValueError, KeyError, TypeError):
+            return None
+        ### older versions of jellyfish give the option only in the command line
+        canonical = header.get('canonical', any(opt in ('-C', '--canonical') for opt in header.get('cmdline', [])))
+        return {'k': kmer_length, 'canonical': bool(canonical)}
+
+
+    @staticmethod
+    def hash_size(fasta, kmer_length, memory=DEFAULT_MEMORY):
+        """
+        Size of the jellyfish hash: the largest power of 2 within the memory budget, and not
+        larger than needed by the sequences (number of kmers <= number of bases).
+        An entry of the hash takes about (2k - log2(size) + 16) bits (key, counter and reprobes).
+        """
+        bases = os.path.getsize(fasta) * (4 if fasta.endswith('.gz') else 1)
+        budget = memory * 1024**3 * 8                   # in bits
+        bits = MIN_HASH_BITS
+        while (1 << bits) < bases and (1 << (bits + 1)) * (2 * kmer_length - bits + 15) <= budget:
+            bits += 1
+        return 1 << bits
+
+
+    @classmethod
+    def count(cls, fasta, output, kmer_length, thread=1, memory=DEFAULT_MEMORY, canonical=False, debug=False):
+        """ Build a jellyfish index of a fasta file (gzipped or not) """
+        size = cls.hash_size(fasta, kmer_length, memory)
+        ### --disk: a full hash is written on disk and merged at the end, not doubled in memory
+        cmd = ['jellyfish', 'count', '-t', str(thread), '-m', str(kmer_length), '-s', str(size),
+               '--disk', '-o', output]
+        if canonical:
+            cmd.append('--canonical')
+        if debug: print(f"{DEBUG}Count kmers of {os.path.basename(fasta)!r} with jellyfish (hash size: "
+                        f"{size}, memory: {memory}GB), please wait...{ENDCOL}")
+        if fasta.endswith('.gz'):
+            ### jellyfish reads the uncompressed sequences on stdin
+            with gzip.open(fasta, 'rb') as fh:
+                proc = subprocess.Popen(cmd + ['/dev/stdin'], stdin=subprocess.PIPE)
+                try:
+                    shutil.copyfileobj(fh, proc.stdin, 1 << 20)
+                except BrokenPipeError:
+                    pass
+                finally:
+                    proc.stdin.close()
+                return proc.wait()
+        return subprocess.call(cmd + [fasta])
+
+
+    @staticmethod
+    def counts(index, seqs, canonical=False):
+        """
+        Yield (kmer, count) of all kmers of the sequences, given to 'jellyfish query' on stdin
+        (kmers are given in canonical form by canonical indexes)
+        """
+        cmd = ['jellyfish', 'query', '-s', '/dev/stdin', index]
+        ### stderr goes to a file, a pipe not read while stdout is streamed could block jellyfish
+        with tempfile.TemporaryFile(mode='w+') as err:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=err, text=True)
+            ### sequences are given by a thread, to avoid a deadlock on pipes
+            def feed():
+                try:
+                    for i, seq in enumerate(seqs):
+                        proc.stdin.write(f">{i}\n{seq}\n")
+                except BrokenPipeError:
+                    pass
+                finally:
+                    proc.stdin.close()
+            feeder = threading.Thread(target=feed)
+            feeder.start()
+            for line in proc.stdout:
+                mer, count = line.split()
+                yield mer, int(count)
+            feeder.join()
+            if proc.wait():
+                err.seek(0)
+                raise RuntimeError(f"executing jellyfish:\n"
+                                   f"  {ERROR}command: {ENDCOL}{' '.join(cmd)}\n"
+                                   f"  {ERROR}returned: {ENDCOL}{err.read()}")
+
+
+class Kmc:
+    name = 'kmc'
+    ext = '.kmc_pre'
+    _opened = {}            # {index: KMCFile}, opened once per process
+
+    @staticmethod
+    def available():
+        try:
+            import py_kmc_api
+        except ImportError:
+            return False
+        return bool(shutil.which('kmc'))
+
+
+    @staticmethod
+    def header(index):
+        """
+        {'k', 'canonical'} from the header of the .kmc_pre file (KMC1/2/3 databases), at the end
+        of the file: [header][version (uint32)][header offset (uint32)]['KMCP']
+        (None if not a KMC database)
+        """
+        with open(f"{os.path.splitext(index)[0]}.kmc_pre", 'rb') as fh:
+            try:
+                fh.seek(-12, os.SEEK_END)
+                version, offset, marker = struct.unpack('<II4s', fh.read(12))
+                if marker != b'KMCP':
+                    return None
+                fh.seek(-(offset + 8), os.SEEK_END)
+                ### kmer length, mode, counter size, lut prefix length, [signature length (KMC2+)],
+                ### min count, max count, total kmers (uint64), not canonical (uchar)
+                fields = '<IIII' + ('I' if version == 0x200 else '') + 'IIQB'
+                values = struct.unpack(fields, fh.read(struct.calcsize(fields)))
+            except (OSError, struct.error):
+                return None
+        return {'k': values[0], 'canonical': not values[-1]}
+
+
+    @staticmethod
+    def count(fasta, output, kmer_length, thread=1, memory=DEFAULT_MEMORY, canonical=False, debug=False):
+        """ Build a KMC database of a fasta file (gzipped or not), KMC reads gzipped files itself """
+        prefix = os.path.splitext(output)[0]
+        tmpdir = tempfile.mkdtemp(prefix=".kmerator_", dir=os.path.dirname(output) or '.')
+        cmd = ['kmc', f'-k{kmer_length}', f'-t{thread}', f'-m{max(1, math.ceil(memory))}', '-sm',
+               '-ci1', f'-cs{MAX_COUNT}', '-fm']
+        if not canonical:
+            cmd.append('-b')            # both strands are counted separately
+        cmd += [fasta, prefix, tmpdir]
+        if debug: print(f"{DEBUG}Count kmers of {os.path.basename(fasta)!r} with KMC (memory: {memory}GB), "
+                        f"please wait...{ENDCOL}")
+        try:
+            return subprocess.call(cmd, stdout=subprocess.DEVNULL if not debug else None)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+    @classmethod
+    def counts(cls, index, seqs, canonical=False):
+        """
+        Yield (kmer, count) of all kmers of the sequences (like jellyfish, kmers with other
+        letters than ACGT are skipped). With canonical, kmers are given in canonical form.
+        """
+        try:
+            import py_kmc_api as pka
+        except ImportError:
+            raise RuntimeError(f"the KMC python API (py_kmc_api) is needed to query {index!r}.")
+        if index not in cls._opened:
+            kmc_file = pka.KMCFile()
+            if not kmc_file.OpenForRA(os.path.splitext(index)[0]):
+                raise RuntimeError(f"unable to open KMC database {index!r}.")
+            cls._opened[index] = kmc_file
+        kmc_file = cls._opened[index]
+        kmer_length = kmc_file.Info().kmer_length
+        revcomp = str.maketrans('ACGT', 'TGCA')
+        counters = pka.CountVec()
+        for seq in seqs:
+            kmc_file.GetCountersForRead(seq, counters)
+            for i, count in enumerate(counters.value):
+                mer = seq[i:i+kmer_length]
+                if not ACGT.issuperset(mer):
+                    continue
+                if canonical:
+                    mer = min(mer, mer[::-1].translate(revcomp))
+                yield mer, count
+
+
+### backends, the fastest first
+BACKENDS = (Kmc, Jellyfish)
+
+
+def backend(index):
+    """ backend of an index, according to its extension """
+    return Kmc if index.endswith(Kmc.ext) else Jellyfish
+
+
+def best_backend():
+    """ fastest backend available (jellyfish when none is found) """
+    for bk in BACKENDS:
+        if bk.available():
+            return bk
+    return Jellyfish
+
+
+def index_path(prefix):
+    """ existing index for the prefix, whatever its backend (None if not found) """
+    for bk in BACKENDS:
+        if os.path.isfile(f"{prefix}{bk.ext}"):
+            return f"{prefix}{bk.ext}"
+    return None
+
+
+def index_exists(index):
+    """ KMC databases have two files """
+    if backend(index) is Kmc:
+        return all(os.path.isfile(f"{os.path.splitext(index)[0]}{ext}") for ext in ('.kmc_pre', '.kmc_suf'))
+    return os.path.isfile(index)
+
+
+def checksum(index):
+    """ checksum of the first and last MB of an index (genome indexes are large) """
+    digest = hashlib.sha256()
+    with open(index, 'rb') as fh:
+        digest.update(fh.read(CHECKSUM_SIZE))
+        fh.seek(max(0, os.path.getsize(index) - CHECKSUM_SIZE))
+        digest.update(fh.read(CHECKSUM_SIZE))
+    return digest.hexdigest()
+
+
+def index_info(index, datadir=None):
+    """
+    Metadata of an index: {'backend', 'k', 'canonical', 'size', 'mtime', 'checksum'}, read from
+    its header once, then cached in datadir while the size and mtime of the index are unchanged.
+    None if the header is not readable.
+    """
+    path = os.path.realpath(index)
+    stat = os.stat(path)
+    cache_file = os.path.join(datadir, INDEX_CACHE) if datadir else None
+    cache = {}
+    if cache_file:
+        try:
+            with open(cache_file) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            pass
+        info = cache.get(path)
+        if info and info['size'] == stat.st_size and info['mtime'] == int(stat.st_mtime):
+            return info
+    bk = backend(index)
+    header = bk.header(path)
+    if header is None:
+        return None
+    info = {'backend': bk.name, **header, 'size': stat.st_size, 'mtime': int(stat.st_mtime),
+            'checksum': checksum(path)}
+    if cache_file:
+        cache[path] = info
+        try:
+            temp = f"{cache_file}.{os.getpid()}"
+            with open(temp, 'w') as fh:
+                json.dump(cache, fh, indent=2)
+            os.replace(temp, cache_file)
+        except OSError:
+            pass                    # datadir may be read only
+    return info
+
+
+def check_genome(genome, kmer_length, datadir=None):
+    """ Error message if the genome index is not usable with this kmer length, None if it is """
+    info = index_info(genome, datadir)
+    if info is None:
+        return f"{genome!r} does not appear to be a jellyfish index or a KMC database."
+    if not info['canonical']:
+        return f"the genome index {genome!r} must be built with kmers in canonical form."
+    if info['k'] != kmer_length:
+        return (f"{genome!r} is built with kmers of {info['k']} bases, but the kmer length is "
+                f"{kmer_length} (give one genome index per kmer length, in the same order).")
+    return None
+
+
+def count(fasta, output, kmer_length, thread=1, memory=DEFAULT_MEMORY, canonical=False, debug=False):
+    """
+    Build the index of a fasta file, with the backend given by the output extension.
+    Raise RuntimeError if the backend fails (count() may be run in a thread of the dataset build).
+    """
+    bk = backend(output)
+    returncode = bk.count(fasta, output, kmer_length, thread, memory, canonical, debug)
+    if returncode:
+        raise RuntimeError(f"{bk.name} failed to index {fasta!r} (code {returncode}).")
+
+
+def mk_genome(args):
+    """
+    '--mk-genome': build the genome indexes given by '--genome', one per kmer length,
+    from the fasta file of the genome. The extension gives the backend (.jf or .kmc_pre).
+    """
+    for kmer_length, genome in zip(args.kmer_length, args.genome):
+        if os.path.exists(genome) and not args.yes:
+            ask = input(f"{genome!r} already exists, erase? (Yn): ") or 'y'
+            if ask.lower() != 'y':
+                continue
+        print(f" 🧬 Build genome index {os.path.basename(genome)!r} (k{kmer_length}), please wait...")
+        try:
+            count(args.mk_genome, genome, kmer_length, args.thread, args.memory, canonical=True,
+                  debug=args.debug)
+        except RuntimeError as e:
+            sys.exit(f"{ERROR}Error: {e.args[0]}{ENDCOL}")
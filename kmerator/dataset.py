@@ -21,18 +21,24 @@ Other links:
 import sys
 import os
 import argparse
-import requests
-from bs4 import BeautifulSoup
 import gzip
 import pickle
 import threading
-import subprocess
+import json
+import time
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
 
 import info
+import counter
+import manifest
 from color import *
-from mk_geneinfo import GeneInfoBuilder
-from mk_transcriptome import TranscriptomeBuilder
 import exit
+import fetch
+### modules to request Ensembl (requests, bs4, see fetch.py) and to build datasets (mk_*) are
+### loaded only when needed, so that requests on local datasets start quickly
 
 
 species = {
@@ -46,6 +52,31 @@ species = {
     # "e.coli": "escherichia_coli", # not in Ensembl
 }
 
+CATALOG = '.kmerator_releases.json'      # Ensembl releases cached in datadir
+CATALOG_TTL = 24 * 3600                  # age of the catalog before a new request to Ensembl (seconds)
+
+
+@contextmanager
+def build_lock(datadir, name):
+    """
+    Lock '<datadir>/.<name>.lock' while building a dataset, so that only one kmerator builds it
+    at a time (datadir may be shared by several users, or jobs of a cluster). POSIX locks are
+    used: they work on NFS, and are released if the process dies. Yields True after waiting for
+    another kmerator, which has probably built the dataset.
+    """
+    with open(os.path.join(datadir, f".{name}.lock"), 'a') as fh:
+        waited = False
+        try:
+            fcntl.lockf(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            print(f" 🧬 {name} is being built by another kmerator, waiting for it...")
+            fcntl.lockf(fh, fcntl.LOCK_EX)
+            waited = True
+        try:
+            yield waited
+        finally:
+            fcntl.lockf(fh, fcntl.LOCK_UN)
+
 
 def main():
     """ Function doc """
@@ -59,6 +90,8 @@ def main():
         dataset.remove()
     elif args.mk_dataset:
         dataset.make()
+    elif args.check_dataset:
+        dataset.check()
     elif args.last_avail:
         dataset.last_available()
     elif args.load:
@@ -84,14 +117,17 @@ class Dataset:
     def __init__(self, args):
         """ Class initialiser """
         self.args = args
-        self.base_url = "http://ftp.ensembl.org/pub"
+        self.base_url = (getattr(args, 'ensembl_url', None) or fetch.DEFAULT_URL).rstrip('/')
         self.attended = ['transcriptome.pkl', 'transcriptome.jf', 'geneinfo.pkl', 'report.md']
-        # ~ self.assembly = None
+        self.assembly = None                 # assembly of the local dataset
         self.transcriptome_fa = None         # transcriptome fasta path
         self.transcriptome_pkl = None        # transcriptome pickle path
-        self.transcriptome_jf = None         # transcriptome jellyfish path
+        self.transcriptome_jf = None         # transcriptome jellyfish paths {kmer_length: path}
+        self.genome_idx = None               # projected genome paths {kmer_length: path}
+        self.lookup_idx = None               # lookup index paths {kmer_length: path}
         self.geneinfo_pkl = None             # geneinfo path
         self.report_md = None                # report path
+        self.manifest = None                 # manifest path (see manifest.py)
         self.report = []                     # report
         self.ebl_releases = []               # all releases avalaible on Ensembl
         self.dataset = self.set_dataset_dict()   # {complete: {specie: {release:[k31,...]}},partial:..., other:...}
@@ -99,8 +135,7 @@ class Dataset:
         if self.args.specie.lower() in species:
             self.args.specie =  species[self.args.specie.lower()]
         if self.args.release == 'last' and not self.args.list_dataset:
-            self.args.release = self.get_ebl_current_release()
-            self.get_ebl_releases()
+            self.args.release = self.resolve_last()
         ### check if dataset is locally present and assign variable for each file
         if args.datadir and not self.args.list_dataset:
             self.dataset_ok = self.dataset_here()
@@ -114,13 +149,33 @@ class Dataset:
                    "partial": {},   # set uncomplete, miss some files
                    "other": [],}     # files not part of dataset
         releases = {}
-        
+
+        ### datasets with a manifest: files and kmer lengths are given by the manifest
+        with_manifest = set()       # {(specie, release)}
+        for file in files:
+            if file.endswith(f".{manifest.SUFFIX}"):
+                path = os.path.join(self.args.datadir, file)
+                mf = manifest.load(path)
+                if mf is None:
+                    continue
+                specie = f"{mf['specie']}.{mf['assembly']}"
+                release = int(mf['release'])
+                with_manifest.add((specie, release))
+                if manifest.is_complete(path, mf):
+                    dataset['complete'].setdefault(specie, {})[release] = [f"k{k}" for k in mf['indexes']]
+                else:
+                    dataset['partial'].setdefault(specie, []).append(release)
+
         ### dict of releases found: {<specie>: {<release>:[<file1>, <file2>]} }
         for file in files:
+            if file.startswith('.'):                # hidden files, like the releases catalog
+                continue
             try:
                 file_l = file.split('.')
                 specie = ".".join(file_l[:2])
                 release = int(file_l[2])
+                if (specie, release) in with_manifest:
+                    continue
                 releases.setdefault(specie, {}).setdefault(release, []).append(file)
             except (IndexError, ValueError):
                 dataset["other"].append(file)
@@ -129,6 +184,8 @@ class Dataset:
         for specie in releases:
             for release, file_list in releases[specie].items():
                 founded_items = set(".".join(f.split(".")[-2:]) for f in file_list)
+                if 'transcriptome.kmc_pre' in founded_items:        # transcriptome indexed by KMC
+                    founded_items.add('transcriptome.jf')
                 founded_files = list(map(lambda v: v in founded_items, self.attended))
                 if all(founded_files):
                     dataset['complete'].setdefault(specie, {})[int(release)] = []
@@ -138,20 +195,89 @@ class Dataset:
         ### find for different version of jellyfish indexes of transcriptome
         for specie, rels in dataset['complete'].items():
             for rel in rels:
-                for file in releases[specie][rel]:
-                    if file.endswith('.transcriptome.jf'):
+                for file in releases.get(specie, {}).get(rel, []):      # none with a manifest
+                    if file.endswith(('.transcriptome.jf', '.transcriptome.kmc_pre')):
                         k = file.split('.')[3] if file.split('.')[3].startswith('k') else 'k?'
                         dataset['complete'][specie][rel].append(k)
         
         return dataset
 
 
+    def resolve_last(self):
+        """
+        Release number for 'last':
+          - requests: last local release of the specie, without request to Ensembl
+          - dataset maintenance, or no local dataset: last release on Ensembl, from the catalog
+            cached in datadir, requested again when it is older than CATALOG_TTL
+        With '--offline', Ensembl is never requested.
+        """
+        maintenance = any(getattr(self.args, opt, False)
+                          for opt in ('mk_dataset', 'update_dataset', 'update_last', 'last_avail'))
+        if not maintenance:
+            local_releases = self.get_complete_releases()
+            if local_releases:
+                return str(max(local_releases))
+        catalog = self.load_catalog()
+        offline = getattr(self.args, 'offline', False)
+        if self.args.specie in catalog.get('current', {}):
+            if offline or time.time() - catalog['updated'] < CATALOG_TTL:
+                self.ebl_releases = catalog['releases']
+                return catalog['current'][self.args.specie]
+        if offline:
+            print(f"{ERROR}Error: no local dataset found for {self.args.specie!r}, and no release in "
+                  f"the catalog (--offline).{ENDCOL}")
+            exit.gracefully(self.args)
+        return self.update_catalog(catalog)
+
+
+    def get_complete_releases(self):
+        """ local releases of the specie with all the requested kmer lengths """
+        releases = []
+        for specie, rels in self.dataset['complete'].items():
+            if specie.split('.')[0] == self.args.specie:
+                releases += [rel for rel, ks in rels.items()
+                             if all(f"k{k}" in ks for k in getattr(self.args, 'kmer_length', [31]))]
+        return releases
+
+
+    def load_catalog(self):
+        """
+        catalog of Ensembl releases: {'url': base_url, 'updated': time, 'releases': [...],
+        'current': {specie: release}}, empty if it comes from another mirror (--ensembl-url)
+        """
+        try:
+            with open(os.path.join(self.args.datadir, CATALOG)) as fh:
+                catalog = json.load(fh)
+        except (OSError, ValueError):
+            return {}
+        return catalog if catalog.get('url', fetch.DEFAULT_URL) == self.base_url else {}
+
+
+    def update_catalog(self, catalog=None):
+        """ request Ensembl for the last release of the specie and the releases, and cache them """
+        catalog = catalog or self.load_catalog()
+        release = self.get_ebl_current_release()
+        self.get_ebl_releases()
+        if release:
+            catalog['url'] = self.base_url
+            catalog['updated'] = time.time()
+            catalog['releases'] = sorted(self.ebl_releases)
+            catalog.setdefault('current', {})[self.args.specie] = release
+            try:
+                with open(os.path.join(self.args.datadir, CATALOG), 'w') as fh:
+                    json.dump(catalog, fh)
+            except OSError:
+                pass                    # datadir may be read only
+        return release
+
+
     def get_ebl_current_release(self):
         """get number of last available release on Ensembl"""
+        from bs4 import BeautifulSoup
         url = os.path.join(self.base_url, "current_mysql")
         try:
-            r = requests.get(url)
-        except requests.exceptions.ConnectionError:
+            r = fetch.get(url)
+        except ConnectionError:
             print(f"{YELLOW} Error connecting to Ensembl.{ENDCOL}")
             return None
         if not r.ok:
@@ -169,9 +295,10 @@ class Dataset:
 
     def get_ebl_releases(self):
         """ get avalaible releases on Ensembl, limited to 90 """
+        from bs4 import BeautifulSoup
         try:
-            r = requests.get(self.base_url)
-        except requests.exceptions.ConnectionError:
+            r = fetch.get(self.base_url)
+        except ConnectionError:
             ### If no connection to Ensembl, suggest to use last local Release
             print(f"{YELLOW} Error connecting to Ensembl.{ENDCOL}")
             local_releases = self.get_local_releases()
@@ -262,7 +389,7 @@ class Dataset:
                 if specie.startswith(self.args.specie):
                     assembly = specie.split('.')[1]
                     releases_found = releases.get(int(self.args.release), [])
-                    if f"k{self.args.kmer_length}" in releases_found: 
+                    if all(f"k{k}" in releases_found for k in self.args.kmer_length):
                         return releases_found, assembly, True
             else:
                 return releases_found, assembly, False        
@@ -285,10 +412,15 @@ class Dataset:
             pathbasename = os.path.join(self.args.datadir, basename)
             self.transcriptome_fa = f"{pathbasename}.transcriptome.fa"
             self.transcriptome_pkl = f"{pathbasename}.transcriptome.pkl" 
-            self.transcriptome_jf = f"{pathbasename}.k{self.args.kmer_length}.transcriptome.jf"
+            self.transcriptome_jf = {k: counter.index_path(f"{pathbasename}.k{k}.transcriptome")
+                                     for k in self.args.kmer_length}
+            self.genome_idx = {k: f"{pathbasename}.k{k}.genome.idx" for k in self.args.kmer_length}
+            self.lookup_idx = {k: f"{pathbasename}.k{k}.lookup.idx" for k in self.args.kmer_length}
             self.geneinfo_pkl = f"{pathbasename}.geneinfo.pkl"
             self.report_md = f"{pathbasename}.report.md"
-            
+            self.manifest = f"{pathbasename}.{manifest.SUFFIX}"
+            self.assembly = assembly
+
         return found
 
 
@@ -296,6 +428,7 @@ class Dataset:
         """
         Define the names of the local files for the specified dataset
         """
+        from bs4 import BeautifulSoup
 
         ### Request Ensembl to get info (assembly name, release number, list of releases)
         if not self.ebl_releases:
@@ -306,25 +439,53 @@ class Dataset:
 
         ### Get assembly name
         url = f"{self.base_url}/release-{self.args.release}/fasta/{self.args.specie}/cdna/"
-        r = requests.get(url)
+        r = fetch.get(url)
         if not r.ok:
             print(f"{ERROR} Error: not a valid url: {url!r}.\n check for release ({self.args.release!r}) and specie ({self.args.specie!r}).{ENDCOL}")
             exit.gracefully(self.args)
         soup = BeautifulSoup(r.text, 'lxml')
         self.args.assembly = [a.text.split('.')[1] for a in soup.findAll('a') if a.text.startswith(self.args.specie.capitalize())][0]
 
-        ### Assign files names of dataset
+        self.define_files()
+
+
+    def define_local_dataset(self):
+        """
+        Define the names of the local files when the release is found in datadir with other
+        kmer lengths, and return the missing kmer lengths (empty if the release is not found)
+        """
+        for specie, releases in self.dataset['complete'].items():
+            kmers = releases.get(int(self.args.release))
+            if specie.split('.')[0] != self.args.specie or kmers is None or 'k?' in kmers:
+                continue
+            self.args.assembly = specie.split('.')[1]
+            self.define_files()
+            return [k for k in self.args.kmer_length if f"k{k}" not in kmers]
+        return []
+
+
+    def define_files(self):
+        """ Assign files names of dataset """
         basename = f"{self.args.specie}.{self.args.assembly}.{self.args.release}"
         self.geneinfo_pkl = os.path.join(self.args.datadir, f"{basename}.geneinfo.pkl")
         self.transcriptome_pkl = os.path.join(self.args.datadir, f"{basename}.transcriptome.pkl")
-        self.transcriptome_jf = os.path.join(self.args.datadir, f"{basename}.k{self.args.kmer_length}.transcriptome.jf")
+        ext = counter.best_backend().ext
+        self.transcriptome_jf = {k: os.path.join(self.args.datadir, f"{basename}.k{k}.transcriptome{ext}")
+                                 for k in self.args.kmer_length}
+        self.genome_idx = {k: os.path.join(self.args.datadir, f"{basename}.k{k}.genome.idx")
+                           for k in self.args.kmer_length}
+        self.lookup_idx = {k: os.path.join(self.args.datadir, f"{basename}.k{k}.lookup.idx")
+                           for k in self.args.kmer_length}
         self.report_md = os.path.join(self.args.datadir, f"{basename}.report.md")
+        self.manifest = os.path.join(self.args.datadir, f"{basename}.{manifest.SUFFIX}")
 
 
     def build(self):
         """
         if dataset of this release is not present in the local directory of kmerator (datadir),
         we must build him, downloading some files and rearange them.
+        The dataset is built in a staging directory of datadir, then its files are moved in
+        datadir (the manifest at last), so that other kmerators never see partial files.
         """
         ### Ask user to download files
         valid = 'y' if self.args.yes else input(f"Dataset for release {self.args.release} ({self.args.specie}) not found, install it? (Yn) ")
@@ -337,12 +498,63 @@ class Dataset:
             print(f"{RED}\n Error: write acces denied to datadir ({self.args.datadir}).{ENDCOL}")
             exit.gracefully(self.args)
 
-        ### Define target files
-        if not self.dataset_ok:
-            self.define_dataset()
+        ### Check the tool to index the transcriptome, before downloading anything
+        if not counter.best_backend().available():
+            sys.exit(f"{ERROR}Error: jellyfish or KMC is needed to index the transcriptome, none was found.{ENDCOL}")
+
+        ### only one build of the release in datadir
+        with build_lock(self.args.datadir, f"{self.args.specie}.{self.args.release}") as waited:
+            ### built by another kmerator while waiting
+            if waited or not self.dataset_ok:
+                self.dataset = self.set_dataset_dict()
+                if self.dataset_here():
+                    print(f" 🧬 Dataset {self.args.specie}, release {self.args.release} found.")
+                    return
+
+            ### Define target files, only the missing indexes are built when the release is found
+            missing = []
+            if not self.dataset_ok:
+                missing = self.define_local_dataset()
+                if not missing:
+                    self.define_dataset()
+
+            staging = tempfile.mkdtemp(prefix='.kmerator_build_', dir=self.args.datadir)
+            try:
+                if missing:
+                    self.build_indexes(staging, missing)
+                else:
+                    self.build_files(staging)
+                self.publish(staging)
+            except RuntimeError as e:
+                sys.exit(f"{ERROR}Error: {e.args[0]}{ENDCOL}")
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self.dataset = self.set_dataset_dict()
+
+
+    def build_files(self, staging):
+        """ Build the files of the dataset in the staging directory """
+        from mk_geneinfo import GeneInfoBuilder
+        from mk_transcriptome import TranscriptomeBuilder
+        staged = lambda path: os.path.join(staging, os.path.basename(path))
+        geneinfo_pkl = staged(self.geneinfo_pkl)
+        transcriptome_jf = {k: staged(jf) for k, jf in self.transcriptome_jf.items()}
+        report_md = staged(self.report_md)
 
         ### build kmerator dataset for the specie/release specified (multithreaded)
-        geneinfo = GeneInfoBuilder(self.args, self.base_url, self.geneinfo_pkl, self.report)
+        start = time.time()
+        timings = {}                # build time of each step (seconds)
+        errors = []                 # errors of the threads, raised in the main thread
+        def timed(step, target, *args):
+            step_start = time.time()
+            try:
+                target(*args)
+            except (Exception, SystemExit) as e:
+                errors.append(e)
+                return
+            timings[step] = round(time.time() - step_start, 1)
+
+        geneinfo = GeneInfoBuilder(self.args, self.base_url, geneinfo_pkl, self.report)
         geneinfo.get_meta()         # first step : get meta info
         chr = geneinfo.data['chr']
 
@@ -350,20 +562,65 @@ class Dataset:
         # ~ TranscriptomeBuilder(self.args, self.base_url, self.transcriptome_jf, self.report, chr)
 
         ### build kmerator dataset for the specie/release specified (multithreaded)
-        th1 = threading.Thread(target=TranscriptomeBuilder,
-                               args=(self.args, self.base_url, self.transcriptome_jf, self.report, chr))
-        th2 = threading.Thread(target=geneinfo.build)
+        th1 = threading.Thread(target=timed, args=('transcriptome', TranscriptomeBuilder, self.args,
+                               self.base_url, transcriptome_jf, self.report, chr))
+        th2 = threading.Thread(target=timed, args=('geneinfo', geneinfo.build))
         th1.start()
         th2.start()
         th1.join()
         th2.join()
-        
+        ### an exit in a thread only ends the thread, the build stops here
+        if errors:
+            raise errors[0]
+        timings['total'] = round(time.time() - start, 1)
 
         ### write report
-        with open(self.report_md, 'w') as fh:
+        with open(report_md, 'w') as fh:
             fh.write(f"# Kmerator files for {self.args.specie}, release {self.args.release}\n")
             fh.write('\n'.join(self.report))
 
+        ### write manifest
+        manifest.write(staged(self.manifest), self.args.specie, self.args.assembly, self.args.release,
+                       [geneinfo_pkl, staged(self.transcriptome_pkl), report_md], transcriptome_jf,
+                       timings, self.args.thread, previous=self.manifest)
+
+
+    def build_indexes(self, staging, kmer_lengths):
+        """
+        Build in the staging directory the transcriptome indexes of the kmer lengths missing in
+        the release, from its transcriptome, and update the manifest
+        """
+        staged = lambda path: os.path.join(staging, os.path.basename(path))
+        transcriptome_jf = {k: staged(self.transcriptome_jf[k]) for k in kmer_lengths}
+        print(f" 🧬 Build transcriptome index for {', '.join(f'k{k}' for k in kmer_lengths)}, please wait...")
+        ### the fasta file is built from the transcriptome pickle file, outside staging
+        transcriptome_fa = os.path.join(tempfile.mkdtemp(prefix='kmerator_', dir=staging), 'transcriptome.fa')
+        with open(self.transcriptome_pkl, 'rb') as fic:
+            transcriptome_dict = pickle.load(fic)
+        with open(transcriptome_fa, 'w') as fh:
+            for transcript, seq in transcriptome_dict.items():
+                fh.write(f">{transcript}\n{seq}\n")
+        del transcriptome_dict
+        timings = {}
+        for kmer_length, index in transcriptome_jf.items():
+            start = time.time()
+            counter.count(transcriptome_fa, index, kmer_length, self.args.thread, self.args.memory,
+                          debug=self.args.debug)
+            timings[f"k{kmer_length}"] = round(time.time() - start, 1)
+        shutil.rmtree(os.path.dirname(transcriptome_fa), ignore_errors=True)
+
+        ### datasets built by older versions of kmerator have no manifest, their indexes are found by name
+        if manifest.load(self.manifest) is not None:
+            manifest.write(staged(self.manifest), self.args.specie, self.args.assembly, self.args.release,
+                           [], transcriptome_jf, timings, self.args.thread, previous=self.manifest)
+
+
+    def publish(self, staging):
+        """ Move the files of the staging directory in datadir, the manifest at last """
+        files = sorted(next(os.walk(staging))[2], key=lambda file: file.endswith(manifest.SUFFIX))
+        for file in files:
+            os.replace(os.path.join(staging, file), os.path.join(self.args.datadir, file))
+
 
     def list(self):
         """ List local releases """
@@ -420,7 +677,7 @@ class Dataset:
                 specie, assembly, release = l_file[:3]
                 if self.args.specie == specie and self.args.release == release:
                     release_files.append(file)
-                    if l_file[-1] == 'jf' and l_file[-2] == 'transcriptome':
+                    if l_file[-1] in ('jf', 'kmc_pre', 'kmc_suf', 'idx') and l_file[-2] in ('transcriptome', 'genome', 'lookup'):
                         jellyfish_files.append(file)
             except ValueError:
                 continue
@@ -428,16 +685,16 @@ class Dataset:
         if not release_files:
             print(f"Dataset not found for {self.args.specie!r}, release {self.args.release!r}.")
             exit.gracefully(self.args)
-        ### if multiple jellyfish for the release, remove only the transcriptome file
-        if len(jellyfish_files) > 1:
+        ### if multiple jellyfish for the release, remove only the transcriptome file (and projected genome, lookup index)
+        if len([f for f in jellyfish_files if f.endswith(('.jf', '.kmc_pre'))]) > 1:
+            release_files = []
             for file in jellyfish_files:
                 k = file.split('.')[3]
                 if k.startswith('k'):
-                    if int(k[1:]) == self.args.kmer_length:
-                        release_files = [file]
-                        break
+                    if int(k[1:]) in self.args.kmer_length:
+                        release_files.append(file)
                 elif k == 'transcriptome':
-                    release_files = [file]
+                    release_files.append(file)
 
         ### if not files to delete
         if not release_files:
@@ -454,6 +711,10 @@ class Dataset:
         if not resp.lower() == 'n':
             for file in release_files:
                 os.remove(os.path.join(self.args.datadir, file))
+            ### some kmer lengths removed: update the manifest
+            for file in next(os.walk(self.args.datadir))[2]:
+                if file.startswith(f"{self.args.specie}.") and file.endswith(f".{self.args.release}.{manifest.SUFFIX}"):
+                    manifest.remove_files(os.path.join(self.args.datadir, file), release_files)
         else:
             print("\nAborted by user.  ")
         exit.gracefully(self.args)
@@ -473,11 +734,92 @@ class Dataset:
         exit.gracefully(self.args)
 
 
+    def make_genome_index(self):
+        """
+        Build the projected genome of each kmer length: counts in the genome index (--genome)
+        of the transcriptome kmers only. Used instead of the genome index with '--selection'.
+        """
+        from mk_genome import ProjectedGenomeBuilder
+        from genome import genome_stamp
+        if not self.dataset_ok:
+            print(f"{ERROR}Error: dataset not found for {self.args.specie!r}, release {self.args.release}, "
+                  f"{', '.join(f'k{k}' for k in self.args.kmer_length)} (see --mk-dataset).{ENDCOL}")
+            exit.gracefully(self.args)
+        transcriptome_dict = self.load_transcriptome()
+        ### the manifest is updated by one kmerator at a time
+        with build_lock(self.args.datadir, f"{self.args.specie}.{self.args.release}"):
+            for kmer_length, genome in zip(self.args.kmer_length, self.args.genome):
+                print(f" 🧬 Build projected genome of {os.path.basename(genome)!r} for k{kmer_length}, please wait...")
+                ProjectedGenomeBuilder(self.args, transcriptome_dict, genome, kmer_length, self.genome_idx[kmer_length])
+                manifest.add_genome_index(self.manifest, kmer_length, self.genome_idx[kmer_length],
+                                          genome_stamp(genome))
+        exit.gracefully(self.args)
+
+
+    def make_lookup_index(self):
+        """
+        Build the lookup index of each kmer length: transcripts containing each kmer of the
+        transcriptome, used by '--lookup'.
+        """
+        from mk_lookup import LookupIndexBuilder
+        if not self.dataset_ok:
+            print(f"{ERROR}Error: dataset not found for {self.args.specie!r}, release {self.args.release}, "
+                  f"{', '.join(f'k{k}' for k in self.args.kmer_length)} (see --mk-dataset).{ENDCOL}")
+            exit.gracefully(self.args)
+        transcriptome_dict = self.load_transcriptome()
+        ### the manifest is updated by one kmerator at a time
+        with build_lock(self.args.datadir, f"{self.args.specie}.{self.args.release}"):
+            for kmer_length in self.args.kmer_length:
+                print(f" 🧬 Build lookup index of the transcriptome for k{kmer_length}, please wait...")
+                LookupIndexBuilder(self.args, transcriptome_dict, kmer_length, self.lookup_idx[kmer_length])
+                manifest.add_lookup_index(self.manifest, kmer_length, self.lookup_idx[kmer_length])
+        exit.gracefully(self.args)
+
+
+    def check(self):
+        """
+        Check sizes and checksums of the dataset files, with the manifest. Datasets built by
+        older versions of kmerator have no manifest, it is written from the current files.
+        """
+        if not self.dataset_ok:
+            ### incomplete dataset: it can be checked only with its manifest
+            for file in next(os.walk(self.args.datadir))[2]:
+                if file.startswith(f"{self.args.specie}.") and file.endswith(f".{self.args.release}.{manifest.SUFFIX}"):
+                    self.manifest = os.path.join(self.args.datadir, file)
+                    break
+            else:
+                sys.exit(f"{ERROR}Error: dataset not found for {self.args.specie!r}, release {self.args.release}.{ENDCOL}")
+        elif manifest.load(self.manifest) is None:
+            print(f" 🧬 No manifest found, write it from the dataset files.")
+            basename = self.manifest[:-len(manifest.SUFFIX)-1]
+            releases = self.dataset['complete'][f"{self.args.specie}.{self.assembly}"][int(self.args.release)]
+            indexes = {int(k[1:]): counter.index_path(f"{basename}.{k}.transcriptome") for k in releases}
+            manifest.write(self.manifest, self.args.specie, self.assembly, self.args.release,
+                           [self.geneinfo_pkl, self.transcriptome_pkl, self.report_md], indexes,
+                           thread=self.args.thread)
+            ### projected genomes already built
+            from genome import read_header
+            for k in indexes:
+                header = read_header(f"{basename}.k{k}.genome.idx")
+                if header and header['k'] == k:
+                    manifest.add_genome_index(self.manifest, k, f"{basename}.k{k}.genome.idx", header['genome'])
+            ### lookup indexes already built
+            import lookup
+            for k in indexes:
+                if lookup.is_usable(f"{basename}.k{k}.lookup.idx", k):
+                    manifest.add_lookup_index(self.manifest, k, f"{basename}.k{k}.lookup.idx")
+        errors = manifest.verify(self.manifest, self.args.thread)
+        if errors:
+            print(f"{ERROR}Dataset {os.path.basename(self.manifest)[:-len(manifest.SUFFIX)-1]} is corrupted:{ENDCOL}")
+            print(*[f"  - {error}" for error in errors], sep='\n')
+            sys.exit(1)
+        print(f" 🧬 Dataset {self.args.specie}, release {self.args.release}: all files are valid.")
+        exit.gracefully(self.args)
+
+
     def update_last(self):
         """ Function doc """
-        if not self.ebl_releases:
-            self.get_ebl_releases()
-        self.args.release = self.get_ebl_current_release()
+        self.args.release = self.update_catalog()
 
         if not self.dataset_here():
             ask = 'y'
@@ -505,27 +847,22 @@ class Dataset:
         rename_jf aims to rename file, adding kmer size in the name, according the 2.3.0 version
         """
         files = next(os.walk(self.args.datadir))[2]
-        ### get k value
-        get_k = lambda res,i: res[i + 1] 
-        # ~ print(files)
         for file in files:
-            if file.endswith(".transcriptome.jf"):
-                file_l = file.split(".")
-                k_expected = file_l[3]
-                if len(file_l) == 5 and k_expected == "transcriptome":
-                    ### jellyfish keep the command line used to build the jf file.
-                    cmd_get = f"jellyfish info {os.path.join(self.args.datadir, file)} | head -1"
-                    res = subprocess.check_output(cmd_get, shell=True, text=True).split(' ')
-                    for opt in ('-m', '--mer-len'):
-                        k = f"k{get_k(res, res.index(opt))}"
-                        break
-                    file_l.insert(3, k)
-                    new_name = '.'.join(file_l)
-                    cmd_set = f"mv {os.path.join(self.args.datadir, file)} {os.path.join(self.args.datadir, new_name)}"
+            file_l = file.split(".")
+            if len(file_l) == 5 and file_l[3] == "transcriptome" and file_l[4] in ('jf', 'kmc_pre'):
+                ### the kmer length is given by the header of the index
+                index = os.path.join(self.args.datadir, file)
+                index_info = counter.index_info(index)
+                if index_info is None:
+                    sys.exit(f"{ERROR}Error: kmer length of {file!r} not found, the index may be corrupted.{ENDCOL}")
+                file_l.insert(3, f"k{index_info['k']}")
+                new_index = os.path.join(self.args.datadir, '.'.join(file_l))
+                ### KMC databases have two files
+                for old_file, new_file in zip(manifest.index_files(index), manifest.index_files(new_index)):
                     try:
-                        subprocess.check_output(cmd_set, shell=True)
-                    except Exception as e:
-                        sys.exit(e)
+                        os.rename(old_file, new_file)
+                    except OSError as e:
+                        sys.exit(f"{ERROR}Error: {e}{ENDCOL}")
         self.dataset = self.set_dataset_dict()          
 
 
@@ -559,6 +896,17 @@ def usage():
                         action="store_true",
                         help="list local releases",
                        )
+    parser.add_argument('--offline',
+                        action="store_true",
+                        help="never request Ensembl, 'last' is the last local or cached release",
+                       )
+    parser.add_argument('--ensembl-url',
+                        help=f"url of Ensembl, or of a mirror with the same layout, file:// urls are allowed (default: {fetch.DEFAULT_URL})",
+                        default=fetch.DEFAULT_URL,
+                       )
+    parser.add_argument('--download-cache',
+                        help="directory of downloaded Ensembl files, shared by kmerators (default: none)",
+                       )
     parser.add_argument('--debug',
                         action="store_true",
                         help="Show more",
@@ -575,6 +923,10 @@ def usage():
                         action="store_true",
                         help="remove a dataset, according with --specie and --release options",
                        )
+    parser.add_argument('--check-dataset',
+                        action="store_true",
+                        help="check sizes and checksums of the files of a dataset, according with --specie and --release options",
+                       )
     parser.add_argument('--mk-dataset',
                         action="store_true",
                         help="make a dataset, according with --specie and --release options",
@@ -584,14 +936,20 @@ def usage():
                         help="thread number (default: 1)",
                         default=1,
                        )
+    parser.add_argument('-M', '--memory',
+                        type=float,
+                        help="memory budget to build kmer indexes, in GB (default: 4)",
+                        default=4,
+                       )
     parser.add_argument('-u', '--update-last',
                         action="store_true",
                         help="builds a new dataset if a new version is found on Ensembl",
                        )
     parser.add_argument('-k', '--kmer-length',
                         type=int,
+                        nargs='+',
                         help="kmer length (default: 31)",
-                        default=31,
+                        default=[31],
                        )
     exclusive.add_argument('--last-avail', '--last-available',
                         action='store_true',
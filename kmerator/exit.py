@@ -5,8 +5,8 @@ from color import *
 
 
 def gracefully(args):
-    ### quit properly
-    if not args.keep:
+    ### quit properly, the work of a request with '--resume' is kept
+    if not args.keep and not getattr(args, 'resume', False):
         try:
             shutil.rmtree(args.tmpdir, ignore_errors=True)
         except:
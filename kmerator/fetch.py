@@ -0,0 +1,145 @@
+# fetch.py
+
+"""
+Get files of Ensembl, or of a mirror with the same layout (--ensembl-url):
+  - http(s):// urls are requested with requests
+  - file:// urls are read on disk, directories are listed as html links, like the Ensembl ftp site
+Files of a release never change: with a download cache (--download-cache), the gzipped files
+are downloaded once, and shared by all users of the cache. The cache directory must be writable
+by them: the directories created in it are group-writable and setgid (new files keep the group
+of the cache), the files are group-writable.
+"""
+
+import os
+import tempfile
+from urllib.parse import urlparse, unquote
+
+
+DEFAULT_URL = "http://ftp.ensembl.org/pub"
+CACHED = ('.gz',)               # extensions of files kept in the download cache
+CHUNK_SIZE = 1 << 20
+DIR_MODE = 0o2775               # modes of the directories and files of the download cache
+FILE_MODE = 0o664
+
+
+class Response:
+    """ Response of a file:// url or of the cache, with the attributes of requests responses used by kmerator """
+
+    def __init__(self, url, content=b'', status_code=200):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise OSError(f"{self.status_code} error for url {self.url!r}")
+
+
+def local_path(url):
+    """ path of a file:// url, None for other urls """
+    parsed = urlparse(url)
+    return unquote(parsed.path) if parsed.scheme == 'file' else None
+
+
+def listing(path):
+    """ html list of a directory, directories end with '/' like on the Ensembl ftp site """
+    links = []
+    for name in sorted(os.listdir(path)):
+        if os.path.isdir(os.path.join(path, name)):
+            name += '/'
+        links.append(f'<a href="{name}">{name}</a>')
+    return f"<html><body><pre>\n{chr(10).join(links)}\n</pre></body></html>\n".encode()
+
+
+def http_get(url, **kwargs):
+    """ requests.get(), connection errors are raised as ConnectionError """
+    import requests
+    try:
+        return requests.get(url, **kwargs)
+    except requests.exceptions.ConnectionError as e:
+        raise ConnectionError(f"unable to connect to {url!r}.") from e
+
+
+def makedirs(path):
+    """ missing directories of the path, with DIR_MODE (whatever the umask) """
+    if os.path.isdir(path):
+        return
+    makedirs(os.path.dirname(path))
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        return
+    os.chmod(path, DIR_MODE)
+
+
+def cached(url, cache):
+    """
+    Path of the url in the cache ('<cache>/<host>/<path>'), downloaded if missing.
+    Returns the response instead when the download fails.
+    """
+    parsed = urlparse(url)
+    path = os.path.join(cache, parsed.netloc, unquote(parsed.path).lstrip('/'))
+    if os.path.isfile(path):
+        return path
+    r = http_get(url, stream=True)
+    if not r.ok:
+        return r
+    ### other kmerators may download the same file: written apart, then moved
+    makedirs(os.path.dirname(path))
+    fd, temp = tempfile.mkstemp(prefix='.', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                fh.write(chunk)
+        os.chmod(temp, FILE_MODE)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return path
+
+
+def get(url, cache=None, **kwargs):
+    """ Response of the url, like requests.get() (file:// urls are supported) """
+    path = local_path(url)
+    if path is None and cache and url.endswith(CACHED):
+        path = cached(url, cache)
+        if not isinstance(path, str):
+            return path
+    if path is None:
+        return http_get(url, **kwargs)
+    if os.path.isdir(path):
+        return Response(url, listing(path))
+    try:
+        with open(path, 'rb') as fh:
+            return Response(url, fh.read())
+    except OSError:
+        return Response(url, status_code=404)
+
+
+def download(url, path, cache=None):
+    """
+    Download the url as path. Local files (file:// url or cache) are not copied, path is
+    a symbolic link to them.
+    """
+    source = local_path(url)
+    if source is None and cache and url.endswith(CACHED):
+        source = cached(url, cache)
+        if not isinstance(source, str):
+            source.raise_for_status()
+    if source is not None:
+        if not os.path.isfile(source):
+            raise FileNotFoundError(f"{url!r} not found.")
+        os.symlink(os.path.abspath(source), path)
+        return path
+    r = http_get(url, stream=True)
+    r.raise_for_status()
+    with open(path, 'wb') as fh:
+        for chunk in r.iter_content(CHUNK_SIZE):
+            fh.write(chunk)
+    return path
@@ -9,6 +9,7 @@ examples:
 
 import sys
 import os
+import shutil
 import pickle
 
 ### Local modules
@@ -137,7 +138,7 @@ def output(args, geneinfo_dict, info, not_found, transcriptome_dict):
 
 def _text_format(marg:int, key:str , text:str, pos_key='left'):
     """ Function doc """
-    size = os.get_terminal_size(2)[0] - marg                        # text chunks size
+    size = shutil.get_terminal_size()[0] - marg                     # text chunks size (80 columns without terminal)
     ltext = [text[i:i+size] for i in range(0, len(text), size)]     # chunks
     smarg = '\n' + marg * ' '                                       # delimiter for chunks
 
@@ -0,0 +1,137 @@
+# genome.py
+
+"""
+Projected genome: counts of the genome, restricted to the kmers of the transcriptome.
+
+The file (built by mk_genome.py) is memory-mapped, so it is loaded instantly and shared by all
+processes. With '--selection', sequences come from the transcriptome, so all their kmers are in
+the projected genome, and it replaces the jellyfish index of the genome.
+
+File format (native byte order):
+  - magic number: b'KMERATOR'
+  - header size (uint32) and json header, padded to 8 bytes:
+      {'version', 'k', 'n', 'cap', 'genome': {'path', 'size', 'mtime'}}
+  - n kmers, 2-bit encoded canonical kmers (A:0, C:1, G:2, T:3), sorted (uint64)
+  - n counts in the genome, capped to 'cap' (uint8)
+"""
+
+import os
+import json
+import mmap
+import struct
+from bisect import bisect_left
+
+MAGIC = b'KMERATOR'
+VERSION = 1
+CAP = 255
+_loaded = {}                # {path: ProjectedGenome}, opened once per process
+_ENCODE = str.maketrans('ACGT', '0123')
+_REVCOMP = str.maketrans('ACGT', 'TGCA')
+
+
+def numpy():
+    """
+    numpy module if available, else None: the projected genome and the lookup index are built,
+    and kmers are searched, by arrays instead of one kmer at a time
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def encode(mer):
+    """ 2-bit encoding of a kmer, None if the kmer contains other letters than ACGT """
+    try:
+        return int(mer.translate(_ENCODE), 4)
+    except ValueError:
+        return None
+
+
+def canonical(mer):
+    revcomp = mer[::-1].translate(_REVCOMP)
+    return min(mer, revcomp)
+
+
+def genome_stamp(genome):
+    """ identity of the genome index, to check if a projected genome is up to date """
+    stat = os.stat(genome)
+    return {'path': os.path.abspath(genome), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def read_header(path):
+    """ return header of a projected genome file, None if the file is not valid """
+    try:
+        with open(path, 'rb') as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                return None
+            size, = struct.unpack('I', fh.read(4))
+            return json.loads(fh.read(size))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def is_usable(path, genome, kmer_length):
+    """ True if the projected genome file is built from this genome index, with this kmer length """
+    header = read_header(path)
+    if not header or header['version'] != VERSION or header['k'] != kmer_length:
+        return False
+    try:
+        return header['genome'] == genome_stamp(genome)
+    except OSError:
+        return False
+
+
+def load(path):
+    """ projected genome of this file, opened at the first call """
+    if path not in _loaded:
+        _loaded[path] = ProjectedGenome(path)
+    return _loaded[path]
+
+
+class ProjectedGenome:
+    """
+    Read only access to a projected genome file
+      - get(mer): count of a canonical kmer in the genome (None if not found)
+      - counts(seqs): {canonical kmer: count} for all kmers of the sequences
+    """
+
+    def __init__(self, path):
+        """ Class initialiser """
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        size, = struct.unpack_from('I', self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.mm[start:start+size])
+        self.k = self.header['k']
+        n = self.header['n']
+        offset = start + size + (-(start + size) % 8)
+        view = memoryview(self.mm)
+        self.keys = view[offset:offset+8*n].cast('Q')
+        self.values = view[offset+8*n:offset+9*n]
+
+
+    def get(self, mer):
+        code = encode(mer)
+        if code is None:
+            return None
+        i = bisect_left(self.keys, code)
+        if i < len(self.keys) and self.keys[i] == code:
+            return self.values[i]
+        return None
+
+
+    def counts(self, seqs):
+        """ {canonical kmer: count in genome} of all kmers of the sequences """
+        k = self.k
+        counts = {}
+        for seq in seqs:
+            for i in range(len(seq) - k + 1):
+                mer = canonical(seq[i:i+k])
+                if mer not in counts:
+                    count = self.get(mer)
+                    if count is not None:
+                        counts[mer] = count
+        return counts
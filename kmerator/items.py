@@ -0,0 +1,168 @@
+# items.py
+
+"""
+Define the items to process (genes, transcripts or unannotated sequences), from the
+'--selection' or '--fasta-file' options.
+"""
+
+import io
+import re
+import sys
+import gzip
+
+from color import *
+
+
+GZIP_MAGIC = b'\x1f\x8b'             # gzip, and bgzip (concatenated gzip blocks)
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+BREAKPOINT = re.compile(r'\bbreakpoints?=(\d+(?:,\d+)*)')    # '--chimera': junctions given in fasta headers
+
+
+def find_items(args, report, geneinfo_dict=None):
+    """
+    for each name given (symbol/alias/ENSG/ENST), get information from geneinfo_dict
+    """
+    items = []
+    ### With '--selection' option
+    if args.selection:
+        for given in args.selection:
+            found_count = 0
+            found_transcripts = []
+            item = given.upper()
+
+            if item in geneinfo_dict['symbol']:
+                ENSGs = geneinfo_dict['symbol'][item]
+                for ENSG in ENSGs:
+                    found_count += 1
+                    found_transcripts.append(geneinfo_dict['gene'][ENSG]['canonical'])
+                    items.append({'given': given, 'ENSG': ENSG, 'type': 'symbol',
+                                       'ENST':   geneinfo_dict['gene'][ENSG]['canonical'],
+                                       'symbol': geneinfo_dict['gene'][ENSG]['symbol'],
+                                       })
+            elif item in geneinfo_dict['alias']:
+                ENSGs = geneinfo_dict['alias'][item]
+                for ENSG in ENSGs:
+                    found_count += 1
+                    found_transcripts.append(geneinfo_dict['gene'][ENSG]['canonical'])
+                    items.append({'given':  given, 'ENSG': ENSG, 'type': 'alias',
+                                        'ENST':   geneinfo_dict['gene'][ENSG]['canonical'],
+                                        'symbol': geneinfo_dict['gene'][ENSG]['symbol'],
+                                        })
+            elif item in geneinfo_dict['gene']:
+                found_count += 1
+                ENSG = item
+                items.append({'given':  given, 'ENSG': ENSG, 'type': 'gene',
+                                    'ENST':   geneinfo_dict['gene'][ENSG]['canonical'],
+                                    'symbol': geneinfo_dict['gene'][ENSG].get('symbol', 'N/A'),
+                                    })
+            elif item in geneinfo_dict['transcript']:
+                found_count += 1
+                ENSG = geneinfo_dict['transcript'][item]
+                items.append({'given':  given, 'ENST': item, 'type': 'transcript',
+                                    'ENSG':   ENSG,
+                                    'symbol': geneinfo_dict['gene'][ENSG].get('symbol', 'N/A'),
+                                    })
+            else:
+                report['failed'].append(f"{given}: not found in transcriptome")
+
+            if found_count > 1:
+                report['multiple'].append(f"{given}: {found_count} ({', '.join([i for i in found_transcripts])})")
+
+        ### With '--isoforms' option, genes are replaced by each of their transcripts
+        if getattr(args, 'isoforms', False):
+            items = [dict(item, ENST=ENST, type='transcript')
+                     for item in items
+                     for ENST in (geneinfo_dict['gene'][item['ENSG']]['transcript']
+                                  if item['type'] != 'transcript' else [item['ENST']])]
+
+
+    ### With '--fasta-file' option
+    if args.fasta_file:
+        items += read_fasta(args.fasta_file, min(args.kmer_length), report)
+
+    return items
+
+
+def item_key(item):
+    """ identifier of an item, the same in every run of the request (and in the worker copies) """
+    return item.get('given'), item.get('ENST'), item.get('f_id'), item['type']
+
+
+def group_key(item, chimera=False):
+    """
+    Items with the same key are processed by the same task: by gene with '--selection', by
+    sequence with '--fasta-file' (and by breakpoints with '--chimera')
+    """
+    if 'ENSG' in item:
+        return item['ENSG']
+    if chimera:
+        return item['seq'], tuple(item.get('breakpoints') or ())
+    return item['seq']
+
+
+def open_fasta(path):
+    """
+    Text stream of a fasta file, or of stdin when path is '-'. The compression is given by the
+    first bytes: gzip/bgzip, zstd (with the 'zstandard' module) or none. Compressed files are
+    read as a stream, without uncompressed copy.
+    """
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    magic = raw.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+    if magic.startswith(GZIP_MAGIC):
+        raw = gzip.GzipFile(fileobj=raw)
+    elif magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit(f"{ERROR}Error: the 'zstandard' module is needed to read {path!r} "
+                     f"(pip install zstandard).{ENDCOL}")
+        raw = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    return io.TextIOWrapper(raw)
+
+
+def read_fasta(path, kmer_length, report):
+    """
+    Items of a fasta file ('-' for stdin), in a single pass. Sequence identifiers must be
+    unique, sequences shorter than kmer_length are reported as failed. Sequences are given in
+    upper case (soft-masked bases are queried as the others).
+    Breakpoints of chimeras may be given in the headers: '>id breakpoint=120,385' (the junction
+    is after the base at this position, from 1).
+    """
+    items = []
+    f_ids = set()
+
+    def add(f_id, seq, breakpoints):
+        seq = ''.join(seq).upper()
+        if len(seq) >= kmer_length:
+            item = {'f_id': f_id, 'seq': seq, 'type': 'transcript'}
+            if breakpoints:
+                item['breakpoints'] = breakpoints
+            items.append(item)
+        else:
+            report['failed'].append(f"{f_id}: sequence to short ({len(seq)} < {kmer_length})")
+
+    with open_fasta(path) as fh:
+        f_id = None
+        seq = []
+        breakpoints = None
+        for nb, raw in enumerate(fh, 1):
+            if raw.startswith('>'):
+                if f_id is not None:
+                    add(f_id, seq, breakpoints)
+                f_id = raw[1:].split(' ')[0].rstrip()
+                found = BREAKPOINT.search(raw)
+                breakpoints = [int(pos) for pos in found.group(1).split(',')] if found else None
+                if f_id in f_ids:
+                    sys.exit(f"{ERROR}ErrorFastaFile: sequence identifier must be unique.\n"
+                             f"    '>{f_id}' is not unique (line {nb}).{ENDCOL}")
+                f_ids.add(f_id)
+                seq = []
+            elif f_id is not None:
+                seq.append(raw.rstrip())
+            elif raw.strip():
+                break
+        ### last f_id/sequence
+        if f_id is None:
+            sys.exit(f"{ERROR}Error: {path!r} does not appear to be a fasta file.{ENDCOL}")
+        add(f_id, seq, breakpoints)
+    return items
@@ -0,0 +1,91 @@
+# jobs.py
+
+"""
+Batch mode: run several requests from a jobs file, sharing datasets and processes.
+
+  kmerator --jobs jobs.txt -t 16
+
+jobs.txt contains one request per line, with its own options (comments: '#'):
+  -s npm1 braf -o output_npm1_braf
+  -s genes.txt --stringent -o output_stringent
+  -f contigs.fa -G 2 -o output_contigs
+
+Options of the command line (here '-t 16') apply to all requests. Items of all requests
+using the same dataset are processed by the same pool of processes. '--shard', '--merge-shards',
+'--resume' and '--server' are not available in batch mode.
+"""
+
+import sys
+import shlex
+import shutil
+
+from options import usage
+from request import (LoadedDatasets, merged_results, markdown_report, show_report,
+                     split_kmer_lengths, kmer_length_mesg)
+from items import find_items
+from color import *
+import exit
+
+
+UNSUPPORTED = ('--shard', '--merge-shards', '--resume', '--server')     # options not available in batch mode
+
+
+def run_jobs(conf, args):
+    """ Run all requests of the jobs file """
+    jobs = get_jobs(conf, args)
+    reports = [{'failed': [], 'done': [], 'multiple': [], 'warning': []} for _ in jobs]
+
+    try:
+        with LoadedDatasets(args.thread, args.executor) as datasets:
+            ### Find items of each request, grouped by dataset
+            print(f" 🧬 Load datasets and find items of {len(jobs)} requests.")
+            groups = {}         # {dataset: (specific_kmers, [(job index, args of kmer length, items), ...])}
+            for i, job_args in enumerate(jobs):
+                _, geneinfo_dict, specific_kmers = datasets.get(job_args)
+                items = find_items(job_args, reports[i], geneinfo_dict)
+                for k_args in split_kmer_lengths(job_args):
+                    groups.setdefault(id(specific_kmers), (specific_kmers, []))[1].append((i, k_args, items))
+
+            ### get specific kmers, items of all requests are mixed in the pool
+            print(f" 🧬 Extract specific kmers, please wait..")
+            for specific_kmers, group in groups.values():
+                requests = [(k_args, items) for _, k_args, items in group]
+                for j, _, (type, mesg, _) in specific_kmers.run_jobs(requests):
+                    i, k_args, _ = group[j]
+                    reports[i][type].append(kmer_length_mesg(jobs[i], k_args, mesg))
+    except (KeyError, RuntimeError, FileNotFoundError) as e:
+        for job_args in jobs:
+            shutil.rmtree(job_args.tmpdir, ignore_errors=True)
+        sys.exit(f"{RED}Error: {e.args[0]}")
+
+    ### Concatene results and write reports of each request
+    print(f" 🧬 Build finals results and reports")
+    for job_args, report in zip(jobs, reports):
+        for k_args in split_kmer_lengths(job_args):
+            merged_results(k_args)
+        markdown_report(job_args, report)
+        if not job_args.keep:
+            shutil.rmtree(job_args.tmpdir, ignore_errors=True)
+    for i, (job_args, report) in enumerate(zip(jobs, reports)):
+        print(f"{YELLOW}\n Request {i+1}: {job_args.output}{ENDCOL}", end='')
+        show_report(job_args, report)
+
+    exit.gracefully(args)
+
+
+def get_jobs(conf, args):
+    """ Parse each line of the jobs file, with options of the command line (args) """
+    jobs = []
+    with open(args.jobs) as fh:
+        for num, line in enumerate(fh, 1):
+            line = line.split('#')[0].strip()
+            if line:
+                job_args = usage(conf, shlex.split(line), base=args)
+                for option in UNSUPPORTED:
+                    if getattr(job_args, option[2:].replace('-', '_')):
+                        sys.exit(f"{ERROR}Error: {option!r} is not available with '--jobs' "
+                                 f"({args.jobs!r}, line {num}).{ENDCOL}")
+                jobs.append(job_args)
+    if not jobs:
+        sys.exit(f"{ERROR}Error: no request found in {args.jobs!r}.{ENDCOL}")
+    return jobs
@@ -0,0 +1,77 @@
+# journal.py
+
+"""
+Checkpoint of a request, with '--resume'.
+
+Results of the items are written in a work directory of the output ('.kmerator_resume'),
+which is kept when kmerator is stopped (Ctrl C, kill, crash of the node). Each item is added
+to the journal (one json line) as soon as its results are written. Launched again with the
+same options, kmerator skips the items of the journal and continues with the others.
+The work directory is removed when the request is completed (unless '--keep' is set).
+"""
+
+import os
+import sys
+import json
+
+from items import item_key
+from color import *
+
+
+WORKDIR = '.kmerator_resume'
+JOURNAL_FILE = 'journal.jsonl'
+### options which must be the same to resume a request
+REQUEST_ARGS = ['selection', 'fasta_file', 'specie', 'release', 'kmer_length', 'genome', 'stringent',
+                'isoforms', 'max_on_transcriptome', 'max_on_genome', 'chimera', 'shard']
+
+
+class Journal:
+    """ Journal of the completed items of a request, in its work directory (args.tmpdir) """
+
+    def __init__(self, args):
+        """ load the journal of the previous run, if any, and open it to add items """
+        self.path = os.path.join(args.tmpdir, JOURNAL_FILE)
+        self.entries = []           # [(job index, item key, type, mesg)]
+        request = {k: getattr(args, k, None) for k in REQUEST_ARGS}
+        request = json.loads(json.dumps(request))           # tuples as lists, like in the file
+        if os.path.isfile(self.path):
+            ### a line interrupted while it was written is removed
+            with open(self.path, 'rb') as fh:
+                content = fh.read()
+            content = content[:content.rfind(b'\n')+1]
+            os.truncate(self.path, len(content))
+            lines = content.decode().splitlines()
+            if lines and json.loads(lines[0]) != request:
+                sys.exit(f"{ERROR}Error: {os.path.dirname(self.path)!r} contains the work of another "
+                         f"request, which can't be resumed with these options (remove the directory "
+                         f"to start again).{ENDCOL}")
+            for line in lines[1:]:
+                job, key, type, mesg = json.loads(line)
+                self.entries.append((job, tuple(key), type, mesg))
+        os.makedirs(args.tmpdir, exist_ok=True)
+        self.fh = open(self.path, 'a')
+        if not self.fh.tell():
+            self.write(request)
+        self.done = {(job, key) for job, key, _, _ in self.entries}
+
+
+    def todo(self, job, items):
+        """ items of the job (index of the kmer length) which are not in the journal """
+        return [item for item in items if (job, item_key(item)) not in self.done]
+
+
+    def add(self, job, item, type, mesg):
+        """ add a completed item, its results are already written """
+        self.write([job, item_key(item), type, mesg])
+
+
+    def write(self, entry):
+        self.fh.write(json.dumps(entry) + '\n')
+        self.fh.flush()
+
+
+    def close(self, remove=False):
+        """ close the journal, and remove it when the request is completed """
+        self.fh.close()
+        if remove:
+            os.remove(self.path)
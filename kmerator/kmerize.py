@@ -6,162 +6,409 @@ https://stackoverflow.com/questions/47903791/how-to-terminate-a-multiprocess-in-
 """
 
 import os
-import sys
-import shutil
-import subprocess
 import multiprocessing
-import copy
-import random
-import string
+from multiprocessing.pool import ThreadPool
+import hashlib
 
 from color import *
+import genome
+import counter
+from items import group_key
+from records import *
+
+NAME_MAX = os.pathconf('/', 'PC_NAME_MAX')          # result files of long sequence ids are shortened
+
+### arguments needed by workers (others args are not sent to the processes)
+WORKER_ARGS = ['datadir', 'genome', 'specie', 'assembly', 'release', 'kmer_length', 'selection',
+               'fasta_file', 'stringent', 'max_on_transcriptome', 'max_on_genome', 'dedup_kmers', 'tmpdir',
+               'debug', 'table', 'chimera']
+
+EXECUTORS = ['auto', 'process', 'thread']          # see choose_executor()
+
+
+def choose_executor(executor, indexes):
+    """
+    Executor of the workers ('process' or 'thread'), for the genome and transcriptome indexes
+    they query. With 'auto', threads are used when the indexes are queried by jellyfish: workers
+    mostly wait for the jellyfish processes. KMC databases are queried in the worker (python API),
+    with a handle opened once per process (see counter.Kmc): processes are used, threads are
+    rejected (RuntimeError).
+    """
+    kmc = any(counter.backend(index) is counter.Kmc for index in indexes if index)
+    if executor == 'thread' and kmc:
+        raise RuntimeError("threads can't query KMC indexes (opened once per process), use processes "
+                         "('--executor process').")
+    if executor != 'auto':
+        return executor
+    return 'process' if kmc else 'thread'
 
-MAX_CHARS = os.pathconf('/', 'PC_NAME_MAX') - 40   # with --fasta-file arg: avoid too large file name
 
 class SpecificKmers:
-    """ Class doc """
+    """
+    Extract specific kmers/contigs from items (genes, transcripts or unannotated sequences)
+
+    The dataset and the pool of processes are kept between calls of run(), so the same
+    object can process many requests (see api.py).
+    With '--selection', items are grouped by gene: sequences of the isoforms are sent with the
+    group, and the indexes are queried once per group.
+    With '--fasta-file', items with the same sequence are grouped, and their sequence is
+    queried once.
+    Items are processed by a pool of processes, or by a pool of threads (executor='thread'):
+    threads share the dataset and the results without copy, but filters of kmers are run one
+    at a time (GIL).
+    """
+
+    def __init__(self, transcriptome_dict=None, geneinfo_dict=None, thread=1, executor='process'):
+        """
+        For each gene (or unannotated sequence) given to run():
+        1. Get sequences of the isoforms
+        2. From sequences, build abundance for each kmer againt the genome (output: dict)
+        3. From sequences, build abundance for each kmer againt the transcriptome (output: dict)
+        4. for each item of the gene, filter the specific kmers, according to the given arguments
+        5. write specific kmers and contigs in files (or return them when no tmpdir is given)
+        """
+        self.thread = thread
+        self.transcriptome_dict = transcriptome_dict
+        self.geneinfo_dict = geneinfo_dict
+        self.executor = executor
+        self.pool = None
+        if thread > 1:
+            self.pool = ThreadPool(thread) if executor == 'thread' else multiprocessing.Pool(processes=thread)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(terminate=exc_type is not None)
+
 
-    def __init__(self, args, report, items, transcriptome_dict=None, geneinfo_dict=None):
+    def __getstate__(self):
+        ### pool can't be sent to workers, and dataset is not needed by them
+        state = self.__dict__.copy()
+        state['pool'] = state['transcriptome_dict'] = state['geneinfo_dict'] = None
+        return state
+
+
+    def close(self, terminate=False):
+        """ stop workers """
+        if self.pool:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+    def run(self, args, items, to_files=True):
         """
-        1. Get sequence
-        2. write on file
-        3. From sequence, build abundance for each kmer, using jellyfish againt the genome (output: dict)
-        4. From sequence, build abundance for each kmer, uding jellyfish againt the transcriptome (output: dict)
-        5. filter the specific kmers, according to the given arguments
-        6. write specific kmers and contigs in files
+        Launch workers on items, yield (item, (type, mesg, results)) for each item.
+          - type: 'done' or 'failed'
+          - results: Records of the item (see records.py), None if results are written
+            in args.tmpdir (to_files=True)
         """
+        for _, item, result in self.run_jobs([(args, items)], to_files):
+            yield item, result
 
-        ### create a shared dict among multiple processes with Manager()
-        manager = multiprocessing.Manager()
-        self.args = manager.dict(args.__dict__)
-        if args.selection:
-            self.transcriptome_dict = manager.dict(transcriptome_dict)
-            self.geneinfo_dict = manager.dict(geneinfo_dict)
-
-        ### launch workers
-        self.transcriptome_file = os.path.join(args.datadir, f"{args.specie}.{args.assembly}.{args.release}.k{args.kmer_length}.transcriptome.jf")
-        try:
-            with multiprocessing.Pool(processes=args.thread) as pool:
-                if args.selection:
-                    messages = pool.map(self.worker_selection, items)
-                elif args.fasta_file:
-                    messages = pool.map(self.worker_fasta_file, items)
-            for type,mesg in messages:
-                report[type].append(mesg)
-        except KeyError as e:
-            pool.close()
-            shutil.rmtree(args.tmpdir)
-            sys.exit(f"{RED}Error: {e.args[0]}")
-
-
-    def worker_selection(self, item):
-        """ Function doc """
-        ### unpack item
-        globals().update(item)
-        global level
-        level = 'transcript' if type == 'transcript' else 'gene'
-
-        ### 1. Get sequence of the transcript (from the transcriptome)
-        try:
-            seq = self.transcriptome_dict[ENST]
-        except KeyError:
-            mesg = f"{given}: transcript not found in transcriptome ({ENST})."
-            return 'failed', mesg
-        if len(seq) < self.args['kmer_length']:
-            mesg = f"{given}: sequence to short ({len(seq)} < {self.args['kmer_length']})."
-            return 'failed', mesg
-
-        ### 2. Write sequences in temporary file (needed by jellyfish)
-        f_id = f"{item['given']}.{item['ENST']}"
-        seq_file, fasta_name = self.dump_seq(f_id, seq)
-
-        ### 3. From sequence, compute jellyfish againt the genome/transcriptome and convert results as dict ()
-        kmercounts_genome_dict = self.jellyfish(seq_file, self.args['genome'])
-        kmercounts_transcriptome_dict = self.jellyfish(seq_file, self.transcriptome_file)
-        ### 4. filter the specific kmers, according to the arguments
-        mesg = self.get_specific_kmers(item, kmercounts_transcriptome_dict, kmercounts_genome_dict, fasta_name)
-        return mesg
-
-
-    def worker_fasta_file(self, item):
-        ### unpack item
-        globals().update(item)
-        ### 1. write separate file for each item
-        seq_file, fasta_name = self.dump_seq(item['f_id'], item['seq'])
-
-        ### 2. From sequence, compute jellyfish against the genome/transcriptome and convert results as dict ()
-        kmercounts_transcriptome_dict = self.jellyfish(seq_file, self.transcriptome_file)
-        kmercounts_genome_dict = self.jellyfish(seq_file, self.args['genome'])
-
-        ### 3. find to specific kmers
-        mesg = self.get_specific_kmers(item, kmercounts_transcriptome_dict, kmercounts_genome_dict, fasta_name)
-
-        return mesg
-
-
-    def dump_seq(self, f_id, seq):
-        '''
-        Write sequences in temporary file (needed by jellyfish)
-        '''
-        seq_dir = os.path.join(self.args['tmpdir'], 'sequences')
-        os.makedirs(seq_dir, exist_ok=True)
-        ### replace forbiden characters
-        fasta_name = f_id.replace('/', '--')
-        ### handle max file lenght
-        if len(fasta_name) > MAX_CHARS:
-            fasta_name = f"{f_id[:MAX_CHARS-15]}...{''.join(random.choices(string.ascii_letters, k=11))}"
-        ### write sequence as fasta
-        seq_file = os.path.join(seq_dir, f"{fasta_name}.fa")
-        with open(seq_file, 'w') as fh:
-            fh.write(f">{fasta_name}\n{seq}\n")
-        return seq_file, fasta_name
-
-
-    def jellyfish(self, seq_file, jf_file):
+
+    def run_jobs(self, jobs, to_files=True):
+        """
+        Same as run() for several requests [(args, items), ...], items of all requests are
+        given to the same pool, so that processes don't wait for the end of each request.
+        Yield (index of the request, item, (type, mesg, results)).
+        """
+        tasks = []
+        index = []
+        for i, (args, items) in enumerate(jobs):
+            args = self.worker_args(args, to_files)
+            if args['selection']:
+                tasks += [(group, args, isoforms) for group, isoforms in self.group_by_gene(items)]
+            else:
+                tasks += list(self.fasta_tasks(args, items))
+            index += [i] * (len(tasks) - len(index))
+        if self.pool:
+            chunksize = max(1, len(tasks) // (self.thread * 4))
+            results = self.pool.imap(self.worker, tasks, chunksize)
+        else:
+            results = map(self.worker, tasks)
+        for i, task, task_results in zip(index, tasks, results):
+            for item, result in zip(task[0], task_results):
+                yield i, item, result
+
+
+    def worker_args(self, args, to_files):
+        """ keep only arguments needed by workers """
+        args = args if isinstance(args, dict) else vars(args)
+        args = {k: args.get(k) for k in WORKER_ARGS}
+        args['selection'] = bool(args['selection'])
+        args['fasta_file'] = bool(args['fasta_file'])
+        args['to_files'] = to_files
+        prefix = os.path.join(args['datadir'], f"{args['specie']}.{args['assembly']}."
+                              f"{args['release']}.k{args['kmer_length']}.transcriptome")
+        args['transcriptome_file'] = counter.index_path(prefix) or f"{prefix}.jf"
+        ### with '--selection', the projected genome replaces the genome index, when it is up to date
+        genome_idx = os.path.join(args['datadir'], f"{args['specie']}.{args['assembly']}."
+                                  f"{args['release']}.k{args['kmer_length']}.genome.idx")
+        args['genome_idx'] = None
+        if args['selection'] and genome.is_usable(genome_idx, args['genome'], args['kmer_length']):
+            args['genome_idx'] = genome_idx
+        return args
+
+
+    def group_by_gene(self, items):
+        """
+        Group items by gene (in order of first appearance), with the sequences of the gene
+        isoforms: {ENST: seq} (seq is None if the isoform is missing in transcriptome)
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(item['ENSG'], []).append(item)
+        for ENSG, group in groups.items():
+            isoforms = self.geneinfo_dict['gene'][ENSG]['transcript']
+            yield group, {isoform: self.transcriptome_dict.get(isoform) for isoform in isoforms}
+
+
+    def fasta_tasks(self, args, items):
+        """
+        One task per distinct sequence, with all the items having this sequence (and the same
+        breakpoints with '--chimera').
+        With '--dedup-kmers', counts of the sequence kmers are computed before and sent with the task.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(group_key(item, args['chimera']), []).append(item)
+        counts = self.kmers_counts(args, groups) if args['dedup_kmers'] else {}
+        for seq, group in groups.items():
+            yield group, args, counts.get(seq)
+
+
+    def kmers_counts(self, args, seqs):
+        """
+        '--dedup-kmers': each distinct kmer of the sequences is queried once (kmers are split
+        between the processes). Return {seq: (transcriptome counts, genome counts)}
+        """
+        kmer_length = args['kmer_length']
+        kmers = set()
+        for seq in seqs:
+            kmers.update(seq[i:i+kmer_length] for i in range(len(seq) - kmer_length + 1))
+        kmers = [mer for mer in kmers if counter.ACGT.issuperset(mer)]
+        canonicals = list({genome.canonical(mer) for mer in kmers})
+        ### queries of parts of the kmers, as sequences
+        queries = []
+        for index, mers, canonical in ((args['transcriptome_file'], kmers, False), (args['genome'], canonicals, True)):
+            queries += [(args, mers[i::self.thread], index, canonical) for i in range(self.thread) if mers[i::self.thread]]
+        results = self.pool.map(self.query_part, queries) if self.pool else map(self.query_part, queries)
+        tr_counts, ge_counts = {}, {}
+        for (_, _, _, canonical), result in zip(queries, results):
+            (ge_counts if canonical else tr_counts).update(result)
+        ### counts of each sequence, in order of the sequence
+        counts = {}
+        for seq in seqs:
+            seq_counts = self.seq_counts(seq, tr_counts, kmer_length)
+            counts[seq] = (seq_counts, {mer: ge_counts[mer] for mer in map(genome.canonical, seq_counts)})
+        return counts
+
+
+    def query_part(self, query):
+        args, seqs, index, canonical = query
+        return self.query(args, seqs, index, canonical)
+
+
+    def worker(self, task):
+        """ results of the items of the task, in their order (items are not sent back) """
+        items, args, isoforms_dict = task
+        if args['selection']:
+            results = self.worker_selection(items, args, isoforms_dict)
+        elif args['chimera']:
+            results = self.worker_chimera(items, args)
+        else:
+            results = self.worker_fasta_file(items, args, isoforms_dict)
+        return [result for _, result in results]
+
+
+    def worker_selection(self, items, args, isoforms_dict):
+        """ Get specific kmers of all items of a gene """
+        results = []
+        to_query = {}               # {ENST: seq}, sequences to query
+        for item in items:
+            given = item['given']
+            ENST = item['ENST']
+            ### 1. Get sequence of the transcript (from the transcriptome)
+            seq = isoforms_dict.get(ENST)
+            if seq is None:
+                mesg = f"{given}: transcript not found in transcriptome ({ENST})."
+                results.append((item, ('failed', mesg, None)))
+            elif len(seq) < args['kmer_length']:
+                mesg = f"{given}: sequence to short ({len(seq)} < {args['kmer_length']})."
+                results.append((item, ('failed', mesg, None)))
+            else:
+                to_query[ENST] = seq
+                results.append((item, None))
+        if not to_query:
+            return results
+
+        ### isoforms of the gene
+        for isoform, seq in isoforms_dict.items():
+            if seq is None:
+                raise KeyError(isoform)
+        isoforms = {'nb': len(isoforms_dict), 'kmers': {}}
+        if any(item['type'] != 'transcript' for item in items):
+            isoforms['kmers'] = self.isoforms_kmers(isoforms_dict, args['kmer_length'])
+
+        ### 2. From sequences, compute counts againt the genome/transcriptome as dict
+        if args['genome_idx']:
+            kmercounts_genome_dict = genome.load(args['genome_idx']).counts(to_query.values())
+        else:
+            kmercounts_genome_dict = self.query(args, to_query.values(), args['genome'], True)
+        kmercounts_transcriptome_all = self.query(args, to_query.values(), args['transcriptome_file'])
+        kmercounts_transcriptome = {}
+
+        ### 3. filter the specific kmers, according to the arguments
+        for i, (item, result) in enumerate(results):
+            if result is None:
+                ENST = item['ENST']
+                if ENST not in kmercounts_transcriptome:
+                    kmercounts_transcriptome[ENST] = self.seq_counts(to_query[ENST], kmercounts_transcriptome_all,
+                                                                    args['kmer_length'])
+                result = self.get_specific_kmers(args, item, kmercounts_transcriptome[ENST],
+                                                 kmercounts_genome_dict, isoforms)
+                results[i] = (item, result)
+        return results
+
+
+    def worker_fasta_file(self, items, args, counts=None):
+        """ Get specific kmers of the items having the same sequence """
+        seq = items[0]['seq']
+        if len(seq) < args['kmer_length']:
+            return [(item, ('failed', f"{item['f_id']}: sequence to short ({len(seq)} < {args['kmer_length']})", None))
+                    for item in items]
+
+        ### 1. From sequence, compute counts against the genome/transcriptome as dict (unless given)
+        if counts:
+            kmercounts_transcriptome_dict, kmercounts_genome_dict = counts
+        else:
+            kmercounts_transcriptome_dict = self.query(args, [seq], args['transcriptome_file'])
+            kmercounts_genome_dict = self.query(args, [seq], args['genome'], True)
+
+        ### 2. find to specific kmers of each item
+        return [(item, self.get_specific_kmers(args, item, kmercounts_transcriptome_dict, kmercounts_genome_dict))
+                for item in items]
+
+
+    def worker_chimera(self, items, args):
+        """
+        '--chimera': get specific kmers of the items having the same sequence, querying only the
+        kmers spanning the junctions. Breakpoints are given in the fasta headers, otherwise the
+        junctions are detected with the transcriptome: kmers of the sequence missing in the
+        transcriptome, between two kmers found in it.
+        """
+        seq = items[0]['seq']
+        kmer_length = args['kmer_length']
+        breakpoints = items[0].get('breakpoints')
+        last = len(seq) - kmer_length           # start of the last kmer (from 0)
+        transcriptome_counts = None
+
+        ### 1. Starts of the kmers spanning the junctions (the junction is after the base at breakpoint)
+        if breakpoints:
+            starts = sorted({start for pos in breakpoints
+                             for start in range(max(0, pos - kmer_length + 1), min(pos, last + 1))})
+        else:
+            transcriptome_counts = self.query(args, [seq], args['transcriptome_file'])
+            found = [transcriptome_counts.get(seq[i:i+kmer_length]) for i in range(last + 1)]
+            starts = []
+            run = []
+            for i, count in enumerate(found):
+                if count == 0:
+                    run.append(i)
+                    continue
+                ### a run of missing kmers between two found kmers is a junction
+                if run and count and run[0] > 0 and found[run[0]-1]:
+                    starts += run
+                run = []
+            if args['debug'] and starts:
+                junctions = [start + kmer_length - 1 for i, start in enumerate(starts) if not i or start != starts[i-1] + 1]
+                print(f"{YELLOW} {items[0]['f_id']} breakpoints found: {', '.join(map(str, junctions))}{ENDCOL}")
+        if not starts:
+            mesg = "breakpoints out of the sequence" if breakpoints else "no junction found with the transcriptome"
+            return [(item, ('failed', f"{item['f_id']}: {mesg}", None)) for item in items]
+
+        ### 2. Counts of the junction kmers only, queried as windows of the sequence
+        windows = []
+        for i, start in enumerate(starts):
+            if not i or start != starts[i-1] + 1:
+                windows.append([start, start])
+            windows[-1][1] = start
+        windows = [seq[first:end+kmer_length] for first, end in windows]
+        if transcriptome_counts is None:
+            transcriptome_counts = self.query(args, windows, args['transcriptome_file'])
+        kmercounts_genome_dict = self.query(args, windows, args['genome'], True)
+        ### kmers in order of the sequence, with their position in the sequence (from 1)
+        kmercounts_transcriptome_dict = {}
+        positions = {}
+        for start in starts:
+            mer = seq[start:start+kmer_length]
+            if mer in transcriptome_counts and mer not in kmercounts_transcriptome_dict:
+                kmercounts_transcriptome_dict[mer] = transcriptome_counts[mer]
+                positions[mer] = start + 1
+
+        ### 3. find to specific kmers of each item
+        return [(item, self.get_specific_kmers(args, item, kmercounts_transcriptome_dict, kmercounts_genome_dict,
+                                               positions=positions))
+                for item in items]
+
+
+    def isoforms_kmers(self, isoforms_dict, kmer_length):
+        """ number of isoforms containing each kmer: {kmer: count} """
+        kmers = {}
+        for seq in isoforms_dict.values():
+            for mer in {seq[i:i+kmer_length] for i in range(len(seq) - kmer_length + 1)}:
+                kmers[mer] = kmers.get(mer, 0) + 1
+        return kmers
+
+
+    def seq_counts(self, seq, kmercounts_dict, kmer_length):
         """
-        From sequence, compute jellyfish againt the genome/transcriptome and convert results
-        as dict ()
+        Counts of kmers of a sequence, in order of the sequence, from counts of several sequences
+        (like jellyfish, kmers not counted, with a 'N' for example, are skipped)
         """
-        if self.args['debug']: print(f"{YELLOW}start jellyfish on {os.path.basename(seq_file)} "
-                                     f"against {os.path.basename(jf_file)}{ENDCOL}")
-        cmd = f'jellyfish query -s "{seq_file}" {jf_file}'
-        try:
-            result = subprocess.check_output(cmd, shell=True, text=True, stderr=subprocess.STDOUT) \
-                                             .rstrip('\n').split('\n')
-        except subprocess.CalledProcessError as err:
-            sys.exit(f"{ERROR}Error: executing jellyfish:\n"
-                     f"  {ERROR}command: {ENDCOL}{cmd}\n"
-                     f"  {ERROR}returned: {ENDCOL}{err.output}")
-        if not result[0]:
-            return {}
-        result_dict = dict([(b[0], int(b[1])) for b in [a.split() for a in result]])
-        return result_dict
-
-
-    def get_specific_kmers(self, item, kmercounts_transcriptome_dict, kmercounts_genome_dict, fasta_name):
+        seq_counts = {}
+        for i in range(len(seq) - kmer_length + 1):
+            mer = seq[i:i+kmer_length]
+            if mer in kmercounts_dict:
+                seq_counts[mer] = kmercounts_dict[mer]
+        return seq_counts
+
+
+    def query(self, args, seqs, index, canonical=False):
+        """
+        Counts of the kmers of the sequences in the index, as dict, with the backend of the index.
+        Sequences are given in memory or through a pipe, no file is written.
+        """
+        bk = counter.backend(index)
+        if args['debug']: print(f"{YELLOW}start {bk.name} against {os.path.basename(index)}{ENDCOL}")
+        return dict(bk.counts(index, seqs, canonical))
+
+
+    def get_specific_kmers(self, args, item, kmercounts_transcriptome_dict, kmercounts_genome_dict,
+                           isoforms=None, positions=None):
         '''
         Keep only specific kmers, according to the arguments
         Launched for each gene, transcript, or unanotated sequence
+        isoforms: with '--selection', {'nb': number of isoforms, 'kmers': {kmer: number of isoforms with it}}
+        positions: with '--chimera', {kmer: position in the sequence}, kmers are only the junction kmers
         '''
-        args = copy.deepcopy(self.args)
         ### Define some variables: gene_name, transcript_name, variants_dic and output file names
-        '''
-        d = {
-            'specific_kmers': [],              # specific kmers list
-            'specific_contigs': [],            # specific contigs list
-            masked_kmers = []                  # masked kmers list
-            'contig': "",                      # initialize contig sequence
-            'knb': 0,                          # kmer number (selected kmer)
-            'c_nb': 1,                         # contig number
-            'kmer_pos_prev': 0,                # position of retained kmer
-            'contig_pos': 0,                   # position of retained contig
-        }
-        '''
         level = 'gene' if item['type'] != 'transcript' else item['type']
-        specific_kmers = []              # specific kmers list
-        masked_kmers = []                # masked kmers list
-        specific_contigs = []            # specific contigs list
-        contig = ""                      # initialize contig sequence
+        if args['chimera']:
+            level = 'chimera'
+        given = item.get('given')
+        ENST = item.get('ENST')
+        ENSG = item.get('ENSG')
+        f_id = item.get('f_id')
+        records = Records(item, args['kmer_length'], isoforms and isoforms['nb'])  # kmers, contigs and masked kmers
+        contig = None                    # first and last kmers of the contig (record numbers, from 1)
         knb = 0                          # kmer number (selected kmer)
         c_nb = 1                         # contig number
         kmer_pos_prev = 0                # position of retained kmer
@@ -171,44 +418,45 @@ class SpecificKmers:
         total_kmers = len(kmercounts_transcriptome_dict)
         if args['selection']:
             given_up = given.upper()
-            isoforms = self.geneinfo_dict['gene'][ENSG]['transcript']
-            isoforms_nb = len(isoforms)
-            isoforms_dict = { isoform:self.transcriptome_dict[isoform] for isoform in isoforms }
+            isoforms_nb = isoforms['nb']
 
             ### Define conditionnal variables
             ## When '--selection' option is set
             kmer_outfile = f"{given_up}-{ENST}-{level}-specific_kmers.fa"
             contig_outfile = f"{given_up}-{ENST}-{level}-specific_contigs.fa"
             masked_outfile = f"{given_up}-{ENST}-{level}-masked_kmers.fa"
-        # ~ elif args['chimera']:
-            # ~ ## When '--chimera' option is set
-            # ~ kmer_outfile = f"{fasta_name}-chimera-specific_kmers.fa"
-            # ~ contig_outfile = f"{fasta_name}-chimera-specific_contigs.fa"
+            table_outfile = f"{given_up}-{ENST}-{level}-kmers.tsv"
+        elif args['chimera']:
+            ## When '--chimera' option is set
+            kmer_outfile = f"{f_id}-chimera-specific_kmers.fa"
+            contig_outfile = f"{f_id}-chimera-specific_contigs.fa"
+            masked_outfile = f"{f_id}-chimera-masked_kmers.fa"
+            table_outfile = f"{f_id}-chimera-kmers.tsv"
         elif args['fasta_file']:
             ## When '--fasta-file' option is set
-            kmer_outfile = f"{fasta_name}-transcript-specific_kmers.fa"
-            contig_outfile = f"{fasta_name}-transcript-specific_contigs.fa"
-            masked_outfile = f"{fasta_name}-masked_kmers.fa"
+            kmer_outfile = f"{f_id}-transcript-specific_kmers.fa"
+            contig_outfile = f"{f_id}-transcript-specific_contigs.fa"
+            masked_outfile = f"{f_id}-masked_kmers.fa"
+            table_outfile = f"{f_id}-kmers.tsv"
 
 
         i = 1
         for mer, abund_in_tr in kmercounts_transcriptome_dict.items():
 
-            kmer_pos = i
+            kmer_pos = positions[mer] if positions else i
             try:
                 canonical = self.__canonical(mer)
                 abund_in_ge = int(kmercounts_genome_dict[canonical])    # abundance in genome for this kmer
             except KeyError as err:
                 if len(mer) != len(next(iter(kmercounts_genome_dict))):
-                    raise KeyError(f"ErrorIndexLength: length of kmer expected: {self.args['kmer_length']}\n"
+                    raise KeyError(f"ErrorIndexLength: length of kmer expected: {args['kmer_length']}\n"
                                    f"  Genome kmer index length: {len(next(iter(kmercounts_genome_dict)))}\n"
                                    f"  Transcriptome kmer index length (dataset): {len(mer)}")
                 raise KeyError(f"Error: kmer not found in genome: {err}")
 
             if level == 'gene':
 
-                isoforms_with_mer = [enst for enst, seq in isoforms_dict.items() if mer in seq]
-                isoforms_with_mer_nb = len(isoforms_with_mer)
+                isoforms_with_mer_nb = isoforms['kmers'].get(mer, 0)
 
                 ### if the kmer is present/unique or does not exist (splice/chimera?) on the genome
                 if abund_in_ge <= 1:
@@ -220,124 +468,97 @@ class SpecificKmers:
                     if not args['stringent'] and abund_in_tr and abund_in_tr == isoforms_with_mer_nb:
                         ## contigs case
                         if knb == 0:                                    # first kmer in contig
-                            contig = mer
+                            contig = [i, i]
                             kmer_pos_prev = kmer_pos
                             contig_pos = kmer_pos
                         elif knb>0 and kmer_pos == kmer_pos_prev+1:     # add last base to existing contig
-                            contig += mer[-1]
+                            contig[1] = i
                             kmer_pos_prev = kmer_pos
                         else:                                           # store contig and create new
-                            specific_contigs.append(f">{given_up}:{ENST}.contig_{c_nb} (at position {contig_pos})\n{contig}")
+                            records.add_contig(contig_pos, c_nb, contig)
                             c_nb += 1
-                            contig = mer
+                            contig = [i, i]
                             kmer_pos_prev = kmer_pos
                             contig_pos = kmer_pos
                         ## kmers case
                         knb += 1
-                        specific_kmers.append(f">{given_up}:{ENST}.kmer{kmer_pos} ct:{c_nb} tr:{isoforms_with_mer_nb}/{isoforms_nb}\n{mer}")
+                        records.add(KMER_GENE, kmer_pos, c_nb, abund_in_tr, abund_in_ge, isoforms_with_mer_nb, mer)
 
                     ### for gene level only, the stringent argument implies retaining kmers present in ALL isoforms of the gene
                     elif args['stringent'] and abund_in_tr == isoforms_nb == isoforms_with_mer_nb:
                         ## contigs case
                         if knb == 0:                                    # first kmer in contig
-                            contig = mer
+                            contig = [i, i]
                             kmer_pos_prev = kmer_pos
                             contig_pos = kmer_pos
                         elif knb>0 and kmer_pos == kmer_pos_prev+1:     # add last base to existing contig
-                            contig += mer[-1]
+                            contig[1] = i
                             kmer_pos_prev = kmer_pos
                         else:                                           # store contig and create new
-                            specific_contigs.append(f">{given_up}:{ENST}.contig_{c_nb} (at position {kmer_pos})\n{contig}")
+                            records.add_contig(kmer_pos, c_nb, contig)
                             c_nb += 1
-                            contig = mer
+                            contig = [i, i]
                             kmer_pos_prev = kmer_pos
                             contig_pos = kmer_pos
                         ## kmers case
                         knb += 1
-                        specific_kmers.append(f">{given_up}:{ENST}.kmer{kmer_pos} ct:{c_nb} tr:{isoforms_with_mer_nb}/{isoforms_nb}\n{mer}")
+                        records.add(KMER_GENE, kmer_pos, c_nb, abund_in_tr, abund_in_ge, isoforms_with_mer_nb, mer)
                     else:
-                        masked_kmers.append(f">{given_up}:{ENST}.kmer{kmer_pos} "
-                                        f"tr:{isoforms_with_mer_nb}/{isoforms_nb} "
-                                        f"transcriptome:{abund_in_tr}\n{mer}"
-                                        )
+                        records.add(MASKED_GENE_TRANSCRIPTOME, kmer_pos, c_nb, abund_in_tr, abund_in_ge,
+                                    isoforms_with_mer_nb, mer)
 
                 ### the kmer count exceeded 1 in the genome
                 else:
-                    masked_kmers.append(f">{given_up}:{ENST}.kmer{kmer_pos} "
-                                    f"tr:{isoforms_with_mer_nb}/{isoforms_nb} "
-                                    f"genome:{abund_in_ge}\n{mer}"
-                                    )
+                    records.add(MASKED_GENE_GENOME, kmer_pos, c_nb, abund_in_tr, abund_in_ge,
+                                isoforms_with_mer_nb, mer)
 
-            ### Cases of transcripts 1) annotated, 2) unannotated.
-            elif level == 'transcript':
+            ### Cases of transcripts 1) annotated, 2) unannotated, 3) junctions of chimera (unannotated).
+            elif level in ('transcript', 'chimera'):
                 ### Case of annotated transcripts
                 if args['selection'] and abund_in_tr == 1 and abund_in_ge <= 1:
                     ## contigs case
                     if knb == 0:                                    # first kmer in contig
-                        contig = mer
+                        contig = [i, i]
                         kmer_pos_prev = kmer_pos
                         contig_pos = kmer_pos
                     elif knb>0 and kmer_pos == kmer_pos_prev+1:     # add last bp to existing contig
-                        contig += mer[-1]
+                        contig[1] = i
                         kmer_pos_prev = kmer_pos
                     else:                                           # store contig and create new
-                        specific_contigs.append(f">{ENST}.contig_{c_nb} (at position {contig_pos})\n{contig}")
+                        records.add_contig(contig_pos, c_nb, contig)
                         c_nb += 1
-                        contig = mer
+                        contig = [i, i]
                         kmer_pos_prev = kmer_pos
                         contig_pos = kmer_pos
                     ## kmers case
                     knb += 1
-                    specific_kmers.append(f">{given_up}:{ENST}.kmer{kmer_pos} ct:{c_nb}\n{mer}")
+                    records.add(KMER_TRANSCRIPT, kmer_pos, c_nb, abund_in_tr, abund_in_ge, mer=mer)
 
                 ### Case of unannotated transcripts
-                elif args['fasta_file'] and abund_in_tr <= self.args['max_on_transcriptome'] and abund_in_ge <= self.args['max_on_genome']:     # max_on_transcriptome = 0 by default
+                elif args['fasta_file'] and abund_in_tr <= args['max_on_transcriptome'] and abund_in_ge <= args['max_on_genome']:     # max_on_transcriptome = 0 by default
                     ### contigs case
                     if knb == 0:                                    # first kmer in contig
-                        contig = mer
+                        contig = [i, i]
                         kmer_pos_prev = kmer_pos
                         contig_pos = kmer_pos
                     elif knb>0 and kmer_pos == kmer_pos_prev+1:     # add last bp to existing contig
-                        contig += mer[-1]
+                        contig[1] = i
                         kmer_pos_prev = kmer_pos
                     else:
-                        specific_contigs.append(f">{f_id}.contig_{c_nb} (at position {contig_pos})\n{contig}")
+                        records.add_contig(contig_pos, c_nb, contig)
                         c_nb += 1
-                        contig = mer
+                        contig = [i, i]
                         kmer_pos_prev = kmer_pos
                         contig_pos = kmer_pos
                     ### kmers case
                     knb += 1
-                    specific_kmers.append(f">{f_id}.kmer{kmer_pos} ct:{c_nb}\n{mer}")
+                    records.add(KMER_FASTA, kmer_pos, c_nb, abund_in_tr, abund_in_ge, mer=mer)
 
                 ### the kmer count exceeded 1 in the genome
                 else:
-                    fasta_id = f"{given_up}:{ENST}.kmer{kmer_pos}" if args['selection'] else f"{f_id}.contig_{c_nb}"
-                    masked_kmers.append(f">{fasta_id} "
-                                    f"genome:{abund_in_ge} "
-                                    f"transcriptome:{abund_in_tr}\n{mer}"
-                                    )
-
-            # ~ ### Case of chimera
-            # ~ elif level == 'chimera':
-                # ~ if abund_in_tr == abund_in_ge == 0:
-                    # ~ ### contig case
-                    # ~ if knb == 0:
-                        # ~ contig = mer
-                        # ~ kmer_pos_prev = kmer_pos
-                        # ~ contig_pos = kmer_pos
-                    # ~ elif knb>0 and kmer_pos == kmer_pos_prev+1:
-                        # ~ contig += mer[-1]
-                        # ~ kmer_pos_prev = kmer_pos
-                    # ~ else:
-                        # ~ specific_contigs.append(f">{f_id}.contig_{c_nb} (at position {contig_pos})\n{contig}")
-                        # ~ c_nb += 1
-                        # ~ contig = mer
-                        # ~ kmer_pos_prev = kmer_pos
-                        # ~ contig_pos = kmer_pos
-                    # ~ ### kmers case
-                    # ~ knb += 1
-                    # ~ specific_kmers.append(f">{f_id}.kmer{kmer_pos} ct:{c_nb}\n{mer}")
+                    kind = MASKED_TRANSCRIPT if args['selection'] else MASKED_FASTA
+                    records.add(kind, kmer_pos, c_nb, abund_in_tr, abund_in_ge, mer=mer)
+
             ### not a gene or transcript
             else:
                 raise KeyError(f"{RED}Error: level {level!r} unknown.{ENDCOL}")
@@ -345,72 +566,61 @@ class SpecificKmers:
 
 
         ### append last contig in list
-        if args['fasta_file'] and contig:
-            specific_contigs.append(f">{f_id}.contig_{c_nb} (at position {contig_pos})\n{contig}")
-        elif level == "gene" and contig:
-            specific_contigs.append(f">{given_up}:{ENST}.contig_{c_nb} (at position {contig_pos})\n{contig}")
-        elif level == "transcript" and contig:
-            specific_contigs.append(f">{ENST}.contig_{c_nb} (at position {contig_pos})\n{contig}")
+        if contig:
+            records.add_contig(contig_pos, c_nb, contig)
+        nb_kmers, nb_contigs = records.nb_specific, len(records.contigs)
         if args['debug']:
             if args['selection']:
-                print(f"{YELLOW} {ENST} kmers/contig: {len(specific_kmers)}/{len(specific_contigs)} ({given}){ENDCOL}")
+                print(f"{YELLOW} {ENST} kmers/contig: {nb_kmers}/{nb_contigs} ({given}){ENDCOL}")
             else:
-                print(f"{YELLOW} {f_id} kmers/contig: {len(specific_kmers)}/{len(specific_contigs)}{ENDCOL}")
+                print(f"{YELLOW} {f_id} kmers/contig: {nb_kmers}/{nb_contigs}{ENDCOL}")
+
+        ### results are kept in memory when they are not written in files (as compact records)
+        results = None
+        if not args['to_files']:
+            results = records
 
         ### masked kmers
-        if masked_kmers:
-            self.write(args, masked_outfile, masked_kmers, 'masked')
+        if records.nb_masked and args['to_files']:
+            self.write(args, masked_outfile, records, 'masked')
+
+        ### '--table': rows of all kmers
+        if args['table'] and args['to_files'] and (nb_kmers or records.nb_masked):
+            self.write(args, table_outfile, records, 'table')
 
         ### write kmer/contig files
-        if specific_kmers:
-            self.write(args, kmer_outfile, specific_kmers, 'kmers')
-            self.write(args, contig_outfile, specific_contigs, 'contigs')
+        if nb_kmers:
+            if args['to_files']:
+                self.write(args, kmer_outfile, records, 'kmers')
+                self.write(args, contig_outfile, records, 'contigs')
         else:
             if args['selection']:
                 mesg = f"{given}: no specific kmers found for {ENST} (level: {level})"
             else:
                 mesg = f"{f_id}: no specific kmers found"
-            return 'failed', mesg
+            return 'failed', mesg, results
 
         ### report
         if args['selection']:
-            mesg = f"{given}: {item['symbol']}:{ENST} - kmers/contigs: {len(specific_kmers)}/{len(specific_contigs)} (level: {level})"
+            mesg = f"{given}: {item['symbol']}:{ENST} - kmers/contigs: {nb_kmers}/{nb_contigs} (level: {level})"
         else:
-            mesg = f"{f_id} - kmers/contigs: {len(specific_kmers)}/{len(specific_contigs)} (level: {level})"
+            mesg = f"{f_id} - kmers/contigs: {nb_kmers}/{nb_contigs} (level: {level})"
 
-        return 'done', mesg
+        return 'done', mesg, results
 
 
-    def write(self, args, outfile, specific_seq, type):
-        """ Write results as fasta file"""
+    def write(self, args, outfile, records, type):
+        """ Write 'kmers', 'contigs' or 'masked' records as fasta file """
         outdir = os.path.join(args['tmpdir'], type)
         os.makedirs(outdir, exist_ok=True)
-        with open(os.path.join(outdir, outfile.replace('/', '--')), 'w') as fh:
-            fh.write("\n".join(specific_seq) + '\n')
+        outfile = outfile.replace('/', '--')
+        if len(outfile.encode()) > NAME_MAX:
+            ext = os.path.splitext(outfile)[1]
+            outfile = f"{outfile[:NAME_MAX // 2]}...{hashlib.sha1(outfile.encode()).hexdigest()}{ext}"
+        with open(os.path.join(outdir, outfile), 'wb') as fh:
+            records.write(fh, type)
 
 
     def __canonical(self, mer):
         revcomp = mer[::-1].translate(str.maketrans('ATCG','TAGC'))
         return sorted((mer, revcomp))[0]
-
-
-'''
-def handle_kmers(**kwargs):
-    print("LOCALS():", locals())
-    ## kmers case
-    knb += 1
-    specific_kmers.append(f">{given_up}:{given_up}.kmer{kmer_pos} ({isoforms_with_mer_nb}/{isoforms_nb})\n{mer}")
-    ## contigs case
-    if knb == 1:                                    # first kmer in contig
-        contig = mer
-        kmer_pos_prev = kmer_pos
-        print(f"{given_up}:{transcript}.contig{c_nb}\n{contig}")
-    elif knb>1 and kmer_pos == kmer_pos_prev+1:     # add last pb to existing contig
-        contig = contig + mer[-1]
-        kmer_pos_prev = kmer_pos
-    else:                                           # store contig and create new
-        specific_contigs.append(f"{given_up}:{transcript}.contig{c_nb}\n{contig}")
-        c_nb += 1
-        contig = mer
-        kmer_pos_prev = kmer_pos
-'''
@@ -0,0 +1,277 @@
+# lookup.py
+
+"""
+Reverse lookup ('--lookup'): genes and transcripts containing a kmer, and its specificity.
+
+The lookup index of a dataset (built by mk_lookup.py with '--mk-lookup-index') gives, for each
+kmer of the transcriptome, the transcripts containing it, one per occurrence. As in the
+transcriptome index queried by kmerator, kmers are read on the strand of the transcripts (the
+reverse complement of a kmer is another kmer), and the transcriptome count of a kmer is its
+number of occurrences. Genome counts are canonical, as in kmerator. Like the
+projected genome (genome.py), the file is memory-mapped: it is opened instantly and shared by
+all processes. Kmers are searched by batches: with the 'numpy' module, a batch is encoded and
+searched at once (millions of kmers per second), without it one kmer at a time (bisect).
+
+File format (native byte order):
+  - magic number: b'KMERLKUP'
+  - header size (uint32) and json header, padded to 8 bytes:
+      {'version', 'k', 'n', 'p', 'transcripts': [ENST, ...]}
+  - n kmers, 2-bit encoded kmers (A:0, C:1, G:2, T:3), sorted (uint64)
+  - n+1 offsets of the transcripts of each kmer in the postings (uint64)
+  - p postings, indexes of the transcripts in the header list, one per occurrence (uint32)
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+from bisect import bisect_left
+
+from color import *
+import genome
+import exit
+
+
+MAGIC = b'KMERLKUP'
+VERSION = 2                     # 1: canonical kmers, one posting per transcript
+BATCH_SIZE = 1 << 20            # kmers searched at once
+COLUMNS = ['kmer', 'level', 'specific', 'transcriptome', 'genome', 'ENSG', 'symbol', 'ENST']
+_loaded = {}                    # {path: LookupIndex}, opened once per process
+
+
+def read_header(path):
+    """ return header of a lookup index, None if the file is not valid """
+    try:
+        with open(path, 'rb') as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                return None
+            size, = struct.unpack('I', fh.read(4))
+            return json.loads(fh.read(size))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def is_usable(path, kmer_length):
+    header = read_header(path)
+    return bool(header) and header['version'] == VERSION and header['k'] == kmer_length
+
+
+def load(path):
+    """ lookup index of this file, opened at the first call """
+    if path not in _loaded:
+        _loaded[path] = LookupIndex(path)
+    return _loaded[path]
+
+
+class LookupIndex:
+    """
+    Read only access to a lookup index file
+      - encode(mers): codes of the kmers (-1 for kmers with other letters than ACGT)
+      - find(codes): position of each code in the index (-1 if not found)
+      - postings(i): indexes of the transcripts of each occurrence of the kmer at position i
+        (memoryview)
+    """
+
+    def __init__(self, path):
+        """ Class initialiser """
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        size, = struct.unpack_from('I', self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.mm[start:start+size])
+        self.k = self.header['k']
+        self.transcripts = self.header['transcripts']
+        n, p = self.header['n'], self.header['p']
+        offset = start + size + (-(start + size) % 8)
+        view = memoryview(self.mm)
+        self.keys = view[offset:offset+8*n].cast('Q')
+        self.offsets = view[offset+8*n:offset+8*(2*n+1)].cast('Q')
+        self.values = view[offset+8*(2*n+1):offset+8*(2*n+1)+4*p].cast('I')
+        self.np = genome.numpy()
+
+
+    def encode(self, mers, canonical=False):
+        """ 2-bit codes of the kmers (canonical kmers for the genome), -1 for invalid kmers (numpy array or list) """
+        k = self.k
+        np = self.np
+        if np is not None and all(len(mer) == k for mer in mers):
+            table = np.full(256, 4, dtype=np.uint8)
+            table[np.frombuffer(b'ACGT', dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+            ### one row per base: each step shifts the codes of all kmers at once
+            bases = table[np.frombuffer(''.join(mers).encode(), dtype=np.uint8)].reshape(-1, k).T.copy()
+            valid = (bases < 4).all(axis=0)
+            bases &= 3
+            forward = np.zeros(len(mers), dtype=np.uint64)
+            revcomp = np.zeros(len(mers), dtype=np.uint64)
+            for i in range(k):
+                forward <<= np.uint64(2)
+                forward |= bases[i]
+                revcomp |= (3 - bases[i]).astype(np.uint64) << np.uint64(2 * i)
+            codes = np.minimum(forward, revcomp) if canonical else forward
+            return np.where(valid, codes.astype(np.int64), -1)
+        codes = []
+        for mer in mers:
+            code = genome.encode(genome.canonical(mer) if canonical else mer) if len(mer) == k else None
+            codes.append(-1 if code is None else code)
+        return codes
+
+
+    def find(self, codes):
+        """ positions of the codes in the index, -1 if not found """
+        return search(self.keys, codes, self.np)
+
+
+    def postings(self, i):
+        return self.values[self.offsets[i]:self.offsets[i+1]]
+
+
+def search(keys, codes, np=None):
+    """ positions of the codes (see LookupIndex.encode()) in the sorted keys, -1 if not found """
+    if np is not None and isinstance(codes, np.ndarray):
+        keys = np.frombuffer(keys, dtype=np.uint64)
+        if not len(keys):
+            return np.full(len(codes), -1, dtype=np.int64)
+        ### sorted codes are searched faster (the same parts of the keys are read in a row)
+        codes = codes.astype(np.uint64)
+        order = np.argsort(codes)
+        positions = np.empty(len(codes), dtype=np.int64)
+        positions[order] = np.searchsorted(keys, codes[order])
+        positions[positions == len(keys)] = 0
+        return np.where(keys[positions] == codes, positions, -1)
+    positions = []
+    for code in codes:
+        i = bisect_left(keys, code) if code >= 0 else len(keys)
+        positions.append(i if i < len(keys) and keys[i] == code else -1)
+    return positions
+
+
+class ReverseLookup:
+    """
+    Genes and transcripts of kmers, with the lookup index of a dataset
+      - lookup(mers): a dict per kmer, {'kmer', 'level', 'specific', 'transcriptome',
+        'genome', 'ENSG', 'symbol', 'ENST'} where level is 'transcript' (one transcript),
+        'gene' (transcripts of one gene), 'genes' (several genes), 'absent' or 'invalid', and
+        transcriptome is the number of occurrences in the transcriptome (see the module doc)
+    Genome counts come from the projected genome when it is usable, else from the genome
+    index. They are given for kmers found in the transcriptome only. A kmer is specific when it
+    is found in one gene, and at most once in the genome (without genome, in one gene).
+    """
+
+    def __init__(self, lookup_idx, geneinfo_dict, genome_index=None, genome_idx=None):
+        """ Class initialiser """
+        self.index = load(lookup_idx)
+        self.geneinfo_dict = geneinfo_dict
+        self.genome = genome_index
+        self.projected = None
+        if genome_index and genome_idx and genome.is_usable(genome_idx, genome_index, self.index.k):
+            self.projected = genome.load(genome_idx)
+        self.cache = {}                 # {transcript indexes as bytes: (level, ENSG, symbols, ENST)}
+
+
+    def describe(self, postings):
+        """ level, genes, symbols and transcripts of the postings of a kmer (indexes of transcripts) """
+        key = postings.tobytes()
+        if key not in self.cache:
+            ENSTs = [self.index.transcripts[i] for i in dict.fromkeys(postings)]
+            ENSGs = list(dict.fromkeys(self.geneinfo_dict['transcript'].get(ENST) or '' for ENST in ENSTs))
+            symbols = [self.geneinfo_dict['gene'].get(ENSG, {}).get('symbol') or '' for ENSG in ENSGs]
+            level = 'transcript' if len(ENSTs) == 1 else 'gene' if len(ENSGs) == 1 else 'genes'
+            self.cache[key] = (level, ENSGs, symbols, ENSTs)
+        return self.cache[key]
+
+
+    def genome_counts(self, mers, positions):
+        """ counts in the genome of the kmers found in the transcriptome, None if not found """
+        found = [i for i, pos in enumerate(positions) if pos >= 0]
+        counts = [None] * len(mers)
+        if self.projected is not None:
+            ### the projected genome is searched with the canonical codes
+            codes = self.index.encode([mers[i] for i in found], canonical=True)
+            hits = search(self.projected.keys, codes, self.index.np)
+            for i, hit in zip(found, hits if isinstance(hits, list) else hits.tolist()):
+                counts[i] = self.projected.values[hit] if hit >= 0 else 0
+            return counts
+        if self.genome:
+            import counter
+            try:
+                genome_counts = dict(counter.backend(self.genome).counts(self.genome, [mers[i] for i in found],
+                                                                         canonical=True))
+            except RuntimeError as e:
+                sys.exit(f"{ERROR}Error: {e.args[0]}{ENDCOL}")
+            for i in found:
+                counts[i] = genome_counts.get(genome.canonical(mers[i]), 0)
+        return counts
+
+
+    def lookup(self, mers):
+        """ a dict per kmer (see the class doc), in the same order """
+        mers = [mer.upper() for mer in mers]
+        codes = self.index.encode(mers)
+        positions = self.index.find(codes)
+        if not isinstance(positions, list):
+            codes, positions = codes.tolist(), positions.tolist()
+        counts = self.genome_counts(mers, positions)
+        results = []
+        for mer, code, pos, count in zip(mers, codes, positions, counts):
+            if pos < 0:
+                level = 'invalid' if code < 0 else 'absent'
+                results.append({'kmer': mer, 'level': level, 'specific': False, 'transcriptome': 0,
+                                'genome': None, 'ENSG': [], 'symbol': [], 'ENST': []})
+                continue
+            postings = self.index.postings(pos)
+            level, ENSGs, symbols, ENSTs = self.describe(postings)
+            specific = level != 'genes' and (count is None or count <= 1)
+            results.append({'kmer': mer, 'level': level, 'specific': specific, 'transcriptome': len(postings),
+                            'genome': count, 'ENSG': ENSGs, 'symbol': symbols, 'ENST': ENSTs})
+        return results
+
+
+def read_kmers(sources):
+    """
+    yield kmers given on the command line, or in files ('-' is stdin): first word of each line,
+    comments ('#') and fasta headers are skipped, so a kmers.fa file can be given
+    """
+    for source in sources:
+        if source != '-' and not os.path.isfile(source):
+            yield source
+            continue
+        fh = sys.stdin if source == '-' else open(source)
+        for line in fh:
+            words = line.split('#')[0].split()
+            if words and not words[0].startswith('>'):
+                yield words[0]
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def lookup(args, dataset):
+    """ '--lookup': write the genes/transcripts of the kmers as tsv, in the output """
+    if len(args.kmer_length) > 1:
+        sys.exit(f"{ERROR}Error: '--lookup' needs only one kmer length.{ENDCOL}")
+    kmer_length = args.kmer_length[0]
+    lookup_idx = dataset.lookup_idx[kmer_length]
+    if not is_usable(lookup_idx, kmer_length):
+        sys.exit(f"{ERROR}Error: lookup index not found for k{kmer_length} (see --mk-lookup-index).{ENDCOL}")
+    reverse = ReverseLookup(lookup_idx, dataset.load_geneinfo(), args.genome[0], dataset.genome_idx[kmer_length])
+
+    def batches():
+        batch = []
+        for mer in read_kmers(args.lookup):
+            batch.append(mer)
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    out = sys.stdout
+    out.write('\t'.join(COLUMNS) + '\n')
+    for batch in batches():
+        for result in reverse.lookup(batch):
+            out.write('\t'.join(','.join(value) if isinstance(value, list)
+                                else '' if value is None else str(value)
+                                for value in result.values()) + '\n')
+    out.flush()
+    exit.gracefully(args)
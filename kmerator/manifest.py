@@ -0,0 +1,197 @@
+# manifest.py
+
+"""
+Manifest of a dataset: '<specie>.<assembly>.<release>.manifest.json', written when the
+dataset is built. Listing and loading datasets read it instead of scanning datadir.
+
+{
+  "format": 1,                      # format of the manifest
+  "kmerator": "2.3.4",              # version of kmerator building the dataset
+  "dataset_version": 1,             # info.VERSION_DATASET
+  "specie": "homo_sapiens", "assembly": "GRCh38", "release": "110",
+  "created": "2024-01-31 10:12",
+  "timings": {"geneinfo": 61.2, "transcriptome": 420.5, "total": 421.0},   # seconds
+  "indexes": {"31": {"file": ..., "backend": "jellyfish", "canonical": false}},
+  "genome_indexes": {"31": {"file": ..., "genome": {"path", "size", "mtime"}}},   # see genome.py
+  "lookup_indexes": {"31": {"file": ...}},                                          # see lookup.py
+  "files": {"<file name>": {"size": 123, "sha256": "..."}}
+}
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import info
+import counter
+
+
+FORMAT = 1
+SUFFIX = 'manifest.json'
+
+
+def path_of(datadir, specie, assembly, release):
+    return os.path.join(datadir, f"{specie}.{assembly}.{release}.{SUFFIX}")
+
+
+def load(path):
+    """ manifest as dict, None if missing or not readable """
+    try:
+        with open(path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('format') == FORMAT else None
+
+
+def save(path, manifest):
+    temp = f"{path}.tmp"
+    with open(temp, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(temp, path)
+
+
+def sha256(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def file_entries(datadir, files, thread=1):
+    """ {file name: {'size', 'sha256'}}, checksums are computed in parallel """
+    paths = [os.path.join(datadir, file) for file in files]
+    with ThreadPoolExecutor(max_workers=max(1, thread)) as executor:
+        checksums = list(executor.map(sha256, paths))
+    return {file: {'size': os.path.getsize(path), 'sha256': checksum}
+            for file, path, checksum in zip(files, paths, checksums)}
+
+
+def index_files(index):
+    """ files of an index (KMC databases have two files) """
+    if counter.backend(index) is counter.Kmc:
+        prefix = os.path.splitext(index)[0]
+        return [f"{prefix}.kmc_pre", f"{prefix}.kmc_suf"]
+    return [index]
+
+
+def write(path, specie, assembly, release, files, transcriptome_indexes, timings=None, thread=1, previous=None):
+    """
+    Write the manifest of a dataset
+      - files: paths of geneinfo, transcriptome and report files
+      - transcriptome_indexes: {kmer_length: path}
+      - previous: manifest of the dataset already in datadir, updated with the new files and
+        indexes (the indexes of other kmer lengths, projected genomes and lookup indexes are kept)
+    """
+    datadir = os.path.dirname(path)
+    indexes = {}
+    for k, index in transcriptome_indexes.items():
+        header = counter.backend(index).header(index) or {}
+        indexes[str(k)] = {'file': os.path.basename(index), 'backend': counter.backend(index).name,
+                           'canonical': header.get('canonical', False)}
+        files = files + index_files(index)
+    manifest = {
+        'format': FORMAT,
+        'kmerator': info.VERSION,
+        'dataset_version': info.VERSION_DATASET,
+        'specie': specie,
+        'assembly': assembly,
+        'release': str(release),
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'timings': {},
+        'indexes': {},
+        'genome_indexes': {},
+        'lookup_indexes': {},
+        'files': {},
+    }
+    ### dataset already in datadir: keep its indexes and files
+    current = load(previous) if previous else None
+    if current:
+        for key in ('timings', 'indexes', 'genome_indexes', 'lookup_indexes', 'files'):
+            manifest[key].update(current.get(key, {}))
+    manifest['timings'].update(timings or {})
+    manifest['indexes'].update(indexes)
+    manifest['files'].update(file_entries(datadir, [os.path.basename(file) for file in files], thread))
+    save(path, manifest)
+    return manifest
+
+
+def add_genome_index(path, kmer_length, genome_idx, genome_stamp):
+    """ Record a projected genome (see genome.py) in the manifest """
+    manifest = load(path)
+    if manifest is None:
+        return
+    file = os.path.basename(genome_idx)
+    manifest['genome_indexes'][str(kmer_length)] = {'file': file, 'genome': genome_stamp}
+    manifest['files'].update(file_entries(os.path.dirname(path), [file]))
+    save(path, manifest)
+
+
+def add_lookup_index(path, kmer_length, lookup_idx):
+    """ Record a lookup index (see lookup.py) in the manifest """
+    manifest = load(path)
+    if manifest is None:
+        return
+    file = os.path.basename(lookup_idx)
+    manifest.setdefault('lookup_indexes', {})[str(kmer_length)] = {'file': file}
+    manifest['files'].update(file_entries(os.path.dirname(path), [file]))
+    save(path, manifest)
+
+
+def remove_files(path, files):
+    """ Forget removed files, with their indexes """
+    manifest = load(path)
+    if manifest is None:
+        return
+    for file in files:
+        manifest['files'].pop(file, None)
+    for key in ('indexes', 'genome_indexes', 'lookup_indexes'):
+        manifest[key] = {k: v for k, v in manifest.get(key, {}).items() if v['file'] in manifest['files']}
+    save(path, manifest)
+
+
+def optional_files(manifest):
+    """ projected genomes and lookup indexes are not needed, they can be removed and built again """
+    return {entry['file'] for key in ('genome_indexes', 'lookup_indexes')
+            for entry in manifest.get(key, {}).values()}
+
+
+def is_complete(path, manifest):
+    """ all needed files of the manifest are present, with the expected sizes (quick check) """
+    datadir = os.path.dirname(path)
+    optional = optional_files(manifest)
+    for file, entry in manifest['files'].items():
+        if file in optional:
+            continue
+        try:
+            if os.path.getsize(os.path.join(datadir, file)) != entry['size']:
+                return False
+        except OSError:
+            return False
+    return bool(manifest['indexes'])
+
+
+def verify(path, thread=1):
+    """ Check size and checksum of all files of the manifest, in parallel. Return the list of errors """
+    manifest = load(path)
+    if manifest is None:
+        return [f"{os.path.basename(path)}: manifest not found or not readable"]
+    datadir = os.path.dirname(path)
+    optional = optional_files(manifest)
+
+    def check(item):
+        file, entry = item
+        file_path = os.path.join(datadir, file)
+        if not os.path.isfile(file_path):
+            return None if file in optional else f"{file}: missing"
+        if os.path.getsize(file_path) != entry['size']:
+            return f"{file}: size {os.path.getsize(file_path)}, {entry['size']} expected"
+        if sha256(file_path) != entry['sha256']:
+            return f"{file}: bad checksum"
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, thread)) as executor:
+        return [error for error in executor.map(check, manifest['files'].items()) if error]
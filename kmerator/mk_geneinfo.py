@@ -1,10 +1,10 @@
 import os
-import requests
 from bs4 import BeautifulSoup
 import gzip
 import pickle
 
 import info
+import fetch
 from color import *
 
 
@@ -60,11 +60,12 @@ class GeneInfoBuilder:
         self.args = args
         self.outfile = outfile
         self.report = report
+        self.cache = getattr(args, 'download_cache', None)      # see fetch.py
         ### internal variables
         self.chr_dict = {}                      # ID:name for chromosomes
         ### get base url of files to download
         url = f"{url}/release-{args.release}/mysql/"
-        r = requests.get(url)
+        r = fetch.get(url)
         soup = BeautifulSoup(r.text, 'lxml')
         dir = [a.text for a in soup.findAll('a') if a.text.startswith(f"{args.specie}_core_{args.release}")][-1]
         self.url = url + dir
@@ -94,7 +95,7 @@ class GeneInfoBuilder:
         '''
         ### get attrib_type file and keep id when second field == "karyotype_rank"
         attrib_type_url = f"{self.url}attrib_type.txt.gz"
-        attrib_type_r = requests.get(attrib_type_url)
+        attrib_type_r = fetch.get(attrib_type_url, self.cache)
         attrib_type_str = gzip.decompress(attrib_type_r.content).decode()
         attrib_type_id = None
         for line in attrib_type_str.splitlines():
@@ -107,7 +108,7 @@ class GeneInfoBuilder:
         ### get seq_region_attrib file and keep list of id when second field == attrib_type_id
         seq_region_ids = []
         seq_region_attrib_url = f"{self.url}seq_region_attrib.txt.gz"
-        seq_region_attrib_r = requests.get(seq_region_attrib_url)
+        seq_region_attrib_r = fetch.get(seq_region_attrib_url, self.cache)
         seq_region_attrib_str = gzip.decompress(seq_region_attrib_r.content).decode()
         for line in seq_region_attrib_str.splitlines():
             line = line.split()
@@ -117,7 +118,7 @@ class GeneInfoBuilder:
 
         ### get seq_region file and keep list of id when second field == attrib_type_id
         seq_region_url = f"{self.url}seq_region.txt.gz"
-        seq_region_r = requests.get(seq_region_url)
+        seq_region_r = fetch.get(seq_region_url, self.cache)
         seq_region_str = gzip.decompress(seq_region_r.content).decode()
         for line in seq_region_str.splitlines():
             line = line.split()
@@ -129,7 +130,7 @@ class GeneInfoBuilder:
 
         ### get meta file and keep assembly.default
         meta_url = f"{self.url}meta.txt.gz"
-        meta_r = requests.get(meta_url)
+        meta_r = fetch.get(meta_url, self.cache)
         meta_str = gzip.decompress(meta_r.content).decode()
         for line in meta_str.splitlines():
             line = line.split()
@@ -185,7 +186,7 @@ class GeneInfoBuilder:
         GENES
         '''
         gene_url = f"{self.url}gene.txt.gz"
-        gene_r = requests.get(gene_url)
+        gene_r = fetch.get(gene_url, self.cache)
         gene_str = gzip.decompress(gene_r.content).decode()
         gene_id = {}
         gene_name = {}
@@ -225,7 +226,7 @@ class GeneInfoBuilder:
         if __name__ == "__main__": print("Get xrefs.txt, please wait...")
 
         xref_url = f"{self.url}xref.txt.gz"
-        xref_r = requests.get(xref_url)
+        xref_r = fetch.get(xref_url, self.cache)
         xref_str = gzip.decompress(xref_r.content).decode()
         for line in xref_str.splitlines():
             line = line.split()
@@ -250,7 +251,7 @@ class GeneInfoBuilder:
 
         ### EXT_SYNONYMS - get external_synonym.txt (Aliases)
         ext_synonym_url = f"{self.url}external_synonym.txt.gz"
-        ext_synonym_r = requests.get(ext_synonym_url)
+        ext_synonym_r = fetch.get(ext_synonym_url, self.cache)
         ext_synonyms_str = gzip.decompress(ext_synonym_r.content).decode()
         aliases = {}
         for line in ext_synonyms_str.splitlines():
@@ -276,7 +277,7 @@ class GeneInfoBuilder:
         if __name__ == "__main__": print("Get transcript.txt, please wait...")
 
         transcript_url = f"{self.url}transcript.txt.gz"
-        transcript_r = requests.get(transcript_url)
+        transcript_r = fetch.get(transcript_url, self.cache)
         transcript_str = gzip.decompress(transcript_r.content).decode()
         for line in transcript_str.splitlines():
             line = line.split('\t')
@@ -0,0 +1,122 @@
+# mk_genome.py
+
+import os
+import sys
+import json
+import shutil
+import struct
+import tempfile
+from array import array
+
+from color import *
+import counter
+from genome import MAGIC, VERSION, CAP, encode, genome_stamp, numpy
+
+
+BUCKET_BITS = 8             # kmers are dispatched in 256 buckets, sorted one at a time
+BUFFER_SIZE = 1 << 16       # kmers kept in memory per bucket, before writing them in the bucket file
+
+
+class ProjectedGenomeBuilder:
+    """
+    Build the projected genome (see genome.py) of a transcriptome:
+    - query the genome index with all the transcriptome sequences (one query)
+    - dispatch the canonical kmers and their counts in bucket files, according to their first bases
+    - sort and deduplicate each bucket, and write them in order in the projected genome file
+    Memory usage is limited to one bucket at a time: with numpy, a bucket is sorted as an array
+    of uint64, otherwise as a set and a list of python integers (several times larger).
+    """
+
+    def __init__(self, args, transcriptome_dict, genome, kmer_length, genome_idx):
+        """ Class initialiser """
+        self.args = args
+        self.transcriptome_dict = transcriptome_dict
+        self.genome = genome
+        self.kmer_length = kmer_length
+        self.genome_idx = genome_idx
+        self.kmer_count = 0
+        self.np = numpy()
+
+        if kmer_length > 32:
+            sys.exit(f"{ERROR}Error: projected genome needs kmers of 32 bases or less.{ENDCOL}")
+        self.tmpdir = tempfile.mkdtemp(prefix=".kmerator_", dir=os.path.dirname(genome_idx) or '.')
+        try:
+            buckets = self.dispatch()
+            self.write(buckets)
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+    def query(self):
+        """ yield (canonical kmer, count) of the transcriptome kmers in the genome """
+        try:
+            yield from counter.backend(self.genome).counts(self.genome, self.transcriptome_dict.values(),
+                                                           canonical=True)
+        except RuntimeError as e:
+            sys.exit(f"{ERROR}Error: {e.args[0]}{ENDCOL}")
+
+
+    def dispatch(self):
+        """
+        Write kmers in bucket files, as uint64: end of the kmer (without bucket bits) and count (8 bits)
+        return the list of bucket files
+        """
+        shift = 2 * self.kmer_length - BUCKET_BITS
+        mask = (1 << shift) - 1
+        buffers = [array('Q') for _ in range(1 << BUCKET_BITS)]
+        buckets = [os.path.join(self.tmpdir, f"bucket_{i}") for i in range(1 << BUCKET_BITS)]
+
+        def flush(i):
+            with open(buckets[i], 'ab') as fh:
+                buffers[i].tofile(fh)
+            del buffers[i][:]
+
+        if self.args.debug: print(f"{DEBUG}Query {os.path.basename(self.genome)!r} with the transcriptome.{ENDCOL}")
+        for mer, count in self.query():
+            code = encode(mer)
+            if code is None:
+                continue
+            i = code >> shift
+            buffers[i].append(((code & mask) << 8) | min(count, CAP))
+            if len(buffers[i]) >= BUFFER_SIZE:
+                flush(i)
+        for i in range(len(buffers)):
+            flush(i)
+        return buckets
+
+
+    def write(self, buckets):
+        """ sort buckets and write the projected genome file """
+        shift = 2 * self.kmer_length - BUCKET_BITS
+        keys_file = os.path.join(self.tmpdir, 'keys')
+        counts_file = os.path.join(self.tmpdir, 'counts')
+        with open(keys_file, 'wb') as keys_fh, open(counts_file, 'wb') as counts_fh:
+            for i, bucket in enumerate(buckets):
+                if self.np is not None:
+                    ### kmer and count in a value: the same kmer has the same count, unique values are unique kmers
+                    np = self.np
+                    values = np.unique(np.fromfile(bucket, dtype=np.uint64))
+                    ((values >> np.uint64(8)) | np.uint64(i << shift)).tofile(keys_fh)
+                    (values & np.uint64(0xFF)).astype(np.uint8).tofile(counts_fh)
+                else:
+                    values = array('Q')
+                    with open(bucket, 'rb') as fh:
+                        values.fromfile(fh, os.path.getsize(bucket) // values.itemsize)
+                    values = sorted(set(values))
+                    array('Q', ((i << shift) | (v >> 8) for v in values)).tofile(keys_fh)
+                    counts_fh.write(bytes(v & 0xFF for v in values))
+                os.remove(bucket)
+                self.kmer_count += len(values)
+
+        ### header, then kmers and counts
+        header = json.dumps({'version': VERSION, 'k': self.kmer_length, 'n': self.kmer_count,
+                             'cap': CAP, 'genome': genome_stamp(self.genome)}).encode()
+        start = len(MAGIC) + 4 + len(header)
+        temp_idx = os.path.join(self.tmpdir, 'genome.idx')
+        with open(temp_idx, 'wb') as fh:
+            fh.write(MAGIC + struct.pack('I', len(header)) + header + bytes(-start % 8))
+            for file in (keys_file, counts_file):
+                with open(file, 'rb') as part:
+                    shutil.copyfileobj(part, fh)
+        os.replace(temp_idx, self.genome_idx)
+        if self.args.debug: print(f"{DEBUG}{self.kmer_count} kmers in {os.path.basename(self.genome_idx)!r}.{ENDCOL}")
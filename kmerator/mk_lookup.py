@@ -0,0 +1,233 @@
+# mk_lookup.py
+
+import os
+import sys
+import json
+import shutil
+import struct
+import tempfile
+from array import array
+
+from color import *
+from genome import numpy
+from lookup import MAGIC, VERSION
+
+
+BUCKET_BITS = 8             # kmers are dispatched in 256 buckets, sorted one at a time
+BUFFER_SIZE = 1 << 16       # kmers kept in memory per bucket, before writing them in the bucket files
+CHUNK_SIZE = 1 << 24        # kmers dispatched at once, with numpy
+_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+
+
+def kmer_codes(seq, kmer_length):
+    """
+    2-bit encoded kmers of a sequence, on its strand, one per position (kmers with other letters
+    than ACGT are skipped)
+    """
+    mask = (1 << 2 * kmer_length) - 1
+    codes = array('Q')
+    code = size = 0
+    for base in seq:
+        base_code = _CODES.get(base)
+        if base_code is None:
+            size = 0
+            continue
+        code = ((code << 2) | base_code) & mask
+        size += 1
+        if size >= kmer_length:
+            codes.append(code)
+    return codes
+
+
+def kmer_codes_np(np, seq, kmer_length):
+    """ same as kmer_codes() with numpy: each step shifts the codes of all positions at once """
+    count = len(seq) - kmer_length + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    table = np.full(256, 4, dtype=np.uint8)
+    table[np.frombuffer(b'ACGT', dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+    bases = table[np.frombuffer(seq.encode(), dtype=np.uint8)]
+    ### kmers without other letters than ACGT: no invalid base between their ends
+    invalid = np.concatenate(([0], np.cumsum(bases > 3)))
+    valid = invalid[kmer_length:] == invalid[:-kmer_length]
+    bases = (bases & 3).astype(np.uint64)
+    codes = np.zeros(count, dtype=np.uint64)
+    for i in range(kmer_length):
+        codes <<= np.uint64(2)
+        codes |= bases[i:i+count]
+    return codes[valid]
+
+
+class LookupIndexBuilder:
+    """
+    Build the lookup index (see lookup.py) of a transcriptome:
+    - dispatch the kmers of each transcript (one per occurrence) and its index in bucket files,
+      according to their first bases
+    - sort each bucket, and write the kmers, the offsets and the transcripts of the kmers in order
+    Memory usage is limited to one bucket at a time. With numpy, kmers are encoded, dispatched
+    and sorted by arrays, otherwise one at a time (much slower on a full transcriptome).
+    """
+
+    def __init__(self, args, transcriptome_dict, kmer_length, lookup_idx):
+        """ Class initialiser """
+        self.args = args
+        self.transcriptome_dict = transcriptome_dict
+        self.kmer_length = kmer_length
+        self.lookup_idx = lookup_idx
+        self.kmer_count = 0
+        self.postings_count = 0
+        self.np = numpy()
+
+        if kmer_length > 31:
+            sys.exit(f"{ERROR}Error: lookup index needs kmers of 31 bases or less.{ENDCOL}")
+        self.tmpdir = tempfile.mkdtemp(prefix=".kmerator_", dir=os.path.dirname(lookup_idx) or '.')
+        try:
+            buckets = self.dispatch_np() if self.np is not None else self.dispatch()
+            self.write(buckets)
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+    def bucket_files(self):
+        """ bucket files (without extension): end of the kmers as uint64 (.keys), transcripts as uint32 (.ids) """
+        return [os.path.join(self.tmpdir, f"bucket_{i}") for i in range(1 << BUCKET_BITS)]
+
+
+    def dispatch(self):
+        """
+        Write kmers in bucket files: end of the kmer (without bucket bits) as uint64, and index of
+        the transcript as uint32, in two files per bucket
+        return the list of bucket files (without extension)
+        """
+        shift = 2 * self.kmer_length - BUCKET_BITS
+        mask = (1 << shift) - 1
+        keys = [array('Q') for _ in range(1 << BUCKET_BITS)]
+        ids = [array('I') for _ in range(1 << BUCKET_BITS)]
+        buckets = self.bucket_files()
+
+        def flush(i):
+            with open(f"{buckets[i]}.keys", 'ab') as fh:
+                keys[i].tofile(fh)
+            with open(f"{buckets[i]}.ids", 'ab') as fh:
+                ids[i].tofile(fh)
+            del keys[i][:]
+            del ids[i][:]
+
+        for t, seq in enumerate(self.transcriptome_dict.values()):
+            for code in kmer_codes(seq, self.kmer_length):
+                i = code >> shift
+                keys[i].append(code & mask)
+                ids[i].append(t)
+                if len(keys[i]) >= BUFFER_SIZE:
+                    flush(i)
+        for i in range(len(buckets)):
+            flush(i)
+        return buckets
+
+
+    def dispatch_np(self):
+        """ same as dispatch() with numpy: kmers of several transcripts are dispatched at once """
+        np = self.np
+        shift = np.uint64(2 * self.kmer_length - BUCKET_BITS)
+        mask = np.uint64((1 << (2 * self.kmer_length - BUCKET_BITS)) - 1)
+        buckets = self.bucket_files()
+        chunk = []
+
+        def flush():
+            codes = np.concatenate([part for part, _ in chunk])
+            ids = np.concatenate([np.full(len(part), t, dtype=np.uint32) for part, t in chunk])
+            del chunk[:]
+            ### kmers in order of bucket, the transcripts stay in order in each bucket
+            order = np.argsort(codes >> shift, kind='stable')
+            codes, ids = codes[order], ids[order]
+            bounds = np.searchsorted(codes >> shift, np.arange(len(buckets) + 1, dtype=np.uint64))
+            for i, bucket in enumerate(buckets):
+                if bounds[i] < bounds[i+1]:
+                    with open(f"{bucket}.keys", 'ab') as fh:
+                        (codes[bounds[i]:bounds[i+1]] & mask).tofile(fh)
+                    with open(f"{bucket}.ids", 'ab') as fh:
+                        ids[bounds[i]:bounds[i+1]].tofile(fh)
+
+        size = 0
+        for t, seq in enumerate(self.transcriptome_dict.values()):
+            chunk.append((kmer_codes_np(np, seq, self.kmer_length), t))
+            size += len(chunk[-1][0])
+            if size >= CHUNK_SIZE:
+                flush()
+                size = 0
+        if chunk:
+            flush()
+        return buckets
+
+
+    def sort_bucket(self, bucket, start):
+        """
+        kmers of a bucket file (start: bits of the bucket), the offsets of their transcripts, and
+        the transcripts of each kmer occurrence, in order
+        """
+        keys = array('Q')
+        ids = array('I')
+        with open(f"{bucket}.keys", 'rb') as fh:
+            keys.fromfile(fh, os.path.getsize(f"{bucket}.keys") // keys.itemsize)
+        with open(f"{bucket}.ids", 'rb') as fh:
+            ids.fromfile(fh, os.path.getsize(f"{bucket}.ids") // ids.itemsize)
+        bucket_keys = array('Q')
+        offsets = array('Q')
+        postings = array('I')
+        last = None
+        for key, t in sorted(zip(keys, ids)):
+            if key != last:
+                bucket_keys.append(start | key)
+                offsets.append(self.postings_count + len(postings))
+                last = key
+            postings.append(t)
+        return bucket_keys, offsets, postings
+
+
+    def sort_bucket_np(self, bucket, start):
+        """ same as sort_bucket() with numpy """
+        np = self.np
+        keys = np.fromfile(f"{bucket}.keys", dtype=np.uint64)
+        ids = np.fromfile(f"{bucket}.ids", dtype=np.uint32)
+        order = np.lexsort((ids, keys))
+        keys, postings = keys[order], ids[order]
+        firsts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        bucket_keys = keys[firsts] | np.uint64(start)
+        offsets = firsts.astype(np.uint64) + np.uint64(self.postings_count)
+        return bucket_keys, offsets, postings
+
+
+    def write(self, buckets):
+        """ sort buckets and write the lookup index file """
+        shift = 2 * self.kmer_length - BUCKET_BITS
+        files = [os.path.join(self.tmpdir, name) for name in ('keys', 'offsets', 'postings')]
+        with open(files[0], 'wb') as keys_fh, open(files[1], 'wb') as offsets_fh, open(files[2], 'wb') as postings_fh:
+            for i, bucket in enumerate(buckets):
+                if not os.path.exists(f"{bucket}.keys") or not os.path.getsize(f"{bucket}.keys"):
+                    continue
+                if self.np is not None:
+                    bucket_keys, offsets, postings = self.sort_bucket_np(bucket, i << shift)
+                else:
+                    bucket_keys, offsets, postings = self.sort_bucket(bucket, i << shift)
+                os.remove(f"{bucket}.keys")
+                os.remove(f"{bucket}.ids")
+                bucket_keys.tofile(keys_fh)
+                offsets.tofile(offsets_fh)
+                postings.tofile(postings_fh)
+                self.postings_count += len(postings)
+                self.kmer_count += len(bucket_keys)
+            array('Q', [self.postings_count]).tofile(offsets_fh)
+
+        ### header, then kmers, offsets and transcripts
+        header = json.dumps({'version': VERSION, 'k': self.kmer_length, 'n': self.kmer_count,
+                             'p': self.postings_count, 'transcripts': list(self.transcriptome_dict)}).encode()
+        start = len(MAGIC) + 4 + len(header)
+        temp_idx = os.path.join(self.tmpdir, 'lookup.idx')
+        with open(temp_idx, 'wb') as fh:
+            fh.write(MAGIC + struct.pack('I', len(header)) + header + bytes(-start % 8))
+            for file in files:
+                with open(file, 'rb') as part:
+                    shutil.copyfileobj(part, fh)
+        os.replace(temp_idx, self.lookup_idx)
+        if self.args.debug: print(f"{DEBUG}{self.kmer_count} kmers ({self.postings_count} kmers of "
+                                  f"transcripts) in {os.path.basename(self.lookup_idx)!r}.{ENDCOL}")
@@ -1,16 +1,15 @@
 
 import os
 import sys
-import requests
 from bs4 import BeautifulSoup
-from urllib.request import urlretrieve
 import gzip
 import pickle
 import shutil
 import tempfile
-import threading
 
 from color import *
+import counter
+import fetch
 
 
 class TranscriptomeBuilder:
@@ -28,6 +27,7 @@ class TranscriptomeBuilder:
         self.base_url = base_url
         self.report = report
         self.chr = chr
+        self.cache = getattr(args, 'download_cache', None)      # see fetch.py
         self.transcript_count = 0
 
         if self.args.debug: print(f"{DEBUG}Build transcriptome, please wait...{ENDCOL}")
@@ -43,28 +43,17 @@ class TranscriptomeBuilder:
         for item in ('cdna', 'ncrna'):
             self.build_fasta(item)
 
-        ### concatene filtered cDNA and ncRNA (and remove temp fasta files)
+        ### concatene filtered cDNA and ncRNA (and remove temp fasta files), next to the indexes
+        self.outdir = os.path.dirname(next(iter(transcriptome_jf.values())))
         transcriptome_fa = self.mk_transcriptome()
 
-        ### make index of transcriptome (kmc or jellyfish)
-        self.mk_index(transcriptome_fa, transcriptome_jf)
+        ### make index of transcriptome (kmc or jellyfish), for each kmer length
+        for kmer_length, jf in transcriptome_jf.items():
+            self.mk_index(transcriptome_fa, jf, kmer_length)
 
         ### create a pickle file of transcriptome
         self.mk_pickle(transcriptome_fa)
 
-        '''
-        ### make index of transcriptome (kmc or jellyfish)
-        th1_1 = threading.Thread(target=self.mk_index,
-                               args=(transcriptome_fa, transcriptome_jf))
-        ### create a pickle file of transcriptome
-        th1_2 = threading.Thread(target=self.mk_pickle,
-                               args=(transcriptome_jf,))
-        th1_1.start()
-        th1_2.start()
-        th1_1.join()
-        th1_2.join()
-        '''
-
         ### Add to report
         self._to_report()
 
@@ -104,9 +93,9 @@ class TranscriptomeBuilder:
         elif item == 'ncrna':
             pattern = 'ncrna.fa.gz'
         try:
-            response = requests.get(url, timeout=10)
-        except requests.exceptions.ConnectionError:
-            sys.exit("Error: unable to connect to Ensembl API.")
+            response = fetch.get(url, timeout=10)
+        except ConnectionError:
+            sys.exit(f"Error: unable to connect to {self.base_url!r}.")
         if response.ok:
             response_text = response.text
         else:
@@ -120,7 +109,7 @@ class TranscriptomeBuilder:
         gz_file = file_name.split('.')
         gz_file = f"{'.'.join(gz_file[0:2])}.{self.args.release}.{'.'.join(gz_file[2:])}"
         fasta_path = os.path.join(self.tmpdir, gz_file)
-        urlretrieve(link, fasta_path)
+        fetch.download(link, fasta_path, self.cache)
         return fasta_path
 
 
@@ -178,7 +167,7 @@ class TranscriptomeBuilder:
         specie, version, release = self.temp_fasta_files[0].split('.')[:3]
         specie = os.path.basename(specie).lower()
         transcriptome_fa = f"{specie}.{version}.{release}.transcriptome.fa"
-        transcriptome_fa = os.path.join(self.args.datadir, transcriptome_fa)
+        transcriptome_fa = os.path.join(self.outdir, transcriptome_fa)
         ### concatene cDNA and ncRNA
         if self.args.debug: print(f"{DEBUG}creating transcriptome {os.path.basename(transcriptome_fa)!r}.{ENDCOL}")
         with open(transcriptome_fa, 'w') as outfile:
@@ -195,39 +184,13 @@ class TranscriptomeBuilder:
         return transcriptome_fa
 
 
-    def mk_index(self, transcriptome_fa, transcriptome_jf):
-        """ Function doc """
-        ### Select best tool to indexing transcriptome
-        tools = ['_kmc', 'jellyfish']
-        num = None
-        for i,bin in enumerate(tools):
-            if shutil.which(bin):
-                num = i
-                break
-        if not num:
-            print(f"Warning: no tool found to index the transcriptome")
-            return None
-
-        ### Define command line according to the tool used
-        ''' in the future (python 3.10)
-        match tools[num]:
-            case 'kmc':
-                print(f"prefered tool: {os.path.basename(tool)}")
-            case 'jellyfish':
-                cmd = f"{tool} count -m self.args.kmer_length -s 100000 {transcriptome_fa} -o {transcriptome_idx}"
-        '''
-        tool = tools[num]
-        ## kmc case
-        if tool == 'kmc': print(f"prefered tool: {os.path.basename(tool)}")
-        ## jellyfish case
-        elif tool == 'jellyfish':
-            filename = os.path.basename(f"{os.path.splitext(transcriptome_fa)[0]}.jf")
-            cmd = (f"{tool} count -t {self.args.thread} -m {self.args.kmer_length} -s 100000 "
-                   f"{transcriptome_fa} -o {transcriptome_jf}")
-
-        ### Build index
-        if self.args.debug: print(f"{DEBUG}Build index with {tool!r}, please wait...{ENDCOL}")
-        ret = os.system(cmd)
+    def mk_index(self, transcriptome_fa, transcriptome_jf, kmer_length):
+        """ Build the index with the backend given by the file extension (see counter.py) """
+        backend = counter.backend(transcriptome_jf)
+        if self.args.debug: print(f"{DEBUG}Build index with {backend.name!r}, please wait...{ENDCOL}")
+        counter.count(transcriptome_fa, transcriptome_jf, kmer_length, self.args.thread,
+                      self.args.memory, debug=self.args.debug)
+        self.report.append(f"- k{kmer_length} index: {backend.name}\n")
 
 
     def mk_pickle(self, transcriptome_fa):
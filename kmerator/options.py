@@ -14,7 +14,6 @@ import sys
 import argparse
 import info
 import tempfile
-import subprocess
 
 from color import *
 
@@ -34,10 +33,20 @@ class EditConfig(argparse.Action):
         sys.exit()
 
 
-def usage(conf):
+def shard_arg(value):
+    """ '--shard i/N' as (i, N), see shard.parse() """
+    import shard
+    return shard.parse(value)
+
+
+def usage(conf, argv=None, base=None):
     """
         Help function with argument parser.
+        argv: arguments to parse (default: command line arguments)
+        base: arguments of a '--jobs' command line, argv is a request of the jobs file: the
+        options given on the command line (base.given) apply to it, unless argv gives them too
     """
+    argv = sys.argv[1:] if argv is None else argv
     parser = argparse.ArgumentParser(
         description=info.DOC,
         epilog = info.EXAMPLES,
@@ -60,7 +69,8 @@ def usage(conf):
                         help=(
                             "Use this option when yours sequences are unannonated or provided "
                             "by a annotation file external from Ensembl. Otherwise, "
-                            "use --selection option."
+                            "use --selection option. The fasta file may be compressed (gzip, "
+                            "bgzip or zstd), '-' reads it on stdin."
                             ),
                         )
     parser.add_argument('-d', '--datadir',
@@ -71,8 +81,11 @@ def usage(conf):
                         )
     parser.add_argument('-g', '--genome',
                         help=(
-                            "Genome jellyfish index (.jf) to use for k-mers requests."
+                            "Genome index to use for k-mers requests: jellyfish index (.jf) or KMC "
+                            "database (.kmc_pre). With several kmer lengths, give one index per "
+                            "kmer length, in the same order."
                             ),
+                        nargs='+',
                         required=True,
                         )
     parser.add_argument('-S', '--specie',  ### replace -a --appris in julia version
@@ -86,17 +99,24 @@ def usage(conf):
                         )
     parser.add_argument('-k', '--kmer-length',
                         type=int,
-                        help="k-mer length that you want to use (default 31).",
-                        default=31,
+                        nargs='+',
+                        help=("k-mer length that you want to use (default 31). Several lengths are "
+                              "allowed, results are then in a 'k<length>' subdirectory of the "
+                              "output directory for each of them."),
+                        default=[31],
                         )
     parser.add_argument('-r', '--release',
                         help="release of transcriptome (default: last).",
                         default="last",
                         )
-    # ~ parser.add_argument('--chimera',
-                        # ~ action='store_true',
-                        # ~ help="Only with '-f/--fasta-file' option.",
-                        # ~ )
+    parser.add_argument('--chimera',
+                        action='store_true',
+                        help=("Only with '-f/--fasta-file' option: sequences are chimeras (fusion "
+                              "transcripts), only the kmers spanning their junctions are queried. "
+                              "Breakpoints are given in the fasta headers ('>id breakpoint=120', the "
+                              "junction is after the base 120, several ones are separated by commas), "
+                              "otherwise they are detected with the transcriptome."),
+                        )
     parser.add_argument('--stringent',
                         action='store_true',
                         help=(
@@ -106,6 +126,13 @@ def usage(conf):
                             "in at least one isoform of your gene of interest."
                             ),
                         )
+    parser.add_argument('--isoforms',
+                        action='store_true',
+                        help=(
+                            "Only for genes with '-s/--selection' option: extract the specific kmers "
+                            "of each transcript of the gene, instead of the gene-specific kmers."
+                            ),
+                        )
     parser.add_argument('-T', '--max-on-transcriptome',
                         type=int,
                         help=("Only for genes with '-f/--fasta-file' option: with unanotated data, "
@@ -119,9 +146,54 @@ def usage(conf):
                         help=(
                             "Only for genes with '-f/--fasta-file' option: typically, specific "
                             "kmers are not supposed to be found more than once in the genome, you "
-                            "can change this behavior for special cases, like chimera (default: 1)"
+                            "can change this behavior for special cases (default: 1, 0 with "
+                            "'--chimera': kmers spanning a junction are absent from the genome)"
                             ),
-                        default=1 if any(set(['-f', '--fasta-file']) & set(sys.argv)) else None,
+                        default=((0 if '--chimera' in argv else 1)
+                                 if any(set(['-f', '--fasta-file']) & set(argv)) else None),
+                        )
+    parser.add_argument('--dedup-kmers',
+                        action='store_true',
+                        help=("Only with '-f/--fasta-file' option: count each distinct kmer of the "
+                              "sequences once, before extracting the specific kmers. Faster with "
+                              "redundant sequences (identical sequences are always counted once)."),
+                        )
+    parser.add_argument('--offline',
+                        action='store_true',
+                        help=("never request Ensembl: the 'last' release is the last local dataset, "
+                              "or the last release of the catalog cached in datadir. Without this "
+                              "option, Ensembl is only requested to build datasets, or when no "
+                              "local dataset is found (the catalog is kept 24 hours)."),
+                        )
+    parser.add_argument('--ensembl-url',
+                        help=("url of Ensembl, or of a local mirror with the same layout, to build "
+                              "datasets. file:// urls are allowed (default: http://ftp.ensembl.org/pub)"),
+                        default="http://ftp.ensembl.org/pub",
+                        )
+    parser.add_argument('--download-cache',
+                        help=("directory where Ensembl files are kept when building datasets, they "
+                              "are downloaded once. It can be shared by users (default: none)"),
+                        )
+    parser.add_argument('--shard',
+                        metavar="i/N",
+                        type=shard_arg,
+                        help=("split the request in N parts of the same estimated cost, and process "
+                              "only the i-th part (ex: 2/4). Each node runs one shard, in its own "
+                              "output directory, then the shards are merged with '--merge-shards'."),
+                        )
+    parser.add_argument('--table',
+                        choices=['tsv', 'parquet'],
+                        help=("also write the kmers (specific and masked) as a table, one row per "
+                              "kmer with item, ENSG, ENST, position, contig, counts in transcriptome "
+                              "and genome, fraction of isoforms and status: 'kmers.tsv.gz', or "
+                              "'kmers.parquet' (needs pyarrow). With the projected genome, a genome "
+                              "count of 255 means 255 or more (see --mk-genome-index)."),
+                        )
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help=("keep a journal of the completed items in the output directory, and "
+                              "skip them when the same request is launched again after an "
+                              "interruption (Ctrl C, kill, crash of the node)."),
                         )
     parser.add_argument('-o', '--output',
                         help="output directory, created if not exists (default: 'output')",
@@ -132,6 +204,21 @@ def usage(conf):
                         help="run n process simultaneously (default: 1)",
                         default=1,
                         )
+    parser.add_argument('--executor',
+                        choices=['auto', 'process', 'thread'],
+                        help=("run the --thread workers as processes or threads. Threads share the "
+                              "dataset without copy, and are faster when workers mostly wait for "
+                              "jellyfish queries. 'auto' uses threads with jellyfish indexes, "
+                              "processes with KMC databases, which can't be queried by threads "
+                              "(default: auto)."),
+                        default='auto',
+                        )
+    parser.add_argument('-M', '--memory',
+                        type=float,
+                        help=("memory budget to build kmer indexes (--mk-dataset, --mk-genome), in GB. "
+                              "Larger inputs are counted by parts on disk, then merged (default: 4)"),
+                        default=4,
+                        )
     parser.add_argument('--tmpdir',
                         help="directory to temporary file (default: /tmp/kmerator_<random>)",
                         default=None,
@@ -142,8 +229,7 @@ def usage(conf):
                         )
     parser.add_argument('--keep',
                         action='store_true',
-                        help=("keep intermediate files (sequences, indexes, separate kmers and "
-                            "contigs files)."
+                        help=("keep intermediate files (separate kmers and contigs files)."
                             ),
                         )
     parser.add_argument('-y', '--yes',
@@ -168,6 +254,42 @@ def usage(conf):
                         action='store_true',
                         help="make a dataset, according with --specie and --release options",
                       )
+    exclusive.add_argument('--check-dataset',
+                        action='store_true',
+                        help=("check sizes and checksums of the files of a dataset (according with "
+                              "--specie and --release options), using --thread parallel checksums."),
+                      )
+    exclusive.add_argument('--mk-genome',
+                        metavar="FASTA",
+                        help=("build the genome indexes given by --genome (one per kmer length) "
+                              "from the FASTA file of the genome (gzipped or not), using --thread "
+                              "and --memory."),
+                      )
+    exclusive.add_argument('--mk-genome-index',
+                        action='store_true',
+                        help=("build the projected genome of the dataset: counts in the genome "
+                              "index (--genome) of the transcriptome kmers only. It is loaded "
+                              "instantly and replaces the genome index with '--selection'. Rebuild "
+                              "it when the genome index changes. Genome counts are capped to 255 "
+                              "(255 means 255 or more)."),
+                      )
+    exclusive.add_argument('--mk-lookup-index',
+                        action='store_true',
+                        help=("build the lookup index of the dataset: transcripts containing each "
+                              "kmer of the transcriptome (on the strand of the transcripts, as "
+                              "kmerator), used by --lookup."),
+                      )
+    exclusive.add_argument('--lookup',
+                        nargs="+",
+                        metavar="KMER",
+                        help=("give the genes/transcripts containing each kmer, and if it is "
+                              "specific, as tsv on the standard output. Multiple kmers are allowed, "
+                              "or files of kmers ('-' for stdin), one per line or fasta (see "
+                              "--mk-lookup-index). As in kmerator, kmers are searched on the strand "
+                              "of the transcripts, the 'transcriptome' column is the count of the "
+                              "kmer in the transcriptome and the 'genome' column its canonical count "
+                              "in the genome."),
+                        )
     exclusive.add_argument('--last-avail', '--last-available',
                         action='store_true',
                         help="last release available on Ensembl",
@@ -182,6 +304,31 @@ def usage(conf):
                         help=("get some information about gene. Multiple entries are allowed or "
                               "a text file with list of genes"),
                         )
+    exclusive.add_argument('--serve',
+                        metavar="SOCKET",
+                        help=("run kmerator as a server listening on the SOCKET unix socket. Datasets "
+                              "and processes stay loaded between requests (see --server)."),
+                        )
+    exclusive.add_argument('--jobs',
+                        metavar="FILE",
+                        help=("run several requests sharing the same datasets and processes. Each "
+                              "line of FILE contains the options of a request, like "
+                              "'-s npm1 braf -o output_1 --stringent', other options of the "
+                              "command line apply to all requests (comments: '#')."),
+                        )
+    exclusive.add_argument('--merge-shards',
+                        metavar="DIR",
+                        nargs='+',
+                        help=("merge the output directories of all the shards of a request (see "
+                              "--shard) in the output directory, as a single run."),
+                        )
+    parser.add_argument('--server',
+                        metavar="SOCKET",
+                        help=("send the request (-s/--selection or -f/--fasta-file) to a kmerator "
+                              "server (see --serve), instead of loading the dataset. Its files must "
+                              "be in the working directory or in the temporary directory. Only on "
+                              "the command line."),
+                        )
     parser.add_argument('-a', '--all',
                         action='store_true',
                         help=("only with '--info' option. Give more info, like transcript sequences"),
@@ -194,6 +341,13 @@ def usage(conf):
     ### Set default values define by Config class (using ConfigParser)
     default_conf = conf.content['CMD_ARGS']
     parser.set_defaults(**default_conf)
+    ### '--server' only on the command line: from the config, every invocation would be sent
+    parser.set_defaults(server=None)
+    ### options with multiple values
+    if 'kmer_length' in default_conf:
+        parser.set_defaults(kmer_length=[int(k) for k in default_conf['kmer_length'].split()])
+    if 'genome' in default_conf:
+        parser.set_defaults(genome=default_conf['genome'].split())
     ### Reset `required` attribute when provided from config file
     for action in parser._actions:
         if action.dest in default_conf:
@@ -201,12 +355,25 @@ def usage(conf):
             ### handle booleans cause ConfigParse return a string.
             if action.__class__.__name__ == "_StoreTrueAction":
                 action.default = True if action.default.lower() in ['true', 'yes', '1', 'on'] else False
+    ### request of a jobs file: options given on the command line are its defaults
+    if base is not None:
+        given = {dest: value for dest, value in base.given.items() if dest != 'jobs'}
+        parser.set_defaults(**given)
+        for action in parser._actions:
+            if action.dest in given:
+                action.required = False
 
     ### Go to 'usage()' without arguments or stdin
-    if len(sys.argv) == 1:
+    if not argv:
         parser.print_help()
         sys.exit()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    ### '--jobs': options given on the command line, as parsed (see jobs.py)
+    if args.jobs:
+        unset = object()
+        parser.set_defaults(**dict.fromkeys(vars(args), unset))
+        args.given = {dest: value for dest, value in vars(parser.parse_args(argv)).items() if value is not unset}
 
     ### Check args
     checkup_args(args)
@@ -235,15 +402,9 @@ def checkup_args(args):
         sys.exit(f"{ERROR}Error: {args.datadir!r} not found or not a directory.{ENDCOL}")
     if not os.access(args.datadir, os.R_OK) or not os.access(args.datadir, os.X_OK):
         sys.exit(f"{ERROR}Error: insufficient rights in {args.datadir!r}.{ENDCOL}")
-    ### --fasta-file - check if query fasta file is present
-    if args.fasta_file and not os.path.isfile(args.fasta_file):
+    ### --fasta-file - check if query fasta file is present ('-' is stdin), it is checked while it is read
+    if args.fasta_file and args.fasta_file != '-' and not os.path.isfile(args.fasta_file):
         sys.exit(f"{ERROR}Error: {args.fasta_file!r} not found.{ENDCOL}")
-    ### --fasta-file - Check query fasta file extension
-    if args.fasta_file and args.fasta_file.split('.')[-1] not in ("fa", "fasta"):
-        sys.exit(f" {ERROR}Error: {os.path.basename(args.fasta_file)} " \
-                f"Does not appears to be a fasta file.{ENDCOL}")
-    if args.fasta_file:
-        check_fasta_file(args)
     ### --selection - Check Gene Select option
     if args.selection:
         for gene in args.selection:
@@ -258,6 +419,32 @@ def checkup_args(args):
                 for line in fh:
                     args.selection += line.split('#')[0].split()
 
+    ### --jobs - check if jobs file is present
+    if args.jobs and not os.path.isfile(args.jobs):
+        sys.exit(f"{ERROR}Error: {args.jobs!r} not found.{ENDCOL}")
+    ### --server - only for a request given with '--selection' or '--fasta-file'
+    if args.server and not (args.selection or args.fasta_file):
+        sys.exit(f"{ERROR}Error: '--server' needs '-s/--selection' or '-f/--fasta-file' option.{ENDCOL}")
+    ### --shard - only for a request given with '--selection' or '--fasta-file'
+    if args.shard and not (args.selection or args.fasta_file):
+        sys.exit(f"{ERROR}Error: '--shard' needs '-s/--selection' or '-f/--fasta-file' option.{ENDCOL}")
+    ### --table parquet - pyarrow is needed
+    if args.table == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            sys.exit(f"{ERROR}Error: the 'pyarrow' module is needed by '--table parquet' "
+                     f"(pip install pyarrow).{ENDCOL}")
+    ### --resume - only for a request given with '--selection' or '--fasta-file'
+    if args.resume and not (args.selection or args.fasta_file):
+        sys.exit(f"{ERROR}Error: '--resume' needs '-s/--selection' or '-f/--fasta-file' option.{ENDCOL}")
+    ### --merge-shards - indexes are not used, only shard directories are needed
+    if args.merge_shards:
+        for shard_dir in args.merge_shards:
+            if not os.path.isdir(shard_dir):
+                sys.exit(f"{ERROR}Error: {shard_dir!r} not found or not a directory.{ENDCOL}")
+        return
+
     ### args.info: define genes/transcripts provided when they are in a file
     if args.info and len(args.info) == 1 and os.path.isfile(args.info[0]):
             with open(args.info[0]) as fh:
@@ -266,31 +453,50 @@ def checkup_args(args):
                     args.info += line.split('#')[0].split()
 
 
+    ### --kmer-length/--genome - one genome index per kmer length
+    args.kmer_length = list(dict.fromkeys(args.kmer_length))
+    if len(args.genome) != len(args.kmer_length):
+        sys.exit(f"{ERROR}Error: {len(args.kmer_length)} kmer length(s) given but "
+                 f"{len(args.genome)} genome index(es), give one genome index per kmer length.{ENDCOL}")
     ### --genome - check jellifish genome
-    if not os.path.isfile(args.genome):
-        sys.exit(f"{ERROR}Error: file not found: {args.genome!r}.{ENDCOL}")
-    cmd = f"jellyfish info {args.genome}"
-    stdin = subprocess.check_output(cmd, shell=True).decode().rstrip().split('\n')
-    stdin = { i[0]:i[1].strip() for i in [raw.split(':') for raw in stdin]}
-    if not stdin['command']:            # not a jellyfish index
-        sys.exit(f"{ERROR}Error: {args.genome!r} does not appear to be a jellyfish index.\n")
-    if stdin['canonical'] == 'no':     # jellyfish index built without --canonical option
-        sys.exit(f"{ERROR}Error: the genome jellyfish index must be built with --canonical option.\n"
-                 f"{ENDCOL}From kmerator v0.9.0, it must be built with the '--canonical' option.\n"
-                 "Example to built a jellyfish index:\n"
-                 f"{YELLOW}jellyfish count /genomes/GRCh38.fa -m 31 -s 100M -t 8 --canonical "
-                 "-o GRCh38.jf")
+    ### --mk-genome - genome indexes are built, not checked
+    if args.mk_genome:
+        if not os.path.isfile(args.mk_genome):
+            sys.exit(f"{ERROR}Error: {args.mk_genome!r} not found.{ENDCOL}")
+        return
+    import counter
+    for kmer_length, genome in zip(args.kmer_length, args.genome):
+        if not counter.index_exists(genome):
+            sys.exit(f"{ERROR}Error: file not found: {genome!r}.{ENDCOL}\n"
+                     f"To build it: {YELLOW}{info.APPNAME} --mk-genome GRCh38.fa -g {genome} -t 8{ENDCOL}")
+        ### kmer length and canonical form, from the header of the index (cached in datadir)
+        error = counter.check_genome(genome, kmer_length, args.datadir)
+        if error:
+            sys.exit(f"{ERROR}Error: {error}{ENDCOL}\n"
+                     "Example to build a genome index:\n"
+                     f"{YELLOW}{info.APPNAME} --mk-genome /genomes/GRCh38.fa -k {kmer_length} -t 8 -g GRCh38.jf{ENDCOL}")
     ### --chimera level works only with --fasta-file option
-    # ~ if args.chimera and not args.fasta_file:
-        # ~ sys.exit(f"{ERROR}Error: '--chimera' needs '-f/--fasta-file' option.{ENDCOL}")
+    if args.chimera and not args.fasta_file:
+        sys.exit(f"{ERROR}Error: '--chimera' needs '-f/--fasta-file' option.{ENDCOL}")
+    if args.chimera and args.dedup_kmers:
+        sys.exit(f"{ERROR}Error: '--chimera' and '--dedup-kmers' can't be used together.{ENDCOL}")
+    ### --dedup-kmers works only with --fasta-file option
+    if args.dedup_kmers and not args.fasta_file:
+        sys.exit(f"{ERROR}Error: '--dedup-kmers' needs '-f/--fasta-file' option.{ENDCOL}")
+    ### --isoforms works only with --selection option
+    if args.isoforms and not args.selection:
+        sys.exit(f"{ERROR}Error: '--isoforms' needs '-s/--selection' option.{ENDCOL}")
     ### --max-on-genome level works only with --fasta-file option
     if args.max_on_genome and not args.fasta_file:
         sys.exit(f"{ERROR}Error: '--max-on-genome' needs '-f/--fasta-file' option.{ENDCOL}")
     ### --max-on-transcriptome level works only with --fasta-file option
     if args.max_on_transcriptome and not args.fasta_file:
         sys.exit(f"{ERROR}Error: '--max-on-transcriptome' needs '-f/--fasta-file' option.{ENDCOL}")
-    ### temporary directory
-    if not args.keep:
+    ### temporary directory, in the output directory with '--resume' to be found again
+    if args.resume and not args.keep:
+        import journal
+        args.tmpdir = os.path.join(args.output, journal.WORKDIR)
+    elif not args.keep:
         if not args.tmpdir:
             args.tmpdir = tempfile.mkdtemp(prefix="kmerator_")
         elif not os.path.isdir(args.tmpdir):
@@ -299,18 +505,3 @@ def checkup_args(args):
             args.tmpdir = tempfile.mkdtemp(prefix="kmerator_", dir=args.tmpdir)
     else:
         args.tmpdir = args.output
-
-
-def check_fasta_file(args):
-    headers = set()
-    with open(args.fasta_file) as fh:
-        nb = 1
-        for row in fh:
-            if row.startswith('>'):
-                header = row.split(' ')[0]
-                if header in headers:
-                    sys.exit(f"{ERROR}ErrorFastaFile: sequence identifier must be unique.\n"
-                                    f"    {header.rstrip()!r} is not unique (line {nb}).")
-                headers.add(header)
-            nb += 1
-    del headers
@@ -0,0 +1,167 @@
+# records.py
+
+"""
+Results of an item (specific kmers, contigs and masked kmers) as compact records.
+
+Workers don't format the fasta headers of the kmers: each kmer is a record of numbers in an
+array (kind, position, contig, counts), and the kmers are packed in a single bytes string.
+Sent back by a pool of processes, records of an item are pickled as a few buffers, instead
+of a list of strings for each kmer. Headers are formatted when the results are written or
+used (fasta(), write()).
+Contigs are ranges of consecutive kmers: their sequence is the first kmer followed by the last
+base of the next ones. write() writes the kmers as slices of the packed kmers (memoryview),
+without a string per kmer.
+"""
+
+from array import array
+
+
+### kinds of kmers, the header depends on the level and the mode
+KMER_GENE, KMER_TRANSCRIPT, KMER_FASTA = 0, 1, 2
+MASKED_GENE_TRANSCRIPTOME, MASKED_GENE_GENOME, MASKED_TRANSCRIPT, MASKED_FASTA = 3, 4, 5, 6
+SPECIFIC = (KMER_GENE, KMER_TRANSCRIPT, KMER_FASTA)
+FIELDS = 6          # kind, position, contig number, transcriptome count, genome count, isoforms with the kmer
+
+
+class Records:
+    """ Specific kmers, contigs and masked kmers of an item """
+
+    def __init__(self, item, kmer_length, isoforms_nb=None):
+        self.given = item.get('given')
+        self.given_up = (self.given or '').upper()
+        self.ENSG = item.get('ENSG')
+        self.ENST = item.get('ENST')
+        self.f_id = item.get('f_id')
+        self.level = 'gene' if item['type'] != 'transcript' else 'transcript'
+        self.kmer_length = kmer_length
+        self.isoforms_nb = isoforms_nb
+        self.kmers = array('I')             # FIELDS numbers per kmer (uint32, like KMC counters)
+        self.mers = []                      # kmers, packed as bytes when the records are sent
+        self.contigs = []                   # [(position, contig number, first kmer, last kmer)]
+        self.nb_specific = 0
+        self.nb_masked = 0
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['mers'] = self.packed()
+        return state
+
+
+    def add(self, kind, pos, contig, tr, ge, isoforms=0, mer=''):
+        self.kmers.extend((kind, pos, contig, tr, ge, isoforms))
+        self.mers.append(mer)
+        if kind in SPECIFIC:
+            self.nb_specific += 1
+        else:
+            self.nb_masked += 1
+
+
+    def add_contig(self, pos, contig, kmers):
+        """ kmers: positions of the first and last kmers of the contig (one record per position, from 1) """
+        self.contigs.append((pos, contig, *kmers))
+
+
+    def contig_seq(self, first, last):
+        """ sequence of the contig of kmers first..last, as bytes """
+        mers = self.packed()
+        k = self.kmer_length
+        return mers[(first-1)*k:first*k] + mers[first*k+k-1:last*k:k]
+
+
+    def packed(self):
+        """ kmers as a single bytes string (all kmers have the same length) """
+        if isinstance(self.mers, list):
+            self.mers = ''.join(self.mers).encode()
+        return self.mers
+
+
+    def __iter__(self):
+        """ yield (kind, position, contig number, transcriptome count, genome count, isoforms, kmer) """
+        mers = self.packed()
+        k = self.kmer_length
+        for i in range(len(self.kmers) // FIELDS):
+            yield (*self.kmers[i*FIELDS:(i+1)*FIELDS], mers[i*k:(i+1)*k].decode())
+
+
+    def header(self, kind, pos, contig, tr, ge, isoforms):
+        """ fasta header of a kmer """
+        name = f"{self.given_up}:{self.ENST}"
+        if kind == KMER_GENE:
+            return f"{name}.kmer{pos} ct:{contig} tr:{isoforms}/{self.isoforms_nb}"
+        if kind == KMER_TRANSCRIPT:
+            return f"{name}.kmer{pos} ct:{contig}"
+        if kind == KMER_FASTA:
+            return f"{self.f_id}.kmer{pos} ct:{contig}"
+        if kind == MASKED_GENE_TRANSCRIPTOME:
+            return f"{name}.kmer{pos} tr:{isoforms}/{self.isoforms_nb} transcriptome:{tr}"
+        if kind == MASKED_GENE_GENOME:
+            return f"{name}.kmer{pos} tr:{isoforms}/{self.isoforms_nb} genome:{ge}"
+        if kind == MASKED_TRANSCRIPT:
+            return f"{name}.kmer{pos} genome:{ge} transcriptome:{tr}"
+        return f"{self.f_id}.contig_{contig} genome:{ge} transcriptome:{tr}"
+
+
+    def contig_header(self, pos, contig):
+        """ fasta header of a contig """
+        if self.f_id is not None:
+            name = self.f_id
+        elif self.level == 'gene':
+            name = f"{self.given_up}:{self.ENST}"
+        else:
+            name = self.ENST
+        return f"{name}.contig_{contig} (at position {pos})"
+
+
+    def fasta(self, type):
+        """ [(header, sequence)] of 'kmers', 'contigs' or 'masked' """
+        if type == 'contigs':
+            return [(self.contig_header(pos, contig), self.contig_seq(first, last).decode())
+                    for pos, contig, first, last in self.contigs]
+        specific = type == 'kmers'
+        return [(self.header(*record[:FIELDS]), record[FIELDS])
+                for record in self if (record[0] in SPECIFIC) == specific]
+
+
+    def rows(self):
+        """
+        yield a row per kmer (see table.COLUMNS): item, ENSG, ENST, kmer, position, contig number,
+        transcriptome count, genome count, fraction of the isoforms with the kmer (genes only),
+        status ('specific' or 'masked')
+        """
+        item = self.given if self.f_id is None else self.f_id
+        for kind, pos, contig, tr, ge, isoforms, mer in self:
+            fraction = None
+            if kind in (KMER_GENE, MASKED_GENE_TRANSCRIPTOME, MASKED_GENE_GENOME):
+                fraction = round(isoforms / self.isoforms_nb, 4)
+            status = 'specific' if kind in SPECIFIC else 'masked'
+            yield item, self.ENSG, self.ENST, mer, pos, contig, tr, ge, fraction, status
+
+
+    def write(self, fh, type):
+        """ write 'kmers', 'contigs' or 'masked' as fasta in a binary file, 'table' as tsv rows """
+        if type == 'table':
+            for row in self.rows():
+                fh.write(('\t'.join('' if value is None else str(value) for value in row) + '\n').encode())
+            return
+        if type == 'contigs':
+            for pos, contig, first, last in self.contigs:
+                fh.write(f">{self.contig_header(pos, contig)}\n".encode())
+                fh.write(self.contig_seq(first, last))
+                fh.write(b'\n')
+            return
+        mers = memoryview(self.packed())
+        k = self.kmer_length
+        specific = type == 'kmers'
+        kmers = self.kmers
+        for i in range(len(kmers) // FIELDS):
+            record = kmers[i*FIELDS:(i+1)*FIELDS]
+            if (record[0] in SPECIFIC) == specific:
+                fh.write(f">{self.header(*record)}\n".encode())
+                fh.write(mers[i*k:(i+1)*k])
+                fh.write(b'\n')
+
+
+    def as_dict(self):
+        """ results as {'kmers': [(header, seq)], 'contigs': [...], 'masked': [...]} """
+        return {type: self.fasta(type) for type in ('kmers', 'contigs', 'masked')}
@@ -0,0 +1,263 @@
+# request.py
+
+"""
+Process requests on loaded datasets, and write results and report in the output directory.
+The datasets and their SpecificKmers object are kept by LoadedDatasets, so they can be reused
+for several requests (see server.py and jobs.py).
+"""
+
+import os
+import copy
+import shutil
+from datetime import datetime
+import getpass
+from argparse import Namespace
+
+import info
+from dataset import Dataset
+from kmerize import SpecificKmers, choose_executor
+from items import find_items, item_key
+from journal import Journal
+from color import *
+import shard
+import table
+
+
+class LoadedDatasets:
+    """
+    Loaded datasets with their pool of processes, one per specie/release/kmer length.
+    """
+
+    def __init__(self, thread=1, executor='auto'):
+        """ Class initialiser """
+        self.thread = thread
+        self.executor = executor
+        self.datasets = {}      # {(specie, release, kmer_length): (args, geneinfo_dict, specific_kmers)}
+        self.resolved = {}      # {(datadir, specie, release, kmer_length) as requested: key of self.datasets}
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def get(self, args):
+        """
+        Return (args, geneinfo_dict, specific_kmers) of the dataset requested by args,
+        loading it at the first request. specie, release and assembly of args are updated.
+        The dataset is looked for in datadir only at the first request of a specie/release
+        ('last' and specie aliases are resolved once).
+        Raise FileNotFoundError if the dataset is missing, RuntimeError if the executor can't
+        query its indexes (see kmerize.choose_executor).
+        """
+        requested = (args.datadir, args.specie, str(args.release), tuple(args.kmer_length))
+        key = self.resolved.get(requested)
+        if key not in self.datasets:
+            ds_args = copy.copy(args)
+            ds_args.yes = True
+            ### the key is given by the dataset: 'last' release and specie aliases are resolved
+            dataset = Dataset(ds_args)
+            key = (ds_args.specie, str(ds_args.release), tuple(ds_args.kmer_length))
+            if key not in self.datasets:
+                if not dataset.dataset_ok:
+                    raise FileNotFoundError(f"dataset not found for {ds_args.specie!r}, release "
+                                            f"{ds_args.release}, {', '.join(f'k{k}' for k in ds_args.kmer_length)} "
+                                            "(see --mk-dataset).")
+                geneinfo_dict = dataset.load_geneinfo()
+                transcriptome_dict = dataset.load_transcriptome()
+                executor = choose_executor(self.executor, args.genome + list(dataset.transcriptome_jf.values()))
+                specific_kmers = SpecificKmers(transcriptome_dict, geneinfo_dict, self.thread, executor)
+                self.datasets[key] = (ds_args, geneinfo_dict, specific_kmers)
+            self.resolved[requested] = key
+        ds_args, geneinfo_dict, specific_kmers = self.datasets[key]
+        args.specie, args.release, args.assembly = ds_args.specie, ds_args.release, ds_args.assembly
+        return self.datasets[key]
+
+
+    def close(self):
+        """ stop workers of all datasets """
+        for _, _, specific_kmers in self.datasets.values():
+            specific_kmers.close()
+        self.datasets = {}
+        self.resolved = {}
+
+
+def run_request(args, report, geneinfo_dict, specific_kmers):
+    """
+    1. find items (genes/transcripts/sequences) of the request
+    2. get specific kmers/contigs
+    3. concatene specific kmers/contigs files
+    4. write markdown report
+    """
+    ### Find transcripts according the selection
+    items = find_items(args, report, geneinfo_dict)
+
+    ### With '--shard', only items of the shard are processed (see shard.py)
+    order = None
+    if getattr(args, 'shard', None):
+        shard_report = copy.deepcopy(report)
+        shard_results = []
+        items, order = shard.select(items, args.shard, specific_kmers.transcriptome_dict, args.chimera)
+        print(f" 🧬 Shard {args.shard[0]}/{args.shard[1]}: {len(items)} items.")
+
+    ### With '--resume', items done by a previous run are skipped (see journal.py)
+    k_args = split_kmer_lengths(args)
+    jobs = [(a, items) for a in k_args]
+    run_journal = Journal(args) if getattr(args, 'resume', False) else None
+    if run_journal:
+        for i, key, type, mesg in run_journal.entries:
+            report[type].append(mesg)
+            if order is not None:
+                shard_results.append([i, *order[key], type, mesg])
+        jobs = [(a, run_journal.todo(i, items)) for i, (a, items) in enumerate(jobs)]
+        if run_journal.entries:
+            print(f" 🧬 Resume: {len(run_journal.entries)} items already done.")
+
+    ### get specific kmers (using multithreading), for all kmer lengths in the same pool
+    print(f" 🧬 Extract specific kmers, please wait..")
+    for i, item, (type, mesg, _) in specific_kmers.run_jobs(jobs):
+        mesg = kmer_length_mesg(args, k_args[i], mesg)
+        report[type].append(mesg)
+        if run_journal:
+            run_journal.add(i, item, type, mesg)
+        if order is not None:
+            shard_results.append([i, *order[item_key(item)], type, mesg])
+
+    ### Concatene results
+    print(f" 🧬 Build finals results and report")
+    for a in k_args:
+        merged_results(a)
+
+    ### set markdown report
+    markdown_report(args, report)
+    if order is not None:
+        shard.write(args, shard_report, shard_results)
+
+    ### the request is completed, its work directory is no longer needed
+    if run_journal:
+        run_journal.close(remove=True)
+        if not args.keep:
+            shutil.rmtree(args.tmpdir, ignore_errors=True)
+
+
+def split_kmer_lengths(args):
+    """
+    Return a copy of args for each kmer length, with its genome index. With several kmer
+    lengths, results of each of them are in a 'k<length>' subdirectory.
+    """
+    if len(args.kmer_length) == 1:
+        return [Namespace(**{**vars(args), 'kmer_length': args.kmer_length[0], 'genome': args.genome[0]})]
+    k_args = []
+    for k, genome in zip(args.kmer_length, args.genome):
+        k_args.append(Namespace(**{**vars(args), 'kmer_length': k, 'genome': genome,
+                                   'tmpdir': os.path.join(args.tmpdir, f"k{k}"),
+                                   'output': os.path.join(args.output, f"k{k}")}))
+    return k_args
+
+
+def kmer_length_mesg(args, k_args, mesg):
+    """ add kmer length to the message, when several kmer lengths are requested """
+    return f"k{k_args.kmer_length} - {mesg}" if len(args.kmer_length) > 1 else mesg
+
+
+def merged_results(args):
+    if getattr(args, 'table', None):
+        table.merge_parts(os.path.join(args.tmpdir, 'table'), args.output, args.table)
+    if not os.path.isdir(os.path.join(args.tmpdir, 'kmers')):
+        return None
+    for item in ['kmers', 'contigs', 'masked']:
+        try:
+            files = os.listdir(os.path.join(args.tmpdir, item))
+        except FileNotFoundError:
+            return
+        if files:
+            merged_file = os.path.join(args.output, f"{item}.fa")
+            os.makedirs(args.output, exist_ok=True)
+            with open(merged_file,'wb') as mergefd:
+                for file in files:
+                    with open(os.path.join(args.tmpdir, item, file),'rb') as fd:
+                        shutil.copyfileobj(fd, mergefd)
+
+
+def show_report(args, report):
+    ### show some final info in the prompt
+    if report['done']:
+        print(f"{CYAN}\n Done ({len(report['done'])}):")
+        for i,mesg in enumerate(report['done']):
+            if i == 15:
+                print("  - ... (more responses)")
+                break
+            print(f"  - {mesg}")
+
+    if report['multiple']:
+        print(f"{BLUE}\n Multiple responses ({len(report['multiple'])}):")
+        for i,mesg in enumerate(report['multiple']):
+            if i == 15:
+                print("  - ... (more responses)")
+                break
+            print(f"  - {mesg}")
+
+    if report['failed']:
+        print(f"{PURPLE}\n Failed ({len(report['failed'])}):")
+        for i,mesg in enumerate(report['failed']):
+            if i == 15:
+                print("  - ... (more responses)")
+                break
+            print(f"  - {mesg}")
+
+    if report['warning']:
+        print(f"{RED}\n Warning ({len(report['warning'])}):")
+        for i,mesg in enumerate(report['warning']):
+            if i == 15:
+                print("  - ... (more responses)")
+                break
+            print(f"  - {mesg}")
+
+    print(f"{ENDCOL}")
+
+
+def markdown_report(args, report):
+    sel_or_fa = 'selection' if args.selection else 'fasta_file'
+    to_report = [
+        sel_or_fa, 'datadir', 'genome', 'specie', 'kmer_length', 'release', 'stringent', 'isoforms',
+        'max_on_transcriptome', 'max_on_genome', 'chimera', 'output', 'thread', 'keep', 'assembly',
+    ]
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'report.md'), 'w') as fh:
+        fh.write('# kmerator report\n')
+        fh.write(f"*date: {datetime.now().strftime('%Y-%m-%d %H:%M')}*  \n")
+        fh.write(f'*login: {getpass.getuser()}*\n\n')
+        fh.write(f"**kmerator version:** {info.VERSION}\n\n")
+        ### report command line and args, included defaults args
+        cmd_args = ''
+        for k,v in vars(args).items():
+            if k in to_report:
+                k = k.replace('_', '-')
+                if isinstance(v, list):
+                    v = ' '.join(str(i) for i in v)
+                cmd_args += f" \\\n  --{k} {v}"
+        command = f"{info.APPNAME}{cmd_args}"
+        fh.write(f"**Command:**\n\n```\n{command}\n```\n\n")
+        fh.write(f"**Working directory:** `{os.getcwd()}`\n\n")
+        fh.write(f"**Specie:** `{args.specie}`\n\n")
+        fh.write(f"**Assembly:** `{args.assembly}`\n\n")
+        fh.write(f"**Transcriptome release:** `{args.release}`\n\n")
+        if report['done']:
+            fh.write(f"**Genes/transcripts succesfully done ({len(report['done'])})**\n\n")
+            for mesg in report['done']:
+                fh.write(f"- {mesg}\n")
+        if report['multiple']:
+            fh.write(f"\n**Multiple Genes returned for one given by Ensembl API ({len(report['multiple'])})**\n\n")
+            for mesg in report['multiple']:
+                fh.write(f"- {mesg}\n")
+        if report['failed']:
+            fh.write(f"\n\n**Genes/transcripts missing ({len(report['failed'])})**\n\n")
+            for mesg in report['failed']:
+                fh.write(f"- {mesg}\n")
+        if report['warning']:
+            fh.write(f"\n\n**Warnings ({len(report['warning'])})**\n\n")
+            for mesg in report['warning']:
+                fh.write(f"- {mesg}\n")
@@ -0,0 +1,160 @@
+# server.py
+
+"""
+Resident mode: datasets and the pool of processes stay loaded, and kmerator requests are
+answered on a Unix socket, which avoids the start-up cost of each request.
+
+  kmerator --serve /tmp/kmerator.sock -t 8            # start the server
+  kmerator -s npm1 braf --server /tmp/kmerator.sock   # send a request to the server
+
+Client sends its arguments as a json line, the server writes the results in the output
+directory of the client, like a regular run, and returns the report as a json line.
+
+The socket is only accessible to the user of the server (mode 0600), and clients of other
+users are rejected (SO_PEERCRED, on Linux). Only the options of the request are taken from
+the client (REQUEST_ARGS), the others (datadir, genome indexes...) are those of the server.
+Files of the request must be in the working directory of the client or in the temporary
+directory.
+"""
+
+import os
+import sys
+import json
+import struct
+import socket
+import socketserver
+import tempfile
+from argparse import Namespace
+
+from request import LoadedDatasets, run_request, show_report
+from color import *
+import exit
+
+
+### path arguments, sent as absolute path by the client
+PATH_ARGS = ['fasta_file', 'output', 'tmpdir']
+### options of a request, taken from the client (other options are those of the server)
+REQUEST_ARGS = ['selection', 'fasta_file', 'specie', 'release', 'kmer_length', 'chimera', 'stringent',
+                'isoforms', 'max_on_transcriptome', 'max_on_genome', 'dedup_kmers', 'shard', 'table',
+                'resume', 'output', 'tmpdir', 'keep', 'debug']
+
+
+def serve(args):
+    """ Start the server, with the dataset defined by arguments already loaded """
+    if os.path.exists(args.serve):
+        os.remove(args.serve)
+    with KmeratorServer(args) as server:
+        print(f" 🧬 Load dataset {args.release!r}.")
+        try:
+            server.datasets.get(args)
+        except (RuntimeError, FileNotFoundError) as e:
+            os.remove(args.serve)
+            sys.exit(f"{ERROR}Error: {e.args[0]}{ENDCOL}")
+        print(f" 🧬 kmerator is listening on {args.serve!r} (Ctrl C to stop).")
+        try:
+            server.serve_forever()
+        finally:
+            server.datasets.close()
+            os.remove(args.serve)
+
+
+def send_request(args):
+    """ Send request to the server and show the report """
+    if args.fasta_file == '-':
+        sys.exit(f"{ERROR}Error: the server can't read the fasta file on stdin, give its path.{ENDCOL}")
+    request = {arg: getattr(args, arg) for arg in REQUEST_ARGS}
+    for arg in PATH_ARGS:
+        if request.get(arg):
+            request[arg] = os.path.abspath(request[arg])
+    request['cwd'] = os.getcwd()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(args.server)
+            sock.sendall((json.dumps(request) + '\n').encode())
+            with sock.makefile('r') as fh:
+                response = json.loads(fh.readline() or '{"error": "no response from server"}')
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit(f"{ERROR}Error: kmerator server not found on {args.server!r}.{ENDCOL}")
+    if 'error' in response:
+        print(f"{ERROR}Error: {response['error']}{ENDCOL}")
+    else:
+        show_report(args, response['report'])
+    exit.gracefully(args)
+
+
+class KmeratorServer(socketserver.UnixStreamServer):
+    """
+    Keep loaded datasets with their pool of processes (see LoadedDatasets).
+    Requests are processed one at a time, each using all the processes of the pool.
+    """
+
+    def __init__(self, args):
+        """ Class initialiser, the socket is created with mode 0600 """
+        umask = os.umask(0o177)
+        try:
+            super().__init__(args.serve, RequestHandler)
+        finally:
+            os.umask(umask)
+        self.args = args
+        self.datasets = LoadedDatasets(args.thread, args.executor)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        report = {'failed': [], 'done': [], 'multiple': [], 'warning': []}
+        try:
+            pid = self.check_peer()
+            args = self.request_args(json.loads(self.rfile.readline()), pid)
+            _, geneinfo_dict, specific_kmers = self.server.datasets.get(args)
+            run_request(args, report, geneinfo_dict, specific_kmers)
+            response = {'report': report}
+        except (KeyError, RuntimeError, FileNotFoundError, PermissionError) as e:
+            response = {'error': str(e.args[0])}
+        except SystemExit as e:
+            response = {'error': str(e.code)}
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+    def check_peer(self):
+        """ pid of the client, which must be run by the user of the server (None without SO_PEERCRED) """
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return None
+        creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, _ = struct.unpack('3i', creds)
+        if uid != os.getuid():
+            raise PermissionError(f"requests of the user {uid} are not accepted.")
+        return pid
+
+
+    def request_args(self, request, pid):
+        """
+        args of the request: options of the server, with the options of the request given by
+        the client. Genome indexes are those of the server, for the kmer lengths of the request.
+        """
+        args = Namespace(**vars(self.server.args))
+        for arg in REQUEST_ARGS:
+            if arg in request:
+                setattr(args, arg, request[arg])
+        args.serve = None
+        genomes = dict(zip(self.server.args.kmer_length, self.server.args.genome))
+        for kmer_length in args.kmer_length:
+            if kmer_length not in genomes:
+                raise KeyError(f"the server has no genome index for k{kmer_length}.")
+        args.genome = [genomes[kmer_length] for kmer_length in args.kmer_length]
+
+        ### files of the request: in the working directory of the client, or in the temporary directory
+        cwd = request.get('cwd')
+        if pid is not None and os.path.isdir(f"/proc/{pid}"):
+            cwd = os.readlink(f"/proc/{pid}/cwd")
+        roots = [os.path.realpath(root) for root in (cwd, tempfile.gettempdir()) if root]
+        for arg in PATH_ARGS:
+            path = getattr(args, arg)
+            if not path:
+                continue
+            path = os.path.realpath(path)
+            if not os.path.isabs(getattr(args, arg)) or not any(os.path.commonpath([path, root]) == root
+                                                                  for root in roots):
+                raise PermissionError(f"{getattr(args, arg)!r} is not in the working directory of the "
+                                      "client or in the temporary directory.")
+        return args
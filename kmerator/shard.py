@@ -0,0 +1,164 @@
+# shard.py
+
+"""
+Split a large request between several nodes, then merge their results.
+
+  node 1: kmerator -s genes.txt --shard 1/3 -o shard_1
+  node 2: kmerator -s genes.txt --shard 2/3 -o shard_2
+  node 3: kmerator -s genes.txt --shard 3/3 -o shard_3
+  then:   kmerator --merge-shards shard_1 shard_2 shard_3 -o output
+
+All nodes find the same items and split them the same way: items are grouped like in the
+pool of processes (items.group_key: by gene with '--selection', by sequence with '--fasta-file',
+and by breakpoints with '--chimera'), each group has an estimated cost (length of its
+sequences), and groups are given in decreasing cost to the shard with the lowest load. Each shard writes its results as usual, plus a 'shard.json'
+file used to merge the reports in the order of a single-node run.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from argparse import Namespace
+
+from items import item_key, group_key
+from color import *
+import exit
+import table
+
+
+SHARD_FILE = 'shard.json'
+TASK_COST = 1000            # cost of a group of items, besides the length of its sequences
+
+
+def parse(value):
+    """ '--shard i/N' as (i, N), the first shard is 1 """
+    try:
+        index, count = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not like 'i/N' (ex: 2/4).")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"{value!r}: i must be between 1 and N.")
+    return index, count
+
+
+def groups(items, transcriptome_dict=None, chimera=False):
+    """
+    Items grouped as in the pool of processes, in order of first appearance:
+    [(position of the first item, [positions of the items], estimated cost)]
+    """
+    groups = {}
+    for pos, item in enumerate(items):
+        groups.setdefault(group_key(item, chimera), []).append(pos)
+    result = []
+    for positions in groups.values():
+        if 'seq' in items[positions[0]]:
+            cost = len(items[positions[0]]['seq'])
+        else:
+            transcripts = {items[pos]['ENST'] for pos in positions}
+            cost = sum(len(transcriptome_dict.get(ENST) or '') for ENST in transcripts)
+        result.append((positions[0], positions, cost + TASK_COST))
+    return result
+
+
+def select(items, shard, transcriptome_dict=None, chimera=False):
+    """
+    Items of the shard (index, count), in their order, and the position of their results in a
+    single-node run, where results are given by group, then by item:
+    {item key: (position of the group, position of the item)}
+    """
+    index, count = shard
+    loads = [0] * count
+    selected = {}
+    ### biggest groups first, each one to the lowest loaded shard (ties: first group, first shard)
+    for first, positions, cost in sorted(groups(items, transcriptome_dict, chimera), key=lambda g: (-g[2], g[0])):
+        i = loads.index(min(loads))
+        loads[i] += cost
+        if i == index - 1:
+            selected.update({pos: first for pos in positions})
+    order = {item_key(items[pos]): (first, pos) for pos, first in selected.items()}
+    return [items[pos] for pos in sorted(selected)], order
+
+
+def write(args, report, results):
+    """
+    Write the shard file in the output directory:
+      - report: messages found before the extraction of kmers (the same in all shards)
+      - results: [[kmer length index, group position, item position, type, mesg], ...]
+    """
+    shard_args = {k: v for k, v in vars(args).items() if isinstance(v, (str, int, float, bool, list, type(None)))}
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, SHARD_FILE), 'w') as fh:
+        json.dump({'shard': list(args.shard), 'args': shard_args, 'report': report,
+                   'results': results}, fh, indent=1)
+
+
+def merge(args):
+    """
+    '--merge-shards': concatene kmers/contigs/masked files of the shards in the output
+    directory, and write the report of the whole request.
+    """
+    from request import markdown_report, show_report
+
+    ### load shard files
+    shards = {}
+    for shard_dir in args.merge_shards:
+        try:
+            with open(os.path.join(shard_dir, SHARD_FILE)) as fh:
+                shard = json.load(fh)
+        except FileNotFoundError:
+            sys.exit(f"{ERROR}Error: {SHARD_FILE!r} not found in {shard_dir!r}, is it the output "
+                     f"of a kmerator run with '--shard'?{ENDCOL}")
+        index, count = shard['shard']
+        if index in shards:
+            sys.exit(f"{ERROR}Error: shard {index}/{count} given twice ({shards[index][0]!r} "
+                     f"and {shard_dir!r}).{ENDCOL}")
+        shards[index] = (shard_dir, shard)
+    counts = {shard['shard'][1] for _, shard in shards.values()}
+    if len(counts) > 1:
+        sys.exit(f"{ERROR}Error: shards of different splits (N: {', '.join(map(str, sorted(counts)))}).{ENDCOL}")
+    count = counts.pop()
+    missing = [str(i) for i in range(1, count+1) if i not in shards]
+    if missing:
+        sys.exit(f"{ERROR}Error: shard(s) {', '.join(missing)} of {count} missing.{ENDCOL}")
+    shards = [shards[i] for i in range(1, count+1)]
+
+    ### the request must be the same in all shards
+    first_args = shards[0][1]['args']
+    for shard_dir, shard in shards[1:]:
+        for key in ('selection', 'fasta_file', 'kmer_length', 'specie', 'release', 'stringent',
+                    'isoforms', 'max_on_transcriptome', 'max_on_genome', 'chimera', 'table'):
+            if shard['args'].get(key) != first_args.get(key):
+                sys.exit(f"{ERROR}Error: {shard_dir!r} is not a shard of the same request "
+                         f"(option {key.replace('_', '-')!r} differs).{ENDCOL}")
+
+    ### concatene results, in each 'k<length>' subdirectory with several kmer lengths
+    kmer_lengths = first_args['kmer_length']
+    subdirs = [f"k{k}" for k in kmer_lengths] if len(kmer_lengths) > 1 else ['']
+    for subdir in subdirs:
+        for item in ['kmers', 'contigs', 'masked']:
+            files = [os.path.join(shard_dir, subdir, f"{item}.fa") for shard_dir, _ in shards]
+            files = [file for file in files if os.path.isfile(file)]
+            if files:
+                os.makedirs(os.path.join(args.output, subdir), exist_ok=True)
+                with open(os.path.join(args.output, subdir, f"{item}.fa"), 'wb') as mergefd:
+                    for file in files:
+                        with open(file, 'rb') as fd:
+                            shutil.copyfileobj(fd, mergefd)
+        if first_args.get('table'):
+            name = table.FILES[first_args['table']]
+            files = [os.path.join(shard_dir, subdir, name) for shard_dir, _ in shards]
+            table.merge_files([file for file in files if os.path.isfile(file)],
+                              os.path.join(args.output, subdir, name), first_args['table'])
+
+    ### report, in the order of a single-node run
+    report = shards[0][1]['report']
+    results = sorted(result for _, shard in shards for result in shard['results'])
+    for *_, type, mesg in results:
+        report[type].append(mesg)
+    merged_args = Namespace(**{**first_args, 'output': args.output})
+    markdown_report(merged_args, report)
+    print(f" 🧬 {count} shards merged in {args.output!r}")
+    show_report(merged_args, report)
+    exit.gracefully(args)
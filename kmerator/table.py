@@ -0,0 +1,102 @@
+# table.py
+
+"""
+Structured output of the kmers ('--table'), besides the fasta files: one row per kmer,
+specific or masked, with the values of the fasta headers as columns.
+  - tsv: 'kmers.tsv.gz', tab separated values, gzip compressed
+  - parquet: 'kmers.parquet', columnar, zstd compressed (needs the 'pyarrow' module)
+Workers write the rows of each item in the temporary directory (tsv without header), they are
+gathered in the output directory with the fasta files.
+"""
+
+import os
+import sys
+import gzip
+import shutil
+
+from color import *
+from genome import CAP
+
+
+FORMATS = ['tsv', 'parquet']
+FILES = {'tsv': 'kmers.tsv.gz', 'parquet': 'kmers.parquet'}
+COLUMNS = ['item', 'ENSG', 'ENST', 'kmer', 'position', 'contig', 'transcriptome', 'genome',
+           'isoforms', 'status']
+BATCH_SIZE = 1 << 20            # rows per batch of the parquet file
+
+
+def pyarrow():
+    """ pyarrow modules, exit with a message when it is missing """
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit(f"{ERROR}Error: the 'pyarrow' module is needed to write parquet tables "
+                 f"(pip install pyarrow).{ENDCOL}")
+    return pyarrow
+
+
+def schema(pa):
+    """
+    types of the columns, 'isoforms' is the fraction of the isoforms with the kmer (genes). The
+    cap of the genome counts of the projected genome is given in the metadata of 'genome'.
+    """
+    genome_doc = f"count in the genome, {CAP} means {CAP} or more with the projected genome (--mk-genome-index)"
+    return pa.schema([
+        ('item', pa.string()), ('ENSG', pa.string()), ('ENST', pa.string()), ('kmer', pa.string()),
+        ('position', pa.uint32()), ('contig', pa.uint32()), ('transcriptome', pa.uint32()),
+        pa.field('genome', pa.uint32(), metadata={'description': genome_doc}),
+        ('isoforms', pa.float32()), ('status', pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+def merge_parts(part_dir, output, format):
+    """ gather the rows written by the workers in part_dir, as the table of the output directory """
+    parts = sorted(os.listdir(part_dir)) if os.path.isdir(part_dir) else []
+    os.makedirs(output, exist_ok=True)
+    if format == 'tsv':
+        with gzip.open(os.path.join(output, FILES['tsv']), 'wb', compresslevel=6) as mergefd:
+            mergefd.write(('\t'.join(COLUMNS) + '\n').encode())
+            for part in parts:
+                with open(os.path.join(part_dir, part), 'rb') as fd:
+                    shutil.copyfileobj(fd, mergefd)
+        return
+    ### parquet: parts are concatenated, then read by batches (all values are converted at once)
+    rows = os.path.join(part_dir, '.rows.tsv')
+    with open(rows, 'wb') as mergefd:
+        for part in parts:
+            with open(os.path.join(part_dir, part), 'rb') as fd:
+                shutil.copyfileobj(fd, mergefd)
+    pa = pyarrow()
+    table_schema = schema(pa)
+    reader = pa.csv.open_csv(rows,
+        read_options=pa.csv.ReadOptions(column_names=COLUMNS, block_size=BATCH_SIZE * 64),
+        parse_options=pa.csv.ParseOptions(delimiter='\t', quote_char=False),
+        convert_options=pa.csv.ConvertOptions(column_types=table_schema, strings_can_be_null=True,
+                                              null_values=['']))
+    with pa.parquet.ParquetWriter(os.path.join(output, FILES['parquet']), table_schema,
+                                  compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    os.remove(rows)
+
+
+def merge_files(files, output, format):
+    """ concatene tables of the same format (outputs of '--shard') """
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    if format == 'tsv':
+        with gzip.open(output, 'wb', compresslevel=6) as mergefd:
+            for i, file in enumerate(files):
+                with gzip.open(file, 'rb') as fd:
+                    header = fd.readline()
+                    if not i:
+                        mergefd.write(header)
+                    shutil.copyfileobj(fd, mergefd)
+        return
+    pa = pyarrow()
+    table_schema = schema(pa)
+    with pa.parquet.ParquetWriter(output, table_schema, compression='zstd') as writer:
+        for file in files:
+            for batch in pa.parquet.ParquetFile(file).iter_batches(BATCH_SIZE):
+                writer.write_batch(batch)
@@ -30,6 +30,11 @@ setuptools.setup(
     },
     include_package_data = True,
     install_requires=['bs4', 'lxml', 'requests'],
+    extras_require = {
+        'zstd': ['zstandard'],
+        'parquet': ['pyarrow'],
+        'lookup': ['numpy'],
+    },
     python_requires = ">=3.7",
     licence = "GPLv3"
 )
@@ -0,0 +1,111 @@
+# conftest.py
+
+"""
+Shared fixtures: kmerator modules are imported as in kmerator.py (from the kmerator directory),
+and a small synthetic dataset is built in a temporary datadir, without Ensembl. Indexes are
+built and queried by a stub of jellyfish (jellyfish_stub.py), put first in the PATH.
+"""
+
+import os
+import sys
+import pickle
+from argparse import Namespace
+from configparser import ConfigParser
+
+import pytest
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+KMERATOR_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'kmerator')
+sys.path.insert(0, KMERATOR_DIR)
+sys.path.insert(0, TESTS_DIR)
+
+import jellyfish_stub
+import config
+
+
+SPECIE = 'homo_sapiens'
+ASSEMBLY = 'GRCh38'
+RELEASE = 110
+KMER_LENGTH = 5
+
+### two genes, the first with two isoforms, and kmers shared by the genes ('CCGATG')
+TRANSCRIPTOME = {
+    'ENST01': 'ACGTTGCAAGGCTTACCGATGCA',
+    'ENST02': 'ACGTTGCAAGGCTTNTTTTTGGG',
+    'ENST03': 'GGATCCATTGACCGATGCATCGATT',
+}
+
+### the transcripts, and a repeat of the end of ENST01 ('GGCTTAC')
+GENOME = ('CCCC' + TRANSCRIPTOME['ENST01'] + 'AAAA' + TRANSCRIPTOME['ENST03'][::-1].translate(jellyfish_stub.REVCOMP)
+          + 'GAGA' + 'GGCTTAC' + 'AGAGA' + 'TTTTTGGG')
+
+GENEINFO = {
+    'assembly': ASSEMBLY,
+    'version': 1,
+    'gene': {
+        'ENSG01': {'symbol': 'NPM1', 'canonical': 'ENST01', 'transcript': ['ENST01', 'ENST02'],
+                   'chr': '5', 'start': 1, 'end': 100, 'strand': '+'},
+        'ENSG02': {'symbol': 'BRAF', 'canonical': 'ENST03', 'transcript': ['ENST03'],
+                   'chr': '7', 'start': 1, 'end': 100, 'strand': '-'},
+    },
+    'symbol': {'NPM1': ['ENSG01'], 'BRAF': ['ENSG02']},
+    'alias': {'B23': ['ENSG01']},
+    'transcript': {'ENST01': 'ENSG01', 'ENST02': 'ENSG01', 'ENST03': 'ENSG02'},
+}
+
+### unannotated sequences: a part of ENST01, a sequence absent from the dataset
+SEQUENCES = {
+    'seq1': 'TTTACGTTGCAGGCTTGGCCCAAAT',
+    'seq2': 'CATCATGGGTACCCAGTCAG',
+}
+
+### outputs of kmerator 2.3.4 on this dataset and these sequences
+BASELINE = os.path.join(TESTS_DIR, 'data', 'baseline')
+
+
+def records(fasta):
+    """ sorted (header, sequence) of a fasta file """
+    with open(fasta) as fh:
+        lines = fh.read().splitlines()
+    return sorted((header[1:], seq) for header, seq in zip(lines[::2], lines[1::2]))
+
+
+@pytest.fixture(autouse=True)
+def jellyfish(tmp_path_factory, monkeypatch):
+    """ the stub of jellyfish, first in the PATH """
+    bindir = tmp_path_factory.mktemp('bin')
+    with open(bindir / 'jellyfish', 'w') as fh:
+        fh.write(f"#!/bin/sh\nexec {sys.executable} {os.path.join(TESTS_DIR, 'jellyfish_stub.py')} \"$@\"\n")
+    os.chmod(bindir / 'jellyfish', 0o755)
+    monkeypatch.setenv('PATH', f"{bindir}{os.pathsep}{os.environ['PATH']}")
+
+
+@pytest.fixture
+def datadir(tmp_path):
+    """ datadir with a complete dataset (files of kmerator < 2.4, without manifest) """
+    basename = os.path.join(tmp_path, f"{SPECIE}.{ASSEMBLY}.{RELEASE}")
+    with open(f"{basename}.transcriptome.pkl", 'wb') as fh:
+        pickle.dump(TRANSCRIPTOME, fh)
+    with open(f"{basename}.geneinfo.pkl", 'wb') as fh:
+        pickle.dump(GENEINFO, fh)
+    with open(f"{basename}.report.md", 'w') as fh:
+        fh.write("# synthetic dataset\n")
+    jellyfish_stub.write_index(f"{basename}.k{KMER_LENGTH}.transcriptome.jf", TRANSCRIPTOME.values(), KMER_LENGTH)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def genome(tmp_path):
+    """ canonical genome index """
+    path = str(tmp_path / 'genome.jf')
+    jellyfish_stub.write_index(path, [GENOME], KMER_LENGTH, canonical=True, cmdline=['--canonical'])
+    return path
+
+
+@pytest.fixture
+def conf():
+    """ default configuration, without configuration file """
+    content = ConfigParser()
+    content.read_string(config.DEFAULT_CONFIG)
+    return Namespace(content=content)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""
+Stub of jellyfish, for the tests: 'count', 'query -s' and 'info' on small sequences.
+An index is a jellyfish-like header (length in digits, then json), followed by the counts of
+its kmers as json.
+"""
+
+import sys
+import json
+import argparse
+
+
+REVCOMP = str.maketrans('ACGT', 'TGCA')
+
+
+def read_fasta(path):
+    seqs = []
+    with open(path) as fh:
+        for line in fh:
+            if line.startswith('>'):
+                seqs.append('')
+            elif seqs:
+                seqs[-1] += line.strip().upper()
+    return seqs
+
+
+def kmers(seq, k, canonical):
+    for i in range(len(seq) - k + 1):
+        mer = seq[i:i+k]
+        if set(mer) <= set('ACGT'):
+            yield min(mer, mer[::-1].translate(REVCOMP)) if canonical else mer
+
+
+def write_index(path, seqs, k, canonical=False, cmdline=()):
+    """ index of the kmers of the sequences """
+    counts = {}
+    for seq in seqs:
+        for mer in kmers(seq.upper(), k, canonical):
+            counts[mer] = counts.get(mer, 0) + 1
+    header = json.dumps({'key_len': 2 * k, 'canonical': canonical, 'cmdline': ['jellyfish', 'count', *cmdline]})
+    with open(path, 'w') as fh:
+        fh.write(f"{len(header)}{header}{json.dumps(counts)}")
+
+
+def load(index):
+    with open(index) as fh:
+        content = fh.read()
+    start = content.index('{')
+    header, end = json.JSONDecoder().raw_decode(content[start:])
+    return header, json.loads(content[start+end:])
+
+
+def main():
+    command, argv = sys.argv[1], sys.argv[2:]
+    parser = argparse.ArgumentParser()
+    if command == 'count':
+        parser.add_argument('-m', type=int)
+        parser.add_argument('-s')
+        parser.add_argument('-t')
+        parser.add_argument('-o')
+        parser.add_argument('-C', '--canonical', action='store_true')
+        parser.add_argument('--disk', action='store_true')
+        parser.add_argument('files', nargs='+')
+        args = parser.parse_args(argv)
+        seqs = [seq for file in args.files for seq in read_fasta(file)]
+        write_index(args.o, seqs, args.m, args.canonical, argv)
+    elif command == 'query':
+        parser.add_argument('-s')
+        parser.add_argument('-o')
+        parser.add_argument('index')
+        args = parser.parse_args(argv)
+        header, counts = load(args.index)
+        out = open(args.o, 'w') if args.o else sys.stdout
+        for seq in read_fasta(args.s):
+            for mer in kmers(seq, header['key_len'] // 2, header['canonical']):
+                out.write(f"{mer} {counts.get(mer, 0)}\n")
+        out.close()
+    elif command == 'info':
+        header, _ = load(argv[-1])
+        print(f"command: {' '.join(header['cmdline'])}")
+        print(f"canonical: {'yes' if header['canonical'] else 'no'}")
+    else:
+        sys.exit(f"jellyfish stub: {command!r} not implemented")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# test_api.py
+
+import os
+
+import pytest
+
+import api
+from conftest import KMER_LENGTH, RELEASE, SEQUENCES, BASELINE, records
+
+
+def baseline(name, *prefixes):
+    """ {type: records} of an item in the outputs of kmerator 2.3.4 """
+    return {type: [rec for rec in records(os.path.join(BASELINE, name, f"{type}.fa"))
+                   if rec[0].split('.')[0] in prefixes] for type in ('kmers', 'contigs', 'masked')}
+
+
+@pytest.fixture
+def dataset(datadir):
+    return api.load_dataset(datadir, release=RELEASE, kmer_length=KMER_LENGTH)
+
+
+def test_selection(dataset, genome, tmp_path):
+    tmpdir = tmp_path / 'tmp'
+    tmpdir.mkdir()
+    with api.Kmerator(dataset, genome, tmpdir=str(tmpdir)) as km:
+        found = list(km.selection(['npm1', 'ENST02', 'XXX']))
+    assert [record['status'] for record in found] == ['failed', 'done', 'done']
+    assert found[0]['mesg'].startswith('XXX')
+    ### contigs of a transcript are named without the symbol
+    for record, prefixes in zip(found[1:], (['NPM1:ENST01'], ['ENST02:ENST02', 'ENST02'])):
+        assert {type: sorted(record[type]) for type in ('kmers', 'contigs', 'masked')} == baseline('selection', *prefixes)
+    assert os.listdir(tmpdir) == []
+
+
+def test_sequences(dataset, genome):
+    with api.Kmerator(dataset, genome) as km:
+        found = list(km.sequences(dict(SEQUENCES, short='ACG')))
+    assert [record['status'] for record in found] == ['failed', 'done', 'done']
+    assert found[0]['mesg'] == f"short: sequence to short (3 < {KMER_LENGTH})"
+    for record, name in zip(found[1:], SEQUENCES):
+        assert {type: sorted(record[type]) for type in ('kmers', 'contigs', 'masked')} == baseline('fasta', name)
+
+
+def test_dataset_not_found(datadir):
+    with pytest.raises(FileNotFoundError):
+        api.load_dataset(datadir, release=RELEASE + 1, kmer_length=KMER_LENGTH)
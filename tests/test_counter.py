@@ -0,0 +1,45 @@
+# test_counter.py
+
+import os
+
+import pytest
+
+import counter
+import jellyfish_stub
+from conftest import SPECIE, ASSEMBLY, RELEASE, KMER_LENGTH
+
+
+def test_check_genome(monkeypatch, datadir, genome, tmp_path):
+    """ kmer length and canonical form are read from the header of the index, then from the cache """
+    assert counter.check_genome(genome, KMER_LENGTH, datadir) is None
+    assert "kmers of 5 bases, but the kmer length is 7" in counter.check_genome(genome, KMER_LENGTH + 2, datadir)
+    transcriptome = os.path.join(datadir, f"{SPECIE}.{ASSEMBLY}.{RELEASE}.k{KMER_LENGTH}.transcriptome.jf")
+    assert "canonical form" in counter.check_genome(transcriptome, KMER_LENGTH, datadir)
+    not_index = tmp_path / 'genome.fa'
+    not_index.write_text(">chr1\nACGT\n")
+    assert "does not appear" in counter.check_genome(str(not_index), KMER_LENGTH, datadir)
+
+    ### header is read again only when the index changes
+    assert os.path.isfile(os.path.join(datadir, counter.INDEX_CACHE))
+    monkeypatch.setattr(counter.Jellyfish, 'header', staticmethod(lambda index: None))
+    assert counter.check_genome(genome, KMER_LENGTH, datadir) is None
+    os.utime(genome, (0, 0))
+    assert "does not appear" in counter.check_genome(genome, KMER_LENGTH, datadir)
+
+
+def test_count(tmp_path):
+    """ jellyfish writes a full hash on disk (--disk), its size is given by the memory budget """
+    fasta = tmp_path / 'seqs.fa'
+    fasta.write_text(">seq\nACGTTGCAAGGCTTACCGATGCA\n")
+    index = str(tmp_path / 'seqs.jf')
+    counter.count(str(fasta), index, KMER_LENGTH, memory=1, canonical=True)
+    header, _ = jellyfish_stub.load(index)
+    assert '--disk' in header['cmdline']
+    assert counter.Jellyfish.header(index) == {'k': KMER_LENGTH, 'canonical': True}
+    assert dict(counter.Jellyfish.counts(index, ['ACGTTG'], canonical=True)) == {'AACGT': 1, 'CAACG': 1}
+
+
+def test_query_error(tmp_path):
+    """ the error of jellyfish is given, from its stderr """
+    with pytest.raises(RuntimeError, match='(?s)executing jellyfish.*No such file'):
+        list(counter.Jellyfish.counts(str(tmp_path / 'missing.jf'), ['ACGTTG']))
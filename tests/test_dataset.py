@@ -0,0 +1,132 @@
+# test_dataset.py
+
+import os
+import json
+import time
+from argparse import Namespace
+
+import pytest
+
+import dataset
+from conftest import SPECIE, ASSEMBLY, RELEASE, KMER_LENGTH
+
+
+def dataset_args(datadir, **kwargs):
+    args = dict(datadir=datadir, specie='human', release='last', kmer_length=[KMER_LENGTH], list_dataset=False,
+                yes=True, keep=True, tmpdir=None, debug=False, offline=False)
+    args.update(kwargs)
+    return Namespace(**args)
+
+
+@pytest.fixture(autouse=True)
+def no_ensembl(monkeypatch):
+    """ Ensembl is never requested """
+    def request(self):
+        raise AssertionError('Ensembl requested')
+    monkeypatch.setattr(dataset.Dataset, 'get_ebl_current_release', request)
+    monkeypatch.setattr(dataset.Dataset, 'get_ebl_releases', request)
+
+
+def test_last_local(datadir):
+    """ 'last' is the last local release with the requested kmer lengths """
+    ds = dataset.Dataset(dataset_args(datadir))
+    assert (ds.args.specie, ds.args.release) == (SPECIE, str(RELEASE))
+    assert ds.dataset_ok
+
+
+def test_last_catalog(datadir):
+    """ without local dataset, 'last' is given by the catalog, whatever its age with --offline """
+    with open(os.path.join(datadir, dataset.CATALOG), 'w') as fh:
+        json.dump({'updated': time.time() - dataset.CATALOG_TTL - 1, 'releases': [110, 111],
+                   'current': {SPECIE: '111'}}, fh)
+    ds = dataset.Dataset(dataset_args(datadir, kmer_length=[KMER_LENGTH + 2], offline=True))
+    assert ds.args.release == '111'
+    assert not ds.dataset_ok
+    with pytest.raises(AssertionError, match='Ensembl requested'):
+        dataset.Dataset(dataset_args(datadir, kmer_length=[KMER_LENGTH + 2]))
+
+
+def test_check(datadir, capsys):
+    """ the manifest of a dataset built by an older version is written, then files are checked with it """
+    with pytest.raises(SystemExit) as e:
+        dataset.Dataset(dataset_args(datadir, release=str(RELEASE), thread=2)).check()
+    assert e.value.code == 0
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE), thread=2))
+    assert ds.dataset_ok and os.path.isfile(ds.manifest)
+    ### same size, other content
+    with open(ds.report_md, 'r+') as fh:
+        content = fh.read()
+        fh.seek(0)
+        fh.write(content.upper())
+    with pytest.raises(SystemExit) as e:
+        ds.check()
+    assert e.value.code == 1
+    assert f"{os.path.basename(ds.report_md)}: bad checksum" in capsys.readouterr().out
+
+
+def test_build_kmer_length(datadir):
+    """ a release found with another kmer length only gets the missing index, its manifest is kept """
+    with pytest.raises(SystemExit):
+        dataset.Dataset(dataset_args(datadir, release=str(RELEASE), thread=1)).check()
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE), kmer_length=[KMER_LENGTH + 2], thread=1,
+                                      memory=1))
+    assert not ds.dataset_ok
+    ds.build()
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE), kmer_length=[KMER_LENGTH, KMER_LENGTH + 2]))
+    assert ds.dataset_ok
+    with open(ds.manifest) as fh:
+        indexes = json.load(fh)['indexes']
+    assert sorted(indexes) == [str(KMER_LENGTH), str(KMER_LENGTH + 2)]
+
+
+def test_rename_jf(datadir, monkeypatch):
+    """ transcriptome indexes of kmerator < 2.3 are renamed with the kmer length of their header """
+    monkeypatch.setattr('builtins.input', lambda prompt: 'y')
+    basename = os.path.join(datadir, f"{SPECIE}.{ASSEMBLY}.{RELEASE}")
+    os.rename(f"{basename}.k{KMER_LENGTH}.transcriptome.jf", f"{basename}.transcriptome.jf")
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE)))
+    assert ds.dataset_ok
+    assert os.path.isfile(f"{basename}.k{KMER_LENGTH}.transcriptome.jf")
+
+
+def test_build_without_counter(datadir, monkeypatch, tmp_path):
+    """ nothing is downloaded when jellyfish and KMC are missing """
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE), kmer_length=[KMER_LENGTH + 2]))
+    with pytest.raises(SystemExit, match='jellyfish or KMC is needed'):
+        ds.build()
+
+
+def test_build_error(datadir, monkeypatch, tmp_path):
+    """ a failure of the index in the transcriptome thread stops the build, in the main thread """
+    import mk_geneinfo
+    import mk_transcriptome
+    class GeneInfoBuilder:
+        def __init__(self, args, base_url, geneinfo_pkl, report):
+            self.data = {'chr': ['1']}
+        def get_meta(self):
+            pass
+        def build(self):
+            pass
+    def mk_transcriptome_fa(builder):
+        path = os.path.join(builder.tmpdir, 'transcriptome.fa')
+        with open(path, 'w') as fh:
+            fh.write(">ENST01\nACGTTGCAAGGCTTACCGATGCA\n")
+        return path
+    monkeypatch.setattr(mk_geneinfo, 'GeneInfoBuilder', GeneInfoBuilder)
+    monkeypatch.setattr(mk_transcriptome.TranscriptomeBuilder, 'build_fasta', lambda builder, item: None)
+    monkeypatch.setattr(mk_transcriptome.TranscriptomeBuilder, 'mk_transcriptome', mk_transcriptome_fa)
+    bindir = tmp_path / 'bin'
+    bindir.mkdir()
+    (bindir / 'jellyfish').write_text("#!/bin/sh\nexit 3\n")
+    os.chmod(bindir / 'jellyfish', 0o755)
+    monkeypatch.setenv('PATH', f"{bindir}{os.pathsep}{os.environ['PATH']}")
+
+    ds = dataset.Dataset(dataset_args(datadir, release=str(RELEASE), kmer_length=[KMER_LENGTH + 2], thread=1,
+                                      memory=1))
+    ds.define_local_dataset()
+    staging = tmp_path / 'staging'
+    staging.mkdir()
+    with pytest.raises(RuntimeError, match=r"jellyfish failed to index .* \(code 3\)"):
+        ds.build_files(str(staging))
+    assert not os.path.exists(staging / os.path.basename(ds.manifest))
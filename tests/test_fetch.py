@@ -0,0 +1,65 @@
+# test_fetch.py
+
+import os
+import stat
+
+import pytest
+
+import fetch
+
+
+class HttpResponse:
+    """ streamed response of requests """
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def iter_content(self, size):
+        return (self.content[i:i+size] for i in range(0, len(self.content), size))
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """ a local mirror, with the layout of the Ensembl ftp site """
+    path = tmp_path / 'pub' / 'release-110' / 'fasta'
+    path.mkdir(parents=True)
+    (path / 'cdna.fa.gz').write_bytes(b'gzipped fasta')
+    return f"file://{tmp_path / 'pub'}"
+
+
+def test_file_url(mirror, tmp_path):
+    """ directories are listed as html links, files are used in place """
+    r = fetch.get(f"{mirror}/release-110/")
+    assert r.ok and '<a href="fasta/">fasta/</a>' in r.text
+    assert fetch.get(f"{mirror}/release-110/fasta/cdna.fa.gz").content == b'gzipped fasta'
+    assert fetch.get(f"{mirror}/release-111/").status_code == 404
+    path = fetch.download(f"{mirror}/release-110/fasta/cdna.fa.gz", str(tmp_path / 'cdna.fa.gz'))
+    assert os.path.islink(path)
+    with pytest.raises(FileNotFoundError):
+        fetch.download(f"{mirror}/release-111/fasta/cdna.fa.gz", str(tmp_path / 'missing.fa.gz'))
+
+
+def test_cache(monkeypatch, tmp_path):
+    """ gzipped files are downloaded once in the cache, other files are always requested """
+    requested = []
+    def http_get(url, **kwargs):
+        requested.append(url)
+        return HttpResponse(b'content' if 'missing' not in url else b'', 200 if 'missing' not in url else 404)
+    monkeypatch.setattr(fetch, 'http_get', http_get)
+    cache = str(tmp_path / 'cache')
+    url = "http://ftp.ensembl.org/pub/release-110/fasta/cdna.fa.gz"
+    for name in ('first', 'second'):
+        path = fetch.download(url, str(tmp_path / name), cache=cache)
+        assert os.path.realpath(path) == os.path.join(cache, 'ftp.ensembl.org', 'pub/release-110/fasta/cdna.fa.gz')
+    assert fetch.get(url, cache=cache).content == b'content'
+    assert requested == [url]
+    ### the cache is shared by a group of users
+    path = os.path.join(cache, 'ftp.ensembl.org', 'pub/release-110/fasta/cdna.fa.gz')
+    assert stat.S_IMODE(os.stat(path).st_mode) == fetch.FILE_MODE
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == fetch.DIR_MODE
+    assert stat.S_IMODE(os.stat(os.path.join(cache, 'ftp.ensembl.org')).st_mode) == fetch.DIR_MODE
+    assert fetch.get(url.replace('cdna', 'missing'), cache=cache).status_code == 404
+    assert not os.path.exists(os.path.join(cache, 'ftp.ensembl.org', 'pub/release-110/fasta/missing.fa.gz'))
+    fetch.get("http://ftp.ensembl.org/pub/current_mysql/", cache=cache)
+    assert requested[-1] == "http://ftp.ensembl.org/pub/current_mysql/"
@@ -0,0 +1,87 @@
+# test_genome.py
+
+import os
+from argparse import Namespace
+
+import pytest
+
+import genome
+import lookup
+import mk_genome
+import jellyfish_stub
+from mk_lookup import LookupIndexBuilder
+from conftest import TRANSCRIPTOME, GENOME, GENEINFO, KMER_LENGTH
+
+
+def genome_count(mer):
+    """ count of a canonical kmer in the (synthetic) genome """
+    return 1000 if mer == genome.canonical('CCATT') else len(set(mer))
+
+
+@pytest.fixture
+def genome_idx(tmp_path, monkeypatch):
+    """ projected genome of the transcriptome, the genome index is not queried """
+    def query(self):
+        ### like jellyfish, a kmer is given for each of its occurrences in the sequences
+        for seq in self.transcriptome_dict.values():
+            for i in range(len(seq) - self.kmer_length + 1):
+                mer = genome.canonical(seq[i:i+self.kmer_length])
+                if set(mer) <= set('ACGT'):
+                    yield mer, genome_count(mer)
+    monkeypatch.setattr(mk_genome.ProjectedGenomeBuilder, 'query', query)
+    genome_jf = str(tmp_path / 'genome.jf')
+    jellyfish_stub.write_index(genome_jf, [GENOME], KMER_LENGTH, canonical=True)
+    path = str(tmp_path / f"k{KMER_LENGTH}.genome.idx")
+    mk_genome.ProjectedGenomeBuilder(Namespace(debug=False), TRANSCRIPTOME, genome_jf, KMER_LENGTH, path)
+    return genome_jf, path
+
+
+def test_projected_genome(genome_idx):
+    """ kmers are sorted across the buckets, without duplicates, and counts are capped """
+    genome_jf, path = genome_idx
+    projected = genome.ProjectedGenome(path)
+    mers = {genome.canonical(seq[i:i+KMER_LENGTH]) for seq in TRANSCRIPTOME.values()
+            for i in range(len(seq) - KMER_LENGTH + 1)}
+    mers = {mer for mer in mers if set(mer) <= set('ACGT')}
+    assert list(projected.keys) == sorted(genome.encode(mer) for mer in mers)
+    assert projected.header['n'] == len(mers) and projected.header['cap'] == genome.CAP
+    assert projected.get(genome.canonical('CCATT')) == genome.CAP
+    assert projected.get(genome.canonical('ACGTT')) == 4
+    assert projected.get('CACAC') is None and projected.get('ACGNT') is None
+    counts = projected.counts([TRANSCRIPTOME['ENST03']])
+    assert counts[genome.canonical('CCATT')] == genome.CAP
+    assert all(count == min(genome_count(mer), genome.CAP) for mer, count in counts.items())
+
+
+def test_build_numpy(genome_idx, tmp_path, monkeypatch):
+    """ the projected genome built with numpy is the same as without """
+    pytest.importorskip('numpy')
+    genome_jf, path = genome_idx
+    without = str(tmp_path / 'without_numpy.idx')
+    monkeypatch.setattr(mk_genome, 'numpy', lambda: None)
+    mk_genome.ProjectedGenomeBuilder(Namespace(debug=False), TRANSCRIPTOME, genome_jf, KMER_LENGTH, without)
+    with open(path, 'rb') as fh1, open(without, 'rb') as fh2:
+        assert fh1.read() == fh2.read()
+
+
+def test_stamp(genome_idx):
+    """ the projected genome is not used when the genome index or the kmer length differ """
+    genome_jf, path = genome_idx
+    assert genome.is_usable(path, genome_jf, KMER_LENGTH)
+    assert not genome.is_usable(path, genome_jf, KMER_LENGTH + 2)
+    assert not genome.is_usable(path, genome_jf + '.missing', KMER_LENGTH)
+    with open(genome_jf, 'ab') as fh:
+        fh.write(b'rebuilt')
+    assert not genome.is_usable(path, genome_jf, KMER_LENGTH)
+
+
+def test_reverse_lookup(tmp_path, genome_idx):
+    """ genome counts of the lookup come from the projected genome """
+    genome_jf, path = genome_idx
+    lookup_idx = str(tmp_path / f"k{KMER_LENGTH}.lookup.idx")
+    LookupIndexBuilder(Namespace(debug=False), TRANSCRIPTOME, KMER_LENGTH, lookup_idx)
+    reverse = lookup.ReverseLookup(lookup_idx, GENEINFO, genome_jf, path)
+    assert reverse.projected is not None
+    results = reverse.lookup(['CCATT', 'ACGTT', 'CACAC'])
+    assert [r['genome'] for r in results] == [genome.CAP, 4, None]
+    assert [r['specific'] for r in results] == [False, False, False]
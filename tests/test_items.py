@@ -0,0 +1,51 @@
+# test_items.py
+
+import gzip
+
+import pytest
+
+import items
+
+
+def test_read_fasta(tmp_path):
+    """ sequences are joined in upper case, short ones are reported, compressed files are read """
+    fasta = tmp_path / 'seqs.fa.gz'
+    with gzip.open(fasta, 'wt') as fh:
+        fh.write(">seq1 description\nacgtAC\nGTac\n>seq2\nACG\n")
+    report = {'failed': []}
+    found = items.read_fasta(str(fasta), 5, report)
+    assert found == [{'f_id': 'seq1', 'seq': 'ACGTACGTAC', 'type': 'transcript'}]
+    assert report['failed'] == ["seq2: sequence to short (3 < 5)"]
+
+
+def test_breakpoints(tmp_path):
+    """ breakpoints of chimeras are read in the headers """
+    fasta = tmp_path / 'seqs.fa'
+    fasta.write_text(">chim1 breakpoint=3\nACGTAC\n>chim2 desc breakpoints=2,4\nACGTAC\n>seq\nACGTAC\n")
+    found = items.read_fasta(str(fasta), 5, {'failed': []})
+    assert [item.get('breakpoints') for item in found] == [[3], [2, 4], None]
+
+
+def test_zstd(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    fasta = tmp_path / 'seqs.fa.zst'
+    fasta.write_bytes(zstandard.ZstdCompressor().compress(b">seq1\nACGTACGTAC\n"))
+    assert items.read_fasta(str(fasta), 5, {'failed': []})[0]['seq'] == 'ACGTACGTAC'
+
+
+def test_not_unique(tmp_path):
+    fasta = tmp_path / 'seqs.fa'
+    fasta.write_text(">seq1\nACGTACGTAC\n>seq1\nACGTACGTAC\n")
+    with pytest.raises(SystemExit, match="'>seq1' is not unique"):
+        items.read_fasta(str(fasta), 5, {'failed': []})
+
+
+def test_group_key():
+    """ items are grouped by gene, by sequence, and by breakpoints with '--chimera' """
+    gene = {'given': 'NPM1', 'ENSG': 'ENSG01', 'ENST': 'ENST01', 'type': 'gene'}
+    chim1 = {'f_id': 'chim1', 'seq': 'ACGTAC', 'type': 'transcript', 'breakpoints': [3]}
+    chim2 = {'f_id': 'chim2', 'seq': 'ACGTAC', 'type': 'transcript'}
+    assert items.group_key(gene, chimera=True) == 'ENSG01'
+    assert items.group_key(chim1) == items.group_key(chim2) == 'ACGTAC'
+    assert items.group_key(chim1, chimera=True) == ('ACGTAC', (3,))
+    assert items.group_key(chim2, chimera=True) == ('ACGTAC', ())
@@ -0,0 +1,66 @@
+# test_jobs.py
+
+import os
+import sys
+
+import pytest
+
+import jobs
+from options import usage
+from conftest import KMER_LENGTH, RELEASE, BASELINE, records
+
+
+@pytest.fixture
+def command(monkeypatch, conf, datadir, genome):
+    """ arguments of the command line, its options are given to each job (sys.argv is not used) """
+    monkeypatch.setattr(sys, 'argv', ['kmerator', '--stringent'])
+    def command(jobs_file, *options):
+        argv = ['--jobs', str(jobs_file), '-d', datadir, '-g', genome, '-k', str(KMER_LENGTH),
+                '-r', str(RELEASE), '--tmpdir', datadir, *options]
+        return usage(conf, argv)
+    return command
+
+
+def test_get_jobs(tmp_path, conf, command):
+    jobs_file = tmp_path / 'jobs.txt'
+    jobs_file.write_text("# requests\n-s npm1 braf -o out_1\n\n-s enst03 --stringent -o out_2  # gene\n")
+    found = jobs.get_jobs(conf, command(jobs_file))
+    assert [job.selection for job in found] == [['npm1', 'braf'], ['enst03']]
+    assert [job.output for job in found] == ['out_1', 'out_2']
+    assert [job.stringent for job in found] == [False, True]
+    assert all(job.kmer_length == [KMER_LENGTH] for job in found)
+
+
+def test_job_options(tmp_path, conf, command):
+    """ options of the command line apply to each job, unless the job gives them """
+    jobs_file = tmp_path / 'jobs.txt'
+    jobs_file.write_text("-s npm1 -o out_1\n-s braf -o out_2 --executor thread\n")
+    found = jobs.get_jobs(conf, command(jobs_file, '--executor', 'process', '--stringent'))
+    assert [job.executor for job in found] == ['process', 'thread']
+    assert [job.stringent for job in found] == [True, True]
+    assert not any(job.jobs for job in found)
+    assert len({job.tmpdir for job in found}) == 2
+
+
+@pytest.mark.parametrize('line', ['-s braf -o out_2 --shard 1/2', '-s braf -o out_2 --resume',
+                                  '--merge-shards {tmp_path} -o out_2', '-s braf --server {tmp_path}/k.sock'])
+def test_unsupported(tmp_path, conf, command, line):
+    jobs_file = tmp_path / 'jobs.txt'
+    line = line.format(tmp_path=tmp_path)
+    jobs_file.write_text(f"-s npm1 -o out_1\n{line}\n")
+    option = next(opt for opt in jobs.UNSUPPORTED if opt in line)
+    with pytest.raises(SystemExit, match=f"'{option}' is not available .* line 2"):
+        jobs.get_jobs(conf, command(jobs_file))
+
+
+def test_run_jobs(tmp_path, conf, command):
+    """ each request writes its results, like a single run """
+    jobs_file = tmp_path / 'jobs.txt'
+    jobs_file.write_text(f"-s npm1 braf ENST02 b23 -o {tmp_path / 'out_1'}\n"
+                         f"-s npm1 --stringent -o {tmp_path / 'out_2'}\n")
+    with pytest.raises(SystemExit) as e:
+        jobs.run_jobs(conf, command(jobs_file))
+    assert e.value.code == 0
+    for output, baseline in (('out_1', 'selection'), ('out_2', 'stringent')):
+        for file in ('kmers.fa', 'contigs.fa', 'masked.fa'):
+            assert records(tmp_path / output / file) == records(os.path.join(BASELINE, baseline, file))
@@ -0,0 +1,42 @@
+# test_journal.py
+
+from argparse import Namespace
+
+import pytest
+
+import journal
+
+
+def request_args(tmp_path, **kwargs):
+    args = {k: None for k in journal.REQUEST_ARGS}
+    args.update(selection=['NPM1', 'BRAF'], kmer_length=[31], tmpdir=str(tmp_path / journal.WORKDIR))
+    args.update(kwargs)
+    return Namespace(**args)
+
+
+ITEMS = [{'given': 'NPM1', 'ENST': 'ENST01', 'type': 'symbol'},
+         {'given': 'BRAF', 'ENST': 'ENST03', 'type': 'symbol'}]
+
+
+def test_resume(tmp_path):
+    """ a partial last line is removed, and items of the journal are skipped """
+    args = request_args(tmp_path)
+    run = journal.Journal(args)
+    run.add(0, ITEMS[0], 'done', 'NPM1: 12 kmers')
+    run.fh.write('[0, ["BRAF", "ENST03"')          # interrupted while it was written
+    run.fh.close()
+
+    run = journal.Journal(args)
+    assert run.entries == [(0, ('NPM1', 'ENST01', None, 'symbol'), 'done', 'NPM1: 12 kmers')]
+    assert run.todo(0, ITEMS) == ITEMS[1:]
+    assert run.todo(1, ITEMS) == ITEMS          # another kmer length
+    run.add(0, ITEMS[1], 'done', 'BRAF: 3 kmers')
+    run.close()
+    with open(run.path) as fh:
+        assert len(fh.read().splitlines()) == 3     # request, NPM1, BRAF
+
+
+def test_other_request(tmp_path):
+    journal.Journal(request_args(tmp_path)).close()
+    with pytest.raises(SystemExit):
+        journal.Journal(request_args(tmp_path, stringent=True))
@@ -0,0 +1,193 @@
+# test_kmerator.py
+
+"""
+End-to-end runs of kmerator.py on the synthetic dataset (see conftest.py), with the stub of
+jellyfish. Outputs are compared to those of kmerator 2.3.4 (the order of the records of the
+merged files is not kept).
+"""
+
+import os
+import sys
+import gzip
+import subprocess
+
+import pytest
+
+from conftest import KMERATOR_DIR, KMER_LENGTH, RELEASE, TRANSCRIPTOME, SEQUENCES, BASELINE, records
+
+
+### a fusion of the start of ENST01 and of ENST03, the junction is after the base 15
+CHIMERA = TRANSCRIPTOME['ENST01'][:15] + TRANSCRIPTOME['ENST03'][5:20]
+
+
+def kmerator(*args, datadir, genome, output=None, input=None):
+    """ run kmerator, return the report when an output directory is given, else the standard output """
+    cmd = [sys.executable, os.path.join(KMERATOR_DIR, 'kmerator.py'), *args, '-d', datadir,
+           '-g', genome, '-k', str(KMER_LENGTH), '-r', str(RELEASE)]
+    proc = subprocess.run(cmd + ['-o', output] if output else cmd, cwd=datadir, env=dict(os.environ, HOME=datadir),
+                          input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert proc.returncode == 0, proc.stderr
+    if output:
+        with open(os.path.join(output, 'report.md')) as fh:
+            return fh.read()
+    return proc.stdout
+
+
+def check_outputs(output, baseline):
+    for file in ('kmers.fa', 'contigs.fa', 'masked.fa'):
+        assert records(os.path.join(output, file)) == records(os.path.join(BASELINE, baseline, file)), file
+
+
+@pytest.mark.parametrize('options', [[], ['-t', '2', '--executor', 'process'], ['-t', '2', '--executor', 'thread']])
+def test_selection(datadir, genome, tmp_path, options):
+    output = str(tmp_path / 'out')
+    report = kmerator('-s', 'npm1', 'braf', 'ENST02', 'b23', *options, datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'selection')
+    assert "- npm1: NPM1:ENST01 - kmers/contigs: 8/3 (level: gene)" in report
+    assert "- braf: BRAF:ENST03 - kmers/contigs: 9/2 (level: gene)" in report
+    assert "- ENST02: NPM1:ENST02 - kmers/contigs: 2/1 (level: transcript)" in report
+    assert "- b23: NPM1:ENST01 - kmers/contigs: 8/3 (level: gene)" in report
+
+
+def test_projected_genome(datadir, genome, tmp_path):
+    """ with the projected genome, the genome index is not queried, with the same results """
+    kmerator('--mk-genome-index', datadir=datadir, genome=genome)
+    assert any(file.endswith(f".k{KMER_LENGTH}.genome.idx") for file in os.listdir(datadir))
+    output = str(tmp_path / 'out')
+    kmerator('-s', 'npm1', 'braf', 'ENST02', 'b23', datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'selection')
+
+
+def test_resume(datadir, genome, tmp_path):
+    """ results go through the work directory and the journal, which are removed at the end """
+    output = str(tmp_path / 'out')
+    kmerator('-s', 'npm1', 'braf', 'ENST02', 'b23', '--resume', datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'selection')
+    assert not os.path.exists(os.path.join(output, '.kmerator_resume'))
+
+
+@pytest.mark.parametrize('format', ['tsv', 'parquet'])
+def test_table(datadir, genome, tmp_path, format):
+    """ the table has a row for each kmer of the fasta files """
+    output = str(tmp_path / 'out')
+    if format == 'parquet':
+        pytest.importorskip('pyarrow')
+    kmerator('-s', 'npm1', 'braf', 'ENST02', 'b23', '--table', format, datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'selection')
+    if format == 'tsv':
+        with gzip.open(os.path.join(output, 'kmers.tsv.gz'), 'rt') as fh:
+            rows = [line.split('\t') for line in fh.read().splitlines()[1:]]
+    else:
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(os.path.join(output, 'kmers.parquet'))
+        assert b'255 or more' in table.schema.field('genome').metadata[b'description']
+        columns = table.to_pydict()
+        assert columns['position'][0] > 0
+        rows = list(zip(*columns.values()))
+    for status, file in (('specific', 'kmers.fa'), ('masked', 'masked.fa')):
+        assert (sorted(row[3] for row in rows if row[9] == status)
+                == sorted(seq for _, seq in records(os.path.join(output, file))))
+
+
+def test_lookup(datadir, genome):
+    """ kmers of a kmers.fa file are found in the transcripts of their headers """
+    kmerator('--mk-lookup-index', datadir=datadir, genome=genome)
+    kmers = os.path.join(BASELINE, 'selection', 'kmers.fa')
+    lines = kmerator('--lookup', kmers, 'CACAC', datadir=datadir, genome=genome).splitlines()
+    rows = [dict(zip(lines[0].split('\t'), line.split('\t'))) for line in lines[1:]]
+    with open(kmers) as fh:
+        fasta = fh.read().splitlines()
+    assert [row['kmer'] for row in rows] == fasta[1::2] + ['CACAC']
+    for header, row in zip(fasta[::2], rows):
+        assert header.split('.')[0].split(':')[-1] in row['ENST'].split(','), (header, row)
+    assert rows[-1]['level'] == 'absent'
+
+
+def test_stringent(datadir, genome, tmp_path):
+    output = str(tmp_path / 'out')
+    report = kmerator('-s', 'npm1', '--stringent', datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'stringent')
+    assert "- npm1: NPM1:ENST01 - kmers/contigs: 6/2 (level: gene)" in report
+
+
+@pytest.mark.parametrize('options', [[], ['--dedup-kmers']])
+@pytest.mark.parametrize('soft_masked', [False, True])
+def test_fasta(datadir, genome, tmp_path, options, soft_masked):
+    """ soft-masked bases (lower case) are queried as the others """
+    fasta = tmp_path / 'seqs.fa'
+    fasta.write_text(''.join(f">{name}\n{seq[:5].lower() + seq[5:] if soft_masked else seq}\n"
+                             for name, seq in SEQUENCES.items()))
+    output = str(tmp_path / 'out')
+    report = kmerator('-f', str(fasta), *options, datadir=datadir, genome=genome, output=output)
+    check_outputs(output, 'fasta')
+    assert "- seq1 - kmers/contigs: 15/3 (level: transcript)" in report
+    assert "- seq2 - kmers/contigs: 16/1 (level: transcript)" in report
+
+
+def test_chimera(datadir, genome, tmp_path):
+    """
+    only the kmers spanning the junctions are given, absent from the genome by default ('TTACA'
+    is found once in the genome)
+    """
+    fasta = tmp_path / 'chimeras.fa'
+    fasta.write_text(f">chim1 breakpoint=15\n{CHIMERA}\n>chim2\n{CHIMERA}\n")
+    output = str(tmp_path / 'out')
+    report = kmerator('-f', str(fasta), '--chimera', datadir=datadir, genome=genome, output=output)
+    assert "- chim1 - kmers/contigs: 2/1 (level: chimera)" in report
+    assert "- chim2 - kmers/contigs: 2/1 (level: chimera)" in report
+    assert records(os.path.join(output, 'contigs.fa')) == [
+        ('chim1.contig_1 (at position 14)', 'TACATT'), ('chim2.contig_1 (at position 14)', 'TACATT')]
+    assert ('chim2.contig_1 genome:1 transcriptome:0', 'TTACA') in records(os.path.join(output, 'masked.fa'))
+
+    report = kmerator('-f', str(fasta), '--chimera', '-G', '1', datadir=datadir, genome=genome, output=output)
+    assert "- chim1 - kmers/contigs: 3/1 (level: chimera)" in report
+    assert records(os.path.join(output, 'contigs.fa')) == [
+        ('chim1.contig_1 (at position 13)', 'TTACATT'), ('chim2.contig_1 (at position 13)', 'TTACATT')]
+
+
+def test_fasta_stdin(datadir, genome, tmp_path):
+    output = str(tmp_path / 'out')
+    fasta = ''.join(f">{name}\n{seq}\n" for name, seq in SEQUENCES.items())
+    kmerator('-f', '-', datadir=datadir, genome=genome, output=output, input=fasta)
+    check_outputs(output, 'fasta')
+
+
+@pytest.mark.parametrize('request_args, baseline', [(['-s', 'npm1', 'braf', 'ENST02', 'b23'], 'selection'),
+                                                    (['-f', 'seqs.fa'], 'fasta')])
+def test_shards(datadir, genome, tmp_path, request_args, baseline):
+    """ results of the shards, merged, are the results of a single run """
+    with open(os.path.join(datadir, 'seqs.fa'), 'w') as fh:
+        fh.write(''.join(f">{name}\n{seq}\n" for name, seq in SEQUENCES.items()))
+    single = kmerator(*request_args, datadir=datadir, genome=genome, output=str(tmp_path / 'single'))
+    shards = [str(tmp_path / f"shard_{i}") for i in (1, 2)]
+    for i, shard in enumerate(shards, 1):
+        kmerator(*request_args, '--shard', f"{i}/2", datadir=datadir, genome=genome, output=shard)
+    output = str(tmp_path / 'out')
+    report = kmerator('--merge-shards', *shards, datadir=datadir, genome=genome, output=output)
+    check_outputs(output, baseline)
+    assert ([line for line in report.splitlines() if line.startswith('- ')]
+            == [line for line in single.splitlines() if line.startswith('- ')])
+
+
+def test_chimera_shards(datadir, genome, tmp_path):
+    """
+    shards of chimeras, merged, give the results of a single run: items are grouped by sequence
+    and breakpoints in the shards, as in the pool of processes
+    """
+    fasta = tmp_path / 'chimeras.fa'
+    other = TRANSCRIPTOME['ENST03'][:12] + TRANSCRIPTOME['ENST01'][10:]
+    fasta.write_text(f">chim1 breakpoint=15\n{CHIMERA}\n>chim2\n{CHIMERA}\n>chim3 breakpoint=15\n{CHIMERA}\n"
+                     f">chim4 breakpoint=12\n{other}\n")
+    request_args = ['-f', str(fasta), '--chimera']
+    single = str(tmp_path / 'single')
+    single_report = kmerator(*request_args, datadir=datadir, genome=genome, output=single)
+    shards = [str(tmp_path / f"shard_{i}") for i in (1, 2)]
+    for i, shard in enumerate(shards, 1):
+        kmerator(*request_args, '--shard', f"{i}/2", datadir=datadir, genome=genome, output=shard)
+    output = str(tmp_path / 'out')
+    report = kmerator('--merge-shards', *shards, datadir=datadir, genome=genome, output=output)
+    for file in ('kmers.fa', 'contigs.fa', 'masked.fa'):
+        assert records(os.path.join(output, file)) == records(os.path.join(single, file)), file
+    assert records(os.path.join(output, 'kmers.fa'))
+    assert ([line for line in report.splitlines() if line.startswith('- ')]
+            == [line for line in single_report.splitlines() if line.startswith('- ')])
@@ -0,0 +1,120 @@
+# test_kmerize.py
+
+import os
+from argparse import Namespace
+
+import pytest
+
+from kmerize import SpecificKmers, choose_executor
+from items import find_items
+from records import Records, KMER_FASTA
+from conftest import SPECIE, ASSEMBLY, RELEASE, KMER_LENGTH, TRANSCRIPTOME, GENEINFO, SEQUENCES
+
+
+def worker_args(datadir, genome, tmp_path, **kwargs):
+    args = dict(datadir=datadir, genome=genome, specie=SPECIE, assembly=ASSEMBLY, release=str(RELEASE),
+                kmer_length=KMER_LENGTH, fasta_file=None, stringent=False, isoforms=False,
+                max_on_transcriptome=None, max_on_genome=None, chimera=False, tmpdir=str(tmp_path), debug=False)
+    args.update(kwargs)
+    return args
+
+
+def run(args, thread=1, items=None, executor='process'):
+    """ {(given, ENST) or f_id: (type, mesg, results)} of the selection, or of the items """
+    if items is None:
+        items = find_items(Namespace(**args), {'failed': [], 'multiple': []}, GENEINFO)
+    with SpecificKmers(TRANSCRIPTOME, GENEINFO, thread, executor) as specific_kmers:
+        return {item.get('f_id') or (item['given'], item['ENST']): (type, mesg, records and records.as_dict())
+                for item, (type, mesg, records) in specific_kmers.run(args, items, to_files=False)}
+
+
+@pytest.mark.parametrize('thread, executor', [(1, 'process'), (2, 'process'), (2, 'thread')])
+def test_grouped(datadir, genome, tmp_path, thread, executor):
+    """ items of the same gene are one task, with the same results as items processed alone """
+    selection = ['npm1', 'braf', 'ENST02', 'b23', 'ENST01']
+    args = worker_args(datadir, genome, tmp_path, selection=selection)
+    items = find_items(Namespace(**args), {'failed': [], 'multiple': []}, GENEINFO)
+    groups = list(SpecificKmers(TRANSCRIPTOME, GENEINFO).group_by_gene(items))
+    assert [[item['given'] for item in group] for group, _ in groups] == [['npm1', 'ENST02', 'b23', 'ENST01'], ['braf']]
+    assert groups[0][1] == {'ENST01': TRANSCRIPTOME['ENST01'], 'ENST02': TRANSCRIPTOME['ENST02']}
+
+    grouped = run(args, thread, executor=executor)
+    assert sorted(grouped) == sorted((item['given'], item['ENST']) for item in items)
+    for given in selection:
+        alone = run(worker_args(datadir, genome, tmp_path, selection=[given]))
+        assert {key: grouped[key] for key in alone} == alone
+    assert grouped[('npm1', 'ENST01')][1] == "npm1: NPM1:ENST01 - kmers/contigs: 8/3 (level: gene)"
+
+
+def test_isoforms(datadir, genome, tmp_path):
+    """ with --isoforms, a gene gives the transcript-specific kmers of each of its transcripts """
+    isoforms = run(worker_args(datadir, genome, tmp_path, selection=['npm1'], isoforms=True))
+    transcripts = run(worker_args(datadir, genome, tmp_path, selection=['ENST01', 'ENST02']))
+    assert [ENST for _, ENST in isoforms] == ['ENST01', 'ENST02']
+    ### only the names of the gene and of the transcript differ in the headers
+    for ENST in ('ENST01', 'ENST02'):
+        assert isoforms[('npm1', ENST)][0] == 'done'
+        assert ({type: [seq for _, seq in found] for type, found in isoforms[('npm1', ENST)][2].items()}
+                == {type: [seq for _, seq in found] for type, found in transcripts[(ENST, ENST)][2].items()})
+
+
+@pytest.mark.parametrize('thread, executor', [(1, 'process'), (2, 'process'), (2, 'thread')])
+@pytest.mark.parametrize('dedup_kmers', [False, True])
+def test_fasta_file(datadir, genome, tmp_path, thread, executor, dedup_kmers):
+    """ identical sequences are processed once, and '--dedup-kmers' gives the same results """
+    items = [{'f_id': f_id, 'seq': seq, 'type': 'transcript'} for f_id, seq in SEQUENCES.items()]
+    items.append({'f_id': 'copy', 'seq': SEQUENCES['seq1'], 'type': 'transcript'})
+    args = worker_args(datadir, genome, tmp_path, selection=None, fasta_file='seqs.fa', max_on_transcriptome=0,
+                       max_on_genome=1, dedup_kmers=dedup_kmers)
+    tasks = list(SpecificKmers().fasta_tasks(dict(args, dedup_kmers=False), items))
+    assert [[item['f_id'] for item in group] for group, _, _ in tasks] == [['seq1', 'copy'], ['seq2']]
+
+    found = run(args, thread, items, executor)
+    expected = run(dict(args, dedup_kmers=False), 1, items[:2])
+    assert {f_id: found[f_id] for f_id in expected} == expected
+    assert found['copy'][1] == "copy - kmers/contigs: 15/3 (level: transcript)"
+    copy = {type: [(header.replace('seq1', 'copy'), seq) for header, seq in records]
+            for type, records in expected['seq1'][2].items()}
+    assert found['copy'][2] == copy
+
+
+def test_choose_executor(genome, tmp_path):
+    """ 'auto' uses threads with jellyfish indexes only, threads can't query KMC indexes """
+    kmc = str(tmp_path / 'transcriptome.kmc_pre')
+    assert choose_executor('auto', [genome, None]) == 'thread'
+    assert choose_executor('auto', [genome, kmc]) == 'process'
+    assert choose_executor('process', [genome]) == 'process'
+    assert choose_executor('process', [genome, kmc]) == 'process'
+    with pytest.raises(RuntimeError, match="threads can't query KMC indexes"):
+        choose_executor('thread', [genome, kmc])
+
+
+def test_chimera(datadir, genome, tmp_path):
+    """ with '--chimera', only the kmers spanning the junction are kept, as in a full run """
+    seq = TRANSCRIPTOME['ENST01'][:15] + TRANSCRIPTOME['ENST03'][5:20]
+    items = [{'f_id': 'given', 'seq': seq, 'type': 'transcript', 'breakpoints': [15]},
+             {'f_id': 'found', 'seq': seq, 'type': 'transcript'}]
+    args = worker_args(datadir, genome, tmp_path, selection=None, fasta_file='seqs.fa', max_on_transcriptome=0,
+                       max_on_genome=1, chimera=True, dedup_kmers=False)
+    tasks = list(SpecificKmers().fasta_tasks(args, items))
+    assert [[item['f_id'] for item in group] for group, _, _ in tasks] == [['given'], ['found']]
+
+    found = run(args, 1, items)
+    full = run(dict(args, chimera=False), 1, items[:1])['given'][2]
+    junction = [(header, mer) for header, mer in full['kmers']
+                if 15 - KMER_LENGTH < int(header.split('.kmer')[1].split()[0]) <= 15]
+    assert found['given'][2]['kmers'] == junction
+    assert found['given'][2]['contigs'] == full['contigs'] == [('given.contig_1 (at position 13)', 'TTACATT')]
+    ### the junction found with the transcriptome gives the same kmers
+    assert found['found'][1] == "found - kmers/contigs: 3/1 (level: chimera)"
+    assert [mer for _, mer in found['found'][2]['kmers']] == [mer for _, mer in junction]
+
+
+def test_long_name(tmp_path):
+    """ result files of long sequence ids are shortened, with their extension """
+    records = Records({'f_id': 'x' * 300, 'type': 'transcript'}, KMER_LENGTH)
+    records.add(KMER_FASTA, 1, 1, 0, 1, mer='ACGTA')
+    for type, outfile in (('kmers', f"{'x' * 300}-transcript-specific_kmers.fa"), ('table', f"{'x' * 300}-kmers.tsv")):
+        SpecificKmers().write({'tmpdir': str(tmp_path)}, outfile, records, type)
+        [written] = os.listdir(tmp_path / type)
+        assert written.endswith(os.path.splitext(outfile)[1]) and len(written) < len(outfile)
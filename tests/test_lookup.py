@@ -0,0 +1,102 @@
+# test_lookup.py
+
+import os
+from argparse import Namespace
+
+import pytest
+
+import lookup
+import genome
+import mk_lookup
+import jellyfish_stub
+from mk_lookup import LookupIndexBuilder
+from conftest import TRANSCRIPTOME, GENEINFO, KMER_LENGTH, SPECIE, ASSEMBLY, RELEASE
+
+
+def kmers_of_transcripts():
+    """
+    {kmer: [index of the transcript of each occurrence]}, on the strand of the transcripts,
+    kmers with other letters than ACGT are skipped
+    """
+    kmers = {}
+    for t, seq in enumerate(TRANSCRIPTOME.values()):
+        for i in range(len(seq) - KMER_LENGTH + 1):
+            mer = seq[i:i+KMER_LENGTH]
+            if set(mer) <= set('ACGT'):
+                kmers.setdefault(mer, []).append(t)
+    return kmers
+
+
+@pytest.fixture
+def lookup_idx(tmp_path):
+    path = str(tmp_path / f"k{KMER_LENGTH}.lookup.idx")
+    LookupIndexBuilder(Namespace(debug=False), TRANSCRIPTOME, KMER_LENGTH, path)
+    return path
+
+
+def test_index(lookup_idx):
+    """ each kmer of the transcriptome is found once, with the transcripts of its occurrences """
+    expected = kmers_of_transcripts()
+    assert lookup.is_usable(lookup_idx, KMER_LENGTH)
+    assert not lookup.is_usable(lookup_idx, KMER_LENGTH + 2)
+    index = lookup.LookupIndex(lookup_idx)
+    index.np = None
+    assert index.transcripts == list(TRANSCRIPTOME)
+    assert list(index.keys) == sorted(genome.encode(mer) for mer in expected)
+    mers = list(expected)
+    positions = index.find(index.encode(mers))
+    assert {mer: list(index.postings(pos)) for mer, pos in zip(mers, positions)} == expected
+    ### reverse complement (of 'ACGTT'), absent and invalid kmers
+    mers = ['AACGT', 'CACAC', 'ACGNT', 'ACG']
+    codes = index.encode(mers)
+    assert codes[0] == genome.encode('AACGT') and codes[2:] == [-1, -1]
+    assert index.encode(['ACGTT'], canonical=True) == [genome.encode('AACGT')]
+    assert index.find(codes) == [-1, -1, -1, -1]
+
+
+def test_build_numpy(lookup_idx, tmp_path, monkeypatch):
+    """ the index built with numpy is the same as without """
+    pytest.importorskip('numpy')
+    path = str(tmp_path / 'without_numpy.idx')
+    monkeypatch.setattr(mk_lookup, 'numpy', lambda: None)
+    LookupIndexBuilder(Namespace(debug=False), TRANSCRIPTOME, KMER_LENGTH, path)
+    with open(lookup_idx, 'rb') as fh1, open(path, 'rb') as fh2:
+        assert fh1.read() == fh2.read()
+
+
+def test_transcriptome_counts(lookup_idx, datadir):
+    """ transcriptome counts are those of the transcriptome index queried by kmerator """
+    index = f"{SPECIE}.{ASSEMBLY}.{RELEASE}.k{KMER_LENGTH}.transcriptome.jf"
+    _, counts = jellyfish_stub.load(os.path.join(datadir, index))
+    reverse = lookup.ReverseLookup(lookup_idx, GENEINFO)
+    mers = list(counts) + [mer[::-1].translate(jellyfish_stub.REVCOMP) for mer in counts]
+    found = {r['kmer']: r['transcriptome'] for r in reverse.lookup(mers)}
+    assert found == {mer: counts.get(mer, 0) for mer in mers}
+
+
+def test_numpy(lookup_idx):
+    """ batches encoded and searched with numpy are the same as one kmer at a time """
+    pytest.importorskip('numpy')
+    mers = list(kmers_of_transcripts()) + ['TGCAT', 'CACAC', 'ACGNT', 'GGGGG']
+    index = lookup.LookupIndex(lookup_idx)
+    codes = index.encode(mers)
+    positions = index.find(codes)
+    canonical = index.encode(mers, canonical=True)
+    index.np = None
+    assert codes.tolist() == index.encode(mers)
+    assert canonical.tolist() == index.encode(mers, canonical=True)
+    assert positions.tolist() == index.find(index.encode(mers))
+
+
+def test_reverse_lookup(lookup_idx):
+    reverse = lookup.ReverseLookup(lookup_idx, GENEINFO)
+    results = reverse.lookup(['ccatt', 'ACGTT', 'CCGAT', 'CACAC', 'ACGNT'])
+    assert [r['kmer'] for r in results] == ['CCATT', 'ACGTT', 'CCGAT', 'CACAC', 'ACGNT']
+    assert [r['level'] for r in results] == ['transcript', 'gene', 'genes', 'absent', 'invalid']
+    assert [r['specific'] for r in results] == [True, True, False, False, False]
+    assert [r['transcriptome'] for r in results] == [1, 2, 2, 0, 0]
+    assert results[0]['ENST'] == ['ENST03'] and results[0]['symbol'] == ['BRAF']
+    assert results[1]['ENSG'] == ['ENSG01'] and results[1]['ENST'] == ['ENST01', 'ENST02']
+    assert results[2]['symbol'] == ['NPM1', 'BRAF']
+    assert all(r['genome'] is None for r in results)
+    assert list(results[0]) == lookup.COLUMNS
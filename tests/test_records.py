@@ -0,0 +1,134 @@
+# test_records.py
+
+"""
+Records of an item (records.py) give the same fasta as the lists of (header, sequence) built by
+get_specific_kmers() before the records, and the same kmers as rows of the table.
+"""
+
+import io
+import gzip
+import pickle
+
+import pytest
+
+import genome
+import table
+from kmerize import SpecificKmers
+from records import Records, KMER_GENE, MASKED_GENE_GENOME
+from conftest import TRANSCRIPTOME, KMER_LENGTH
+
+
+ARGS = {'kmer_length': KMER_LENGTH, 'to_files': False, 'table': None, 'debug': False, 'chimera': False,
+        'stringent': False, 'max_on_transcriptome': 0, 'max_on_genome': 1, 'dedup_kmers': False}
+
+GENE_ITEM = {'given': 'npm1', 'ENSG': 'ENSG01', 'ENST': 'ENST01', 'type': 'symbol', 'symbol': 'NPM1'}
+GENE_FASTA = {
+    'kmers': [('NPM1:ENST01.kmer1 ct:1 tr:2/2', 'ACGTT'), ('NPM1:ENST01.kmer2 ct:1 tr:2/2', 'CGTTG'),
+              ('NPM1:ENST01.kmer3 ct:1 tr:2/2', 'GTTGC'), ('NPM1:ENST01.kmer4 ct:1 tr:2/2', 'TTGCA'),
+              ('NPM1:ENST01.kmer5 ct:1 tr:2/2', 'TGCAA'), ('NPM1:ENST01.kmer6 ct:1 tr:2/2', 'GCAAG'),
+              ('NPM1:ENST01.kmer7 ct:1 tr:2/2', 'CAAGG'), ('NPM1:ENST01.kmer8 ct:1 tr:2/2', 'AAGGC'),
+              ('NPM1:ENST01.kmer9 ct:1 tr:2/2', 'AGGCT'), ('NPM1:ENST01.kmer11 ct:2 tr:1/2', 'GCTTA'),
+              ('NPM1:ENST01.kmer12 ct:2 tr:1/2', 'CTTAC'), ('NPM1:ENST01.kmer13 ct:2 tr:1/2', 'TTACC'),
+              ('NPM1:ENST01.kmer14 ct:2 tr:1/2', 'TACCG')],
+    'contigs': [('NPM1:ENST01.contig_1 (at position 1)', 'ACGTTGCAAGGCT'),
+                ('NPM1:ENST01.contig_2 (at position 11)', 'GCTTACCG')],
+    'masked': [('NPM1:ENST01.kmer10 tr:2/2 genome:3', 'GGCTT'),
+               ('NPM1:ENST01.kmer15 tr:1/2 transcriptome:2', 'ACCGA'),
+               ('NPM1:ENST01.kmer16 tr:1/2 transcriptome:2', 'CCGAT'),
+               ('NPM1:ENST01.kmer17 tr:1/2 transcriptome:2', 'CGATG'),
+               ('NPM1:ENST01.kmer18 tr:1/2 transcriptome:2', 'GATGC'),
+               ('NPM1:ENST01.kmer19 tr:1/2 transcriptome:2', 'ATGCA')],
+}
+
+FASTA_ITEM = {'f_id': 'seq1', 'seq': 'TTTACGTTGCAGGCTTGGCCCAAAT', 'type': 'transcript'}
+FASTA_FASTA = {
+    'kmers': [('seq1.kmer1 ct:1', 'TTTAC'), ('seq1.kmer2 ct:1', 'TTACG'), ('seq1.kmer3 ct:1', 'TACGT'),
+              ('seq1.kmer8 ct:2', 'TGCAG'), ('seq1.kmer9 ct:2', 'GCAGG'), ('seq1.kmer10 ct:2', 'CAGGC'),
+              ('seq1.kmer13 ct:3', 'GCTTG'), ('seq1.kmer14 ct:3', 'CTTGG'), ('seq1.kmer15 ct:3', 'TTGGC'),
+              ('seq1.kmer16 ct:3', 'TGGCC'), ('seq1.kmer17 ct:3', 'GGCCC'), ('seq1.kmer18 ct:3', 'GCCCA'),
+              ('seq1.kmer19 ct:3', 'CCCAA'), ('seq1.kmer20 ct:3', 'CCAAA'), ('seq1.kmer21 ct:3', 'CAAAT')],
+    'contigs': [('seq1.contig_1 (at position 1)', 'TTTACGT'), ('seq1.contig_2 (at position 8)', 'TGCAGGC'),
+                ('seq1.contig_3 (at position 13)', 'GCTTGGCCCAAAT')],
+    'masked': [('seq1.contig_1 genome:1 transcriptome:2', 'ACGTT'),
+               ('seq1.contig_1 genome:1 transcriptome:2', 'CGTTG'),
+               ('seq1.contig_1 genome:1 transcriptome:2', 'GTTGC'),
+               ('seq1.contig_1 genome:1 transcriptome:2', 'TTGCA'),
+               ('seq1.contig_2 genome:1 transcriptome:2', 'AGGCT'),
+               ('seq1.contig_2 genome:3 transcriptome:2', 'GGCTT')],
+}
+
+
+def counts(seq):
+    """ counts of the kmers of the sequence in the transcriptome and in the genome ('GGCTT' is repeated) """
+    mers = list(dict.fromkeys(seq[i:i+KMER_LENGTH] for i in range(len(seq) - KMER_LENGTH + 1)))
+    tr_counts = {mer: sum(s.count(mer) for s in TRANSCRIPTOME.values()) for mer in mers}
+    ge_counts = {genome.canonical(mer): 3 if mer == 'GGCTT' else 1 for mer in mers}
+    return tr_counts, ge_counts
+
+
+def gene_records():
+    specific_kmers = SpecificKmers()
+    isoforms = {'nb': 2, 'kmers': specific_kmers.isoforms_kmers(
+        {ENST: TRANSCRIPTOME[ENST] for ENST in ('ENST01', 'ENST02')}, KMER_LENGTH)}
+    args = dict(ARGS, selection=['npm1'], fasta_file=None)
+    type, mesg, records = specific_kmers.get_specific_kmers(args, GENE_ITEM, *counts(TRANSCRIPTOME['ENST01']), isoforms)
+    assert (type, mesg) == ('done', 'npm1: NPM1:ENST01 - kmers/contigs: 13/2 (level: gene)')
+    return records
+
+
+def fasta_records():
+    args = dict(ARGS, selection=None, fasta_file='seqs.fa')
+    type, mesg, records = SpecificKmers().get_specific_kmers(args, FASTA_ITEM, *counts(FASTA_ITEM['seq']))
+    assert (type, mesg) == ('done', 'seq1 - kmers/contigs: 15/3 (level: transcript)')
+    return records
+
+
+@pytest.mark.parametrize('records, expected', [(gene_records, GENE_FASTA), (fasta_records, FASTA_FASTA)])
+def test_fasta(records, expected):
+    """ fasta of the records, sent by a worker (pickled) or not, and written in a file """
+    records = records()
+    assert records.as_dict() == expected
+    sent = pickle.loads(pickle.dumps(records))
+    assert isinstance(sent.mers, bytes)
+    assert sent.as_dict() == expected
+    for type, fasta in expected.items():
+        fh = io.BytesIO()
+        sent.write(fh, type)
+        assert fh.getvalue().decode() == ''.join(f">{header}\n{seq}\n" for header, seq in fasta)
+
+
+def test_rows():
+    records = gene_records()
+    rows = list(records.rows())
+    assert len(rows) == len(GENE_FASTA['kmers']) + len(GENE_FASTA['masked'])
+    assert [row[3] for row in rows if row[9] == 'specific'] == [seq for _, seq in GENE_FASTA['kmers']]
+    assert rows[0] == ('npm1', 'ENSG01', 'ENST01', 'ACGTT', 1, 1, 2, 1, 1.0, 'specific')
+    assert rows[9] == ('npm1', 'ENSG01', 'ENST01', 'GGCTT', 10, 1, 2, 3, 1.0, 'masked')
+    assert rows[10] == ('npm1', 'ENSG01', 'ENST01', 'GCTTA', 11, 2, 1, 1, 0.5, 'specific')
+    assert [row[8] for row in fasta_records().rows()] == [None] * 21
+
+
+def test_contig_seq():
+    """ contigs are sliced from the packed kmers: first kmer, then the last base of the next ones """
+    records = Records({'f_id': 'seq1', 'type': 'transcript'}, 3)
+    for pos, mer in enumerate(['ACG', 'CGT', 'GTA', 'TAC'], 1):
+        records.add(KMER_GENE if pos != 3 else MASKED_GENE_GENOME, pos, 1, 1, 1, mer=mer)
+    assert records.contig_seq(1, 1) == b'ACG'
+    assert records.contig_seq(1, 4) == b'ACGTAC'
+    assert records.contig_seq(2, 3) == b'CGTA'
+
+
+def test_merge_parts(tmp_path):
+    """ rows written by the workers are gathered as a tsv.gz table, with a header """
+    part_dir = tmp_path / 'table'
+    part_dir.mkdir()
+    for name, records in (('1-gene.tsv', gene_records()), ('2-fasta.tsv', fasta_records())):
+        with open(part_dir / name, 'wb') as fh:
+            records.write(fh, 'table')
+    table.merge_parts(str(part_dir), str(tmp_path / 'output'), 'tsv')
+    with gzip.open(tmp_path / 'output' / table.FILES['tsv'], 'rt') as fh:
+        lines = fh.read().splitlines()
+    assert lines[0].split('\t') == table.COLUMNS
+    assert len(lines) == 1 + 19 + 21
+    assert lines[1] == 'npm1\tENSG01\tENST01\tACGTT\t1\t1\t2\t1\t1.0\tspecific'
+    assert lines[20] == 'seq1\t\t\tTTTAC\t1\t1\t0\t1\t\tspecific'
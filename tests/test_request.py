@@ -0,0 +1,43 @@
+# test_request.py
+
+from argparse import Namespace
+
+import pytest
+
+import request
+from conftest import SPECIE, ASSEMBLY, RELEASE, KMER_LENGTH, GENEINFO
+
+
+def request_args(datadir, genome, **kwargs):
+    args = dict(datadir=datadir, genome=[genome], specie='human', release='last', kmer_length=[KMER_LENGTH],
+                list_dataset=False, yes=False)
+    args.update(kwargs)
+    return Namespace(**args)
+
+
+def test_loaded_datasets(monkeypatch, datadir, genome):
+    """ a dataset is looked for in datadir and loaded at its first request only """
+    built = []
+    class Dataset(request.Dataset):
+        def __init__(self, args):
+            built.append(args.release)
+            super().__init__(args)
+    monkeypatch.setattr(request, 'Dataset', Dataset)
+
+    with request.LoadedDatasets() as datasets:
+        args = request_args(datadir, genome)
+        ds_args, geneinfo_dict, specific_kmers = datasets.get(args)
+        assert geneinfo_dict == GENEINFO
+        assert (args.specie, args.release, args.assembly) == (SPECIE, str(RELEASE), ASSEMBLY)
+        ### same dataset, requested again or with its resolved specie and release
+        for args in (request_args(datadir, genome), request_args(datadir, genome, specie=SPECIE, release=str(RELEASE))):
+            assert datasets.get(args)[2] is specific_kmers
+            assert (args.specie, args.release, args.assembly) == (SPECIE, str(RELEASE), ASSEMBLY)
+        assert built == ['last', str(RELEASE)]
+        assert len(datasets.datasets) == 1
+
+
+def test_dataset_not_found(datadir, genome):
+    with request.LoadedDatasets() as datasets:
+        with pytest.raises(FileNotFoundError, match=f"release 90, k{KMER_LENGTH} "):
+            datasets.get(request_args(datadir, genome, release='90'))
@@ -0,0 +1,89 @@
+# test_server.py
+
+import os
+import sys
+import stat
+import tempfile
+import threading
+
+import pytest
+
+import server
+from options import usage
+from conftest import KMER_LENGTH, RELEASE, BASELINE, records
+
+
+def parse(monkeypatch, conf, *argv):
+    monkeypatch.setattr(sys, 'argv', ['kmerator', *argv])
+    return usage(conf)
+
+
+@pytest.fixture
+def socket_path(monkeypatch, conf, datadir, genome, tmp_path):
+    """ a server with the dataset loaded, answering in a thread """
+    path = str(tmp_path / 'kmerator.sock')
+    args = parse(monkeypatch, conf, '--serve', path, '-d', datadir, '-g', genome, '-k', str(KMER_LENGTH),
+                 '-r', str(RELEASE))
+    with server.KmeratorServer(args) as kmerator_server:
+        kmerator_server.datasets.get(args)
+        thread = threading.Thread(target=kmerator_server.serve_forever)
+        thread.start()
+        yield path
+        kmerator_server.shutdown()
+        thread.join()
+        kmerator_server.datasets.close()
+
+
+def test_request(monkeypatch, conf, datadir, genome, tmp_path, socket_path):
+    """ the server writes the results in the output directory of the client """
+    for name in ('out_1', 'out_2'):
+        output = str(tmp_path / name)
+        args = parse(monkeypatch, conf, '-s', 'npm1', '--stringent', '--server', socket_path, '-d', datadir,
+                     '-g', genome, '-k', str(KMER_LENGTH), '-r', str(RELEASE), '-o', output)
+        with pytest.raises(SystemExit) as e:
+            server.send_request(args)
+        assert e.value.code == 0
+        for file in ('kmers.fa', 'contigs.fa', 'masked.fa'):
+            assert records(os.path.join(output, file)) == records(os.path.join(BASELINE, 'stringent', file))
+        with open(os.path.join(output, 'report.md')) as fh:
+            assert "- npm1: NPM1:ENST01 - kmers/contigs: 6/2 (level: gene)" in fh.read()
+
+
+def test_dataset_not_found(monkeypatch, conf, datadir, genome, tmp_path, socket_path, capsys):
+    args = parse(monkeypatch, conf, '-s', 'npm1', '--server', socket_path, '-d', datadir, '-g', genome,
+                 '-k', str(KMER_LENGTH), '-r', str(RELEASE + 1), '-o', str(tmp_path / 'out'))
+    with pytest.raises(SystemExit):
+        server.send_request(args)
+    assert f"release {RELEASE + 1}" in capsys.readouterr().out
+    assert not os.path.exists(tmp_path / 'out')
+
+
+def test_socket_mode(socket_path):
+    """ the socket is only accessible to the user of the server """
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+
+def test_outside_paths(monkeypatch, conf, datadir, genome, tmp_path, socket_path, capsys):
+    """ the server writes only in the working directory of the client or in the temporary directory """
+    client = tmp_path / 'client'
+    client.mkdir()
+    monkeypatch.chdir(client)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'tmp'))
+    (tmp_path / 'tmp').mkdir()
+    for output, written in ((tmp_path / 'elsewhere', False), (client / 'out', True)):
+        args = parse(monkeypatch, conf, '-s', 'npm1', '--server', socket_path, '-d', datadir, '-g', genome,
+                     '-k', str(KMER_LENGTH), '-r', str(RELEASE), '-o', str(output))
+        with pytest.raises(SystemExit):
+            server.send_request(args)
+        assert os.path.exists(output / 'kmers.fa') == written
+    assert "elsewhere' is not in the working directory of the client" in capsys.readouterr().out
+
+
+def test_server_option(monkeypatch, conf, datadir, genome, socket_path):
+    """ '--server' is only given on the command line, for a request """
+    conf.content['CMD_ARGS']['server'] = socket_path
+    args = parse(monkeypatch, conf, '--info', 'npm1', '-d', datadir, '-g', genome, '-k', str(KMER_LENGTH))
+    assert args.server is None
+    with pytest.raises(SystemExit, match="'--server' needs"):
+        parse(monkeypatch, conf, '--info', 'npm1', '--server', socket_path, '-d', datadir, '-g', genome,
+              '-k', str(KMER_LENGTH))
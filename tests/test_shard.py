@@ -0,0 +1,69 @@
+# test_shard.py
+
+import os
+import json
+from argparse import Namespace
+
+import pytest
+
+import shard
+from conftest import TRANSCRIPTOME
+
+
+ITEMS = ([{'given': f"G{i}", 'ENSG': f"ENSG{i // 2}", 'ENST': 'ENST01', 'type': 'gene'} for i in range(6)]
+         + [{'given': 'BRAF', 'ENSG': 'ENSG9', 'ENST': 'ENST03', 'type': 'symbol'}])
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 5])
+def test_select(count):
+    """ shards are disjoint, complete, and keep the items of a gene together """
+    selected = [shard.select(ITEMS, (i, count), TRANSCRIPTOME) for i in range(1, count + 1)]
+    positions = [ITEMS.index(item) for items, _ in selected for item in items]
+    assert sorted(positions) == list(range(len(ITEMS)))
+    for items, order in selected:
+        assert [ITEMS.index(item) for item in items] == sorted(ITEMS.index(item) for item in items)
+        assert len(order) == len(items)
+        genes = {item['ENSG'] for item in items}
+        assert all(item['ENSG'] not in genes for other, _ in selected if other is not items for item in other)
+    ### the same split on every node
+    assert selected == [shard.select(ITEMS, (i, count), TRANSCRIPTOME) for i in range(1, count + 1)]
+
+
+def test_merge(tmp_path):
+    """ results of the shards are merged in the order of a single-node run """
+    report = {'failed': ['XX: not found in transcriptome'], 'done': [], 'multiple': [], 'warning': []}
+    shard_dirs = []
+    for index in (1, 2):
+        args = Namespace(selection=[item['given'] for item in ITEMS], fasta_file=None, kmer_length=[31],
+                         specie='homo_sapiens', release='110', assembly='GRCh38', stringent=False,
+                         table=None, shard=(index, 2), output=str(tmp_path / f"shard_{index}"))
+        items, order = shard.select(ITEMS, args.shard, TRANSCRIPTOME)
+        results = [[0, *order[shard.item_key(item)], 'done', f"{item['given']}: done"] for item in items]
+        shard.write(args, report, results)
+        os.makedirs(args.output, exist_ok=True)
+        with open(os.path.join(args.output, 'kmers.fa'), 'w') as fh:
+            fh.write(f">shard{index}\nACGT\n")
+        shard_dirs.append(args.output)
+
+    ### written as json, and read back
+    with open(os.path.join(shard_dirs[0], shard.SHARD_FILE)) as fh:
+        written = json.load(fh)
+    assert written['shard'] == [1, 2] and written['report'] == report
+
+    output = str(tmp_path / 'output')
+    args = Namespace(merge_shards=shard_dirs[::-1], output=output, keep=True)
+    with pytest.raises(SystemExit):
+        shard.merge(args)
+    with open(os.path.join(output, 'kmers.fa')) as fh:
+        assert fh.read() == ">shard1\nACGT\n>shard2\nACGT\n"
+    with open(os.path.join(output, 'report.md')) as fh:
+        md = fh.read()
+    done = [line[2:] for line in md.splitlines() if line.endswith(': done')]
+    assert done == [f"{item['given']}: done" for item in ITEMS]
+
+
+def test_merge_missing(tmp_path):
+    args = Namespace(selection=['NPM1'], kmer_length=[31], shard=(1, 2), output=str(tmp_path / 'shard_1'))
+    shard.write(args, {}, [])
+    with pytest.raises(SystemExit, match='missing'):
+        shard.merge(Namespace(merge_shards=[args.output], output=str(tmp_path / 'output'), keep=True))
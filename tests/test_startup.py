@@ -0,0 +1,72 @@
+# test_startup.py
+
+"""
+kmerator must start quickly: modules requesting Ensembl (requests, bs4), building datasets
+(mk_*) and optional modules (py_kmc_api for KMC indexes, pyarrow for parquet tables, numpy for
+lookups) are imported only when they are needed, not at startup. Imports are given by
+'python -X importtime'.
+"""
+
+import os
+import sys
+import subprocess
+
+from conftest import KMERATOR_DIR, KMER_LENGTH
+
+
+LAZY_MODULES = ('requests', 'bs4', 'lxml', 'mk_geneinfo', 'mk_transcriptome', 'mk_genome', 'mk_lookup',
+                'py_kmc_api', 'pyarrow', 'numpy')
+
+### a '--selection' request parsed on the local dataset, until the items are found
+SELECTION = """
+import sys
+from config import Config
+from options import usage
+from dataset import Dataset
+from items import find_items
+import request
+args = usage(Config('kmerator'), sys.argv[1:])
+dataset = Dataset(args)
+items = find_items(args, {'failed': [], 'multiple': []}, dataset.load_geneinfo())
+assert items, 'no item found'
+"""
+
+
+def imported_modules(*args, home=None):
+    """ modules imported by a python command """
+    env = dict(os.environ, HOME=home) if home else None
+    proc = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=KMERATOR_DIR, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return {line.split('|')[-1].strip() for line in proc.stderr.splitlines()
+            if line.startswith('import time:') and 'cumulative' not in line}
+
+
+def check_modules(modules):
+    for module in LAZY_MODULES:
+        assert not any(name.split('.')[0] == module for name in modules), f"{module} imported"
+
+
+def test_version():
+    check_modules(imported_modules('kmerator.py', '--version'))
+
+
+def test_info(datadir, genome):
+    """ '--info' runs without a terminal (the text is 80 columns wide) """
+    check_modules(imported_modules('kmerator.py', '--info', 'npm1', '-d', datadir, '-g', genome,
+                                   '-k', str(KMER_LENGTH), '--tmpdir', datadir, home=datadir))
+
+
+def test_selection(datadir, genome):
+    check_modules(imported_modules('-c', SELECTION, '-s', 'npm1', 'ENST03', '-d', datadir, '-g', genome,
+                                   '-k', str(KMER_LENGTH), '--tmpdir', datadir, home=datadir))
+
+
+def test_request_modules():
+    check_modules(imported_modules('-c', 'import kmerator, request, kmerize, dataset, counter, table'))
+
+
+def test_options_modules():
+    """ modules needed by some options only are imported when the options are checked """
+    modules = imported_modules('-c', 'import options')
+    assert not {'counter', 'shard', 'journal'} & modules